@@ -34,6 +34,7 @@ Package dependencies:
     - Plotly
     - Pandas
     - Numpy
+    - Scipy
     - Tabulate
     - Cvxpy (optional)
 
@@ -57,6 +58,11 @@ from mario.tools.iomath import (
     calc_g,
     calc_X_from_w,
     calc_X_from_z,
+    calc_X_batch,
+    calc_X_region,
+    calc_X_mixed,
+    calc_X_dynamic,
+    calc_tiers,
     calc_E,
     calc_V,
     calc_e,
@@ -64,12 +70,22 @@ from mario.tools.iomath import (
     calc_z,
     calc_b,
     calc_F,
+    calc_F_by_demand,
+    calc_F_trade,
+    calc_spa,
+    calc_extraction,
+    calc_sda,
+    calc_gvc,
+    calc_households,
     calc_f,
     calc_f_dis,
+    calc_f_dis_blocks,
+    calc_f_region,
     calc_m,
     calc_M,
     calc_y,
     calc_p,
+    calc_p_batch,
 )
 
 from mario.tools.parsersclass import (
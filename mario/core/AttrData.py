@@ -24,6 +24,9 @@ from mario.tools.utilities import (
     run_from_jupyter,
     filtering,
     pymrio_styling,
+    to_dense,
+    is_sparse,
+    to_spmatrix,
 )
 
 from mario.tools.excelhandler import (
@@ -60,7 +63,21 @@ from mario.tools.iomath import (
     calc_f,
     calc_f_dis,
     calc_X_from_z,
+    calc_X_batch,
+    calc_p_batch,
+    calc_X_mixed,
+    calc_X_dynamic,
+    calc_f_dis_blocks,
+    calc_F_by_demand,
+    calc_F_trade,
+    calc_tiers,
+    calc_spa,
+    calc_extraction,
+    calc_sda,
+    calc_gvc,
+    calc_households,
     linkages_calculation,
+    _split_rows,
 )
 
 from mario.tools.sectoradd import adding_new_sector
@@ -70,8 +87,10 @@ import plotly.offline as pltly
 
 import numpy as np
 import pandas as pd
+from scipy import sparse
 import logging
 import copy
+import os
 from typing import Dict
 import plotly.express as px
 
@@ -84,9 +103,11 @@ from mario.tools.constants import (
     _ALL_MATRICES,
     _MATRICES_NAMES,
     _PYMRIO_MATRICES,
+    _SHOCK_LEVELS,
 )
 
 from mario.core.CoreIO import CoreModel
+from mario.tools.solvers import low_rank_update, BorderedSolver
 import pymrio
 
 logger = logging.getLogger(__name__)
@@ -163,6 +184,19 @@ class Database(CoreModel):
         Factor of production and the pd.DataFrame has the name of a single item in the
         rows and the unit as the value.
 
+    storage:
+        Defines how the matrices are stored. Acceptable values are 'dense' (default)
+        and 'sparse'. In 'sparse' mode, z, Z, e, E, v and V are stored as sparse
+        pd.DataFrames and the calculations on them (including the factorization
+        of the Leontief system) are performed with scipy.sparse.
+
+    precision:
+        Defines the floating point precision of the stored matrices. Acceptable
+        values are 'float64' (default) and 'float32'. The calc functions keep the
+        precision of their inputs, while the production vector sums and the
+        Leontief factorization and solves are accumulated in float64 and then cast
+        back (see CoreModel.precision).
+
 
     """
 
@@ -178,6 +212,8 @@ class Database(CoreModel):
         units: Dict = None,
         price: str = None,
         source: str = None,
+        storage: str = "dense",
+        precision: str = "float64",
         **kwargs,
     ):
         """Init function - see docstring class"""
@@ -193,6 +229,8 @@ class Database(CoreModel):
             units=units,
             price=price,
             source=source,
+            storage=storage,
+            precision=precision,
             **kwargs,
         )
 
@@ -243,6 +281,8 @@ class Database(CoreModel):
             EY=data.EY,
             units=self.units,
             table=self.meta.table,
+            storage=self.storage,
+            precision=self.precision,
         )
 
     def to_iot(
@@ -1007,300 +1047,1291 @@ class Database(CoreModel):
         if self.meta.table == "SUT":
             raise NotImplementable("Linkages can not be calculated for SUT.")
 
+        if scenario not in self.scenarios:
+            raise WrongInput(
+                f"{scenario} is not a valid scenario. Existing scenarios are {self.scenarios}"
+            )
+
+        self.calc_all(["w", "b", "z", "X"], scenario=scenario)
+
+        # matrices are read block by block without copies (w may be out-of-core).
+        # g is not inverted: its sums are derived from w and X
         _matrices = {
-            **self.get_data(
-                matrices=["w", "b", "z", "g"],
-                units=False,
-                indeces=False,
-                format="dict",
-                scenarios=[scenario],
-                auto_calc=True,
-            )[scenario]
+            key: to_dense(self.matrices[scenario][key]) for key in ["w", "b", "z", "X"]
         }
+        if "g" in self.matrices[scenario]:
+            _matrices["g"] = self.matrices[scenario]["g"]
 
         return linkages_calculation(
             cut_diag=cut_diag,
             matrices=_matrices,
             multi_mode=multi_mode,
             normalized=normalized,
+            memory=self._out_of_core["memory"],
         )
 
-    def plot_linkages(
-        self,
-        scenarios="baseline",
-        normalized=True,
-        cut_diag=True,
-        multi_mode=False,
-        path=None,
-        plot="Total",
-        auto_open=True,
-        **config,
-    ):
+    def calc_X_batch(self, by=_MASTER_INDEX["r"], Y=None, scenario="baseline"):
+        """Calculates the production vectors of a stack of final demand vectors
 
-        """Plots linkages in different modes
+        .. math::
+            X = (I - z)^{-1} [Y_1, Y_2, ..., Y_k]
 
         .. note::
 
-            when caclulating linkages, possible negative numbers, are ignore
+            All the vectors are solved at once against the Leontief solver of
+            the scenario, so the system is factorized only once.
 
         Parameters
         ----------
-        scenarios : str,List[str]
-            A scenario or a list of scenarios to plot
+        by : str, None
+            the level of final demand that splits the stack:
 
-        normalized : boolean
-            if True, plots normalized linkages
+            #. 'Region': the production activated by the final demand of every region
+            #. 'Consumption category': the production activated by every demand category
+            #. None: the production activated by every column of Y
 
-        cut_diag : boolean
-            if True, ignores the self consumption of sectors in calculating linkages
+            it is not used if Y is given.
 
-        multi_mode : boolean
-            --TODO--
+        Y : pd.DataFrame, Dict[pd.DataFrame, pd.Series], Optional
+            user defined final demand vectors. It can be a pd.DataFrame with the
+            same index of Y in which every column is a vector, or a dict of
+            final demands with the same index of Y (pd.DataFrames are summed on
+            the columns)
 
-        path : str,Optional
-            the path and the name of the plot file. (path should contain the name of the file with .htlm extension)
-            for example 'path\\linkagesPlot.html'
+        scenario : str
+            the scenario that z is taken from (and Y, if not given)
 
-        plot : str
-            Options are:
+        Returns
+        -------
+        pd.DataFrame
+            production vectors, one column per final demand vector
 
-                * 'Total' to plot the total linkages
-                * 'Direct' to plot the direct linkages
+        Example
+        -------
+        .. code-block:: python
 
-        auto_open : boolean
-            if True, opens the plot automatically
+            # production activated by the final demand of every region
+            database.calc_X_batch(by='Region')
 
+            # production activated by user defined final demands
+            database.calc_X_batch(Y={'low': Y_low, 'high': Y_high})
         """
-        if plot not in ["Total", "Direct"]:
+        if scenario not in self.scenarios:
             raise WrongInput(
-                "{} is not an acceptable value. Acceptable values are:\n{}".format(
-                    plot, ["Total", "Direct"]
-                )
+                f"{scenario} is not a valid scenario. Existing scenarios are {self.scenarios}"
             )
-        if isinstance(scenarios, str):
-            scenarios = [scenarios]
 
-        difference = set(scenarios).difference(self.scenarios)
+        if Y is None:
+            Y = self._demand_stack(scenario, by)
 
-        if difference:
-            raise WrongInput(
-                "Scenarios: {} do not exist in the database. Existing scenarios are:\n{}".format(
-                    difference, self.scenarios,
+        else:
+            if isinstance(Y, dict):
+                Y = pd.concat(
+                    {
+                        name: vector.sum(1) if isinstance(vector, pd.DataFrame) else vector
+                        for name, vector in Y.items()
+                    },
+                    axis=1,
                 )
-            )
 
-        data = {
-            scenario: self.calc_linkages(
-                scenario=scenario,
-                normalized=normalized,
-                cut_diag=cut_diag,
-                multi_mode=multi_mode,
-            )
-            for scenario in scenarios
-        }
+            if not Y.index.equals(self.matrices[scenario]["Y"].index):
+                raise WrongInput("The final demand vectors should have the same index of Y.")
 
-        plt._plot_linkages(
-            data=data,
-            path=self._getdir(path, "Plots", "linkages.html"),
-            multi_mode=multi_mode,
-            plot=plot,
-            auto_open=auto_open,
-            **config,
-        )
+        solver = self.leontief_solver(scenario)
 
-    def to_excel(
-        self,
-        path=None,
-        flows=True,
-        coefficients=False,
-        units=True,
-        scenario="baseline",
-        include_meta = False
-    ):
+        return calc_X_batch(self.matrices[scenario]["z"], Y, solver)
 
-        """Saves the database into an Excel file
+    def calc_p_batch(self, prices, matrix="e", scenario="baseline"):
+        """Calculates the price index vectors of a batch of cost-push shocks
 
-        .. note::
-            * The function will create a single Excel file with different sheets.
-            * The sheets bsed on the inputs will be:
+        .. math::
+            p_{k} = (v^{T}\cdot 1 + e^{T}\cdot \tau_{k})^{T}\cdot (I - z)^{-1}
 
-                * coefficients
-                * flows
-                * units
+        where :math:`\tau_{k}` are the prices (e.g. carbon taxes) of the
+        satellite accounts in the shock k. For matrix = 'v', the prices are
+        the relative changes of the remuneration of the factors of production.
 
-            * It is suggested to keep the units = True so the output file can be used to parse with MARIO again.
+        .. note::
+
+            All the shocks are solved at once by one transposed solve against
+            the Leontief solver of the scenario, without any new scenario.
 
         Parameters
         ----------
-        path : str
-            the path that the Excel file should be saved. If it is None, MARIO
-            will try to use the default path and inform the user with a warning.
-            (the path should contain the name of excel file like 'path\\database.xlsx')
+        prices : pd.DataFrame, pd.Series
+            the prices of the items of the matrix (on the index) for every
+            shock (on the columns). Missing items have a null price
 
-        flows : boolean
-            if True, in the Excel file, a sheet will be created named flows containing
-            the data of the flows
+        matrix : str
+            #. 'e': prices of the satellite accounts (taxes per unit of account)
+            #. 'v': relative changes of the factors of production
 
-        coefficients : boolean
-            if True, in the Excel file, a sheet will be created named coefficients containing
-            the data of the coefficients
+        scenario : str
+            the scenario of the technology and the value added
 
-        units : boolean
-            if True, in the Excel file, a sheet will be created named units containing
-            the data of the units
+        Returns
+        -------
+        pd.DataFrame
+            price index vectors of the sectors (on the index) for every shock (on the columns)
 
-        scenario : str
-            defines the scenario to print out the data
+        Example
+        -------
+        .. code-block:: python
 
-        include_meta : bool
-            saves the metadata as a json file along with the data
+            # a sweep of carbon prices
+            prices = pd.DataFrame(
+                {price: {'CO2': price} for price in [0, 50, 100, 150]}
+                )
 
+            database.calc_p_batch(prices)
         """
+        if matrix not in ["e", "v"]:
+            raise WrongInput("Acceptable matrices are ['e', 'v']")
 
         if scenario not in self.scenarios:
             raise WrongInput(
-                "{} is not a valid scenario. Existing scenarios are {}".format(
-                    scenario, [*self.matrices]
-                )
+                f"{scenario} is not a valid scenario. Existing scenarios are {self.scenarios}"
             )
 
-        
-        database_excel(
-            self,
-            flows,
-            coefficients,
-            self._getdir(path, "Database", "New_Database.xlsx"),
-            units,
-            scenario,
+        if isinstance(prices, pd.Series):
+            prices = prices.to_frame()
+
+        self.calc_all(["z", "v", matrix], scenario=scenario)
+        coefficients = self.matrices[scenario][matrix]
+
+        difference = prices.index.difference(coefficients.index)
+        if len(difference):
+            raise WrongInput(
+                f"{[*difference]} not in the index of {matrix}. "
+                f"Acceptable items are {[*coefficients.index]}"
+            )
+
+        prices = prices.reindex(coefficients.index, fill_value=0)
+        values = (
+            to_spmatrix(coefficients).T @ prices.values
+            if is_sparse(coefficients)
+            else coefficients.values.T @ prices.values
         )
-        if include_meta:
-            meta = self.meta._to_dict()
-            with open(self._getdir(path, "Database", "")+"/metadata.json","w") as fp:
-                json.dump(meta,fp)
 
-    def to_txt(
-        self,
-        path=None,
-        flows=True,
-        coefficients=False,
-        units=True,
-        scenario="baseline",
-        _format="txt",
-        include_meta = False
-    ):
+        return calc_p_batch(
+            self.matrices[scenario]["v"],
+            pd.DataFrame(values, index=coefficients.columns, columns=prices.columns),
+            solver=self.leontief_solver(scenario),
+        )
 
-        """Saves the database multiple text file based on given inputs
+    def calc_tiers(self, matrix="X", scenario="baseline", tol=1e-6, max_tiers=100):
+        """Decomposes production or its extensions in production layers (supply chain tiers)
+
+        .. math::
+            X = Y + z\cdot Y + z^{2}\cdot Y + ...
+
+        .. math::
+            E = e\cdot Y + e\cdot z\cdot Y + e\cdot z^{2}\cdot Y + ...
 
         .. note::
-            * The function will create multiple text files carring on the name of the matrices based on the given inputs.
-            * It is suggested to keep the units = True so the output file can be used to parse with MARIO again.
+
+            Tiers are calculated by repeated products by z, without solving the
+            Leontief system, and stop when the contribution of the last tier is
+            below tol. The remainder of the next tiers is extrapolated from the
+            decay of the last ones, so summing all the columns gives a quick
+            preview of the results of the full solve.
 
         Parameters
         ----------
-        path : str
-            the path that the Excel file should be saved. If it is None, MARIO
-            will try to use the default path and inform the user with a warning.
+        matrix : str
+            'X' for production, 'E' for satellite accounts or 'V' for factors
+            of production
 
-        flows : boolean
-            if True, in the Excel file, a sheet will be created named flows containing
-            the data of the flows
+        scenario : str
+            the scenario to decompose
 
-        coefficients : boolean
-            if True, in the Excel file, a sheet will be created named coefficients containing
-            the data of the coefficients
+        tol : float
+            relative contribution of a tier at which the decomposition stops
 
-        units : boolean
-            if True, in the Excel file, a sheet will be created named units containing
-            the data of the units
+        max_tiers : int
+            maximum number of tiers after the final demand
 
-        scenario : str
-            defines the scenario to print out the data
+        Returns
+        -------
+        pd.DataFrame
+            one column per tier (0 being the final producers) and the remainder
 
-        _format : str
-            * txt to save as txt files
-            * csv to save as csv files
+        Example
+        -------
+        .. code-block:: python
 
-        include_meta : bool
-            saves the metadata as a json file along with the data
+            tiers = database.calc_tiers('E')
+
+            # emissions in the tier 3 and upstream
+            tiers.loc['CO2', 3:].sum()
         """
+        if matrix not in ["X", "E", "V"]:
+            raise WrongInput("Acceptable matrices are ['X', 'E', 'V']")
+
         if scenario not in self.scenarios:
             raise WrongInput(
-                "{} is not a valid scenario. Existing scenarios are {}".format(
-                    scenario, [*self.matrices]
-                )
+                f"{scenario} is not a valid scenario. Existing scenarios are {self.scenarios}"
             )
 
-        database_txt(
-            self,
-            flows,
-            coefficients,
-            self._getdir(path, "Database", ""),
-            units,
-            scenario,
-            _format,
+        self.calc_all(["z"] if matrix == "X" else ["z", matrix.lower()], scenario=scenario)
+
+        tiers = calc_tiers(
+            self.matrices[scenario]["z"],
+            self.matrices[scenario]["Y"],
+            tol=tol,
+            max_tiers=max_tiers,
         )
 
-        if include_meta:
-            meta = self.meta._to_dict()
-            with open(self._getdir(path, "Database", "")+"/metadata.json","w") as fp:
-                json.dump(meta,fp)
+        if matrix == "X":
+            return tiers
 
-    def to_pymrio(
+        coefficients = to_dense(self.matrices[scenario][matrix.lower()])
+
+        return pd.DataFrame(
+            coefficients.values @ tiers.values,
+            index=coefficients.index,
+            columns=tiers.columns,
+        )
+
+    def calc_spa(
         self,
-        satellite_account="satellite_account",
-        factor_of_production="factor_of_production",
-        include_meta=True,
+        item,
+        region,
+        sector,
+        matrix="e",
+        level=None,
+        demand=1.0,
+        threshold=1e-3,
+        depth=8,
+        max_paths=100,
         scenario="baseline",
-        **kwargs,
     ):
+        """Structural path analysis: ranks the supply chain paths behind the footprint of a sector
 
-        """Returns a pymrio.IOSystem from a mario.Database
+        The paths start from the final demand of a sector in a region and
+        go upstream through z, each one valued by the satellite account (or
+        factor of production) directly activated in its last sector.
+
+        .. note::
+
+            Paths are searched best-first with a priority queue on the
+            footprint of their upstream subtree (f) and the branches that
+            can not exceed threshold times the total footprint are pruned,
+            so only a small part of the paths is visited. The multipliers
+            are solved with the Leontief solver of the scenario.
 
         Parameters
-        -----------
-        satellite_acount : str
-            Defines the name of the pymrio.Extension built from mario satellite account
+        ----------
+        item : str
+            the satellite account (matrix = 'e') or the factor of production
+            (matrix = 'v') to be analysed
 
-        factor_of_production : str
-            Defines the name of the pymrio.Extension built from mario factor of production
+        region : str
+            the region of the final demand
 
-        include_meta : str
-            If True, will record mario.meta into pymrio.meta
+        sector : str
+            the sector (commodity for SUT) of the final demand
 
-        scenario : str
-            The specific scenario to create the pymrio.IOSystem from
+        matrix : str
+            'e' for satellite accounts or 'v' for factors of production
 
-        **kwargs : (pymrio.IOSystem **kwargs)
+        level : str, Optional
+            the level of the sector ('Sector' for IOT and 'Commodity' for SUT by default)
+
+        demand : float
+            the final demand of the sector (a unit by default, giving the paths of f)
+
+        threshold : float
+            share of the total footprint below which the paths are pruned
 
+        depth : int
+            maximum number of upstream stages of the paths
+
+        max_paths : int
+            maximum number of paths returned
+
+        scenario : str
+            the scenario to be analysed
 
         Returns
         -------
-        pymrio.IOSystem
+        pd.DataFrame
+            the paths ranked by value, with their share of the total
+            footprint, their depth and the labels of their stages (0 being
+            the sector of the final demand)
 
-        Raises
-        ------
-        NotImplementable
-            if table_type is SUT
+        Example
+        -------
+        .. code-block:: python
 
-        WrongInput
-            incorrect naming for factor_of_production and satellite_acount
+            # the 20 most important paths of the CO2 footprint of Italian Construction
+            database.calc_spa('CO2', 'Italy', 'Construction', max_paths=20)
         """
+        if matrix not in ["e", "v"]:
+            raise WrongInput("Acceptable matrices are ['e', 'v']")
 
-        if self.table_type != "IOT":
-            raise NotImplementable("pymrio supports only IO tables.")
-
-        if any([" " in i for i in [satellite_account, factor_of_production]]):
+        if scenario not in self.scenarios:
             raise WrongInput(
-                "satellte_account and factor_of_production does not accept values containing space."
+                f"{scenario} is not a valid scenario. Existing scenarios are {self.scenarios}"
             )
 
-        matrices = self.get_data(
-            matrices=["V", "Z", "Y", "E", "EY"], scenarios=[scenario], auto_calc=True,
-        )[scenario]
+        if level is None:
+            level = _MASTER_INDEX["c"] if self.table_type == "SUT" else _MASTER_INDEX["s"]
 
-        factor_input = pymrio.Extension(
-            name=factor_of_production,
-            F=pymrio_styling(df=matrices.V, **_PYMRIO_MATRICES["V"]),
+        self.calc_all(["z", matrix], scenario=scenario)
+        coefficients = self.matrices[scenario][matrix]
+
+        if item not in coefficients.index:
+            raise WrongInput(
+                f"{item} not in {matrix}. Acceptable items are {[*coefficients.index]}"
+            )
+
+        z = self.matrices[scenario]["z"]
+        if (region, level, sector) not in z.columns:
+            raise WrongInput(f"{(region, level, sector)} not in the database.")
+
+        return calc_spa(
+            z,
+            to_dense(coefficients.loc[[item]]).iloc[0],
+            (region, level, sector),
+            demand=demand,
+            solver=self.leontief_solver(scenario),
+            threshold=threshold,
+            depth=depth,
+            max_paths=max_paths,
+        )
+
+    def calc_extraction(self, by=None, scenario="baseline"):
+        """Ranks the key sectors by the hypothetical extraction method
+
+        Every sector (or group of sectors) is extracted removing its rows and
+        columns of z and its final demand, and the loss of total output with
+        respect to the scenario is calculated.
+
+        .. note::
+
+            All the extractions are solved against the Leontief solver of the
+            scenario, needing only the columns of w of the extracted sectors,
+            in blocks within the memory budget set by set_out_of_core. No
+            extracted system is factorized.
+
+        Parameters
+        ----------
+        by : str, Optional
+            #. None: every sector (activity and commodity for SUT) of every region
+            #. 'Region': every region
+            #. 'Sector' (or 'Activity', 'Commodity' for SUT): every item in all the regions
+
+        scenario : str
+            the scenario to be analysed
+
+        Returns
+        -------
+        pd.DataFrame
+            the output loss and its share of the total output for every extraction
+
+        Example
+        -------
+        .. code-block:: python
+
+            database.calc_extraction().sort_values('Output loss', ascending=False)
+        """
+        if scenario not in self.scenarios:
+            raise WrongInput(
+                f"{scenario} is not a valid scenario. Existing scenarios are {self.scenarios}"
+            )
+
+        self.calc_all(["z"], scenario=scenario)
+        index = self.matrices[scenario]["z"].index
+
+        if by is None:
+            groups = {label: [label] for label in index}
+
+        elif by == _MASTER_INDEX["r"]:
+            groups = {
+                region: index[index.get_level_values(0) == region]
+                for region in self.get_index(by)
+            }
+
+        elif by in [*_LEVELS[self.table_type]] and by in index.get_level_values(1):
+            groups = {
+                item: index[
+                    (index.get_level_values(1) == by) & (index.get_level_values(2) == item)
+                ]
+                for item in self.get_index(by)
+            }
+
+        else:
+            levels = [_MASTER_INDEX["r"]] + [*index.get_level_values(1).unique()]
+            raise WrongInput(f"Acceptable values for by are None or {levels}")
+
+        loss = calc_extraction(
+            self.matrices[scenario]["z"],
+            self.matrices[scenario]["Y"],
+            groups,
+            solver=self.leontief_solver(scenario),
+            memory=self._out_of_core["memory"],
+        )
+        loss.index.names = index.names if by is None else [by]
+
+        return loss
+
+    def calc_sda(
+        self,
+        scenario,
+        base_scenario="baseline",
+        database=None,
+        matrix="X",
+        method="shapley",
+    ):
+        """Structural decomposition analysis of the change of production or extensions between two scenarios
+
+        .. math::
+            X = L\cdot B\cdot d\cdot l \qquad E = e\cdot L\cdot B\cdot d\cdot l
+
+        The change is split in the effects of intensity (e or v), technology
+        (the Leontief inverse L), product mix of every column of final demand
+        (B), demand mix among the columns of final demand (d) and level of
+        total final demand (l).
+
+        .. note::
+
+            * The two tables are solved with their cached Leontief solvers
+              and all the combinations of the factors are calculated in
+              batches, so also the 'shapley' method (average over all the
+              orderings of the factors) does not grow factorially.
+            * The extension flows are the ones of the final demand of the
+              sectors (E), not including the direct ones of final demand (EY).
+
+        Parameters
+        ----------
+        scenario : str
+            the scenario of the new table
+
+        base_scenario : str
+            the scenario of the old table (in this database)
+
+        database : mario.Database, Optional
+            if given, the new table is the scenario of this database (e.g.
+            another year), which should have the same sets (see ``==``)
+
+        matrix : str
+            'X' for production, 'E' for satellite accounts or 'V' for factors of production
+
+        method : str
+            #. 'shapley': average over all the orderings of the factors
+            #. 'polar': average of the two polar decompositions
+
+        Returns
+        -------
+        pd.DataFrame
+            the effects of the factors (on the columns) for every sector
+            (for X) or item of the extensions (for E and V)
+
+        Example
+        -------
+        .. code-block:: python
+
+            # drivers of the CO2 emissions between two years
+            db_2015.calc_sda('baseline', database=db_2020, matrix='E').loc['CO2']
+        """
+        if matrix not in ["X", "E", "V"]:
+            raise WrongInput("Acceptable matrices are ['X', 'E', 'V']")
+
+        new = self if database is None else database
+
+        if not self == new:
+            raise WrongInput("The two databases should have the same sets.")
+
+        for db, name in zip([self, new], [base_scenario, scenario]):
+            if name not in db.scenarios:
+                raise WrongInput(
+                    f"{name} is not a valid scenario. Existing scenarios are {db.scenarios}"
+                )
+
+        coefficients = [] if matrix == "X" else [matrix.lower()]
+        self.calc_all(["z"] + coefficients, scenario=base_scenario)
+        new.calc_all(["z"] + coefficients, scenario=scenario)
+
+        old_matrices = self.matrices[base_scenario]
+        new_matrices = new.matrices[scenario]
+
+        # the new table on the labels of the old one
+        z = old_matrices["z"]
+        z_new = new_matrices["z"]
+        aligned = z_new.index.equals(z.index) and z_new.columns.equals(z.columns)
+
+        def align(data, reference):
+            if aligned:
+                return data
+            return data.reindex(index=reference.index, columns=reference.columns)
+
+        extensions = {}
+        if matrix != "X":
+            extensions = dict(
+                e=to_dense(old_matrices[matrix.lower()]),
+                e_new=align(
+                    to_dense(new_matrices[matrix.lower()]),
+                    to_dense(old_matrices[matrix.lower()]),
+                ),
+            )
+
+        return calc_sda(
+            z,
+            old_matrices["Y"],
+            align(z_new, z),
+            align(new_matrices["Y"], old_matrices["Y"]),
+            solver=self.leontief_solver(base_scenario),
+            solver_new=new.leontief_solver(scenario) if aligned else None,
+            method=method,
+            **extensions,
+        )
+
+    def calc_gvc(self, scenario="baseline"):
+        """Decomposes the gross exports of every region to every other region by the origin of their value added
+
+        The gross exports (intermediate and final) of every sector to every
+        importer are split into the domestic value added (DVA), the domestic
+        value added that returns embodied in the imported intermediates and is
+        counted twice (DDC) and the foreign value added (FVA).
+
+        .. note::
+
+            The global Leontief solver of the scenario is reused for all the
+            region pairs at once. If the solver is the 'region' one (see
+            set_leontief_solver), its factorized region blocks are reused as
+            the local inverses of the exporters.
+
+        Parameters
+        ----------
+        scenario : str
+            the scenario to be analysed
+
+        Returns
+        -------
+        pd.DataFrame
+            Gross exports, DVA, DDC and FVA for every exporting sector and importer
+
+        Raises
+        ------
+        NotImplementable
+            if the database is a SUT or a single region table
+
+        Example
+        -------
+        .. code-block:: python
+
+            gvc = database.calc_gvc()
+            gvc.groupby(level=["Region", "Importer"]).sum()
+        """
+        if self.table_type != "IOT":
+            raise NotImplementable("The decomposition of exports is valid only for IOT.")
+
+        if not self.is_multi_region:
+            raise NotImplementable(
+                "The decomposition of exports is valid only for multi-regional data."
+            )
+
+        if scenario not in self.scenarios:
+            raise WrongInput(
+                f"{scenario} is not a valid scenario. Existing scenarios are {self.scenarios}"
+            )
+
+        self.calc_all(["z", "v", "X"], scenario=scenario)
+
+        return calc_gvc(
+            self.matrices[scenario]["z"],
+            self.matrices[scenario]["Y"],
+            self.matrices[scenario]["X"],
+            self.matrices[scenario]["v"],
+            solver=self.leontief_solver(scenario),
+        )
+
+    def calc_multipliers(self, categories, factors, matrix="X", scenario="baseline"):
+        """Calculates the Type I and Type II multipliers, closing the model with respect to the households
+
+        The households of every region are moved into the technology matrix:
+        they earn the given factors of production of the sectors of their
+        region and spend their income as the given consumption categories of
+        their final demand.
+
+        .. math::
+            \bar{z} = \begin{bmatrix} z & C \\ R & 0 \end{bmatrix}
+
+        .. note::
+
+            The closed system is solved through the Schur complement of the
+            households on the cached Leontief solver of the scenario, so its
+            (n + k) matrix is never factorized (k being the number of regions).
+            The closed model is meaningful only if the households spend less
+            than they earn from the given factors.
+
+        Parameters
+        ----------
+        categories : str, list
+            the consumption categories spent by the households
+
+        factors : str, list
+            the factors of production earned by the households
+
+        matrix : str
+            #. 'X': output multipliers
+            #. 'E': satellite account multipliers (f)
+            #. 'V': factor of production multipliers (m)
+
+        scenario : str
+            the scenario to calculate the multipliers for
+
+        Returns
+        -------
+        pd.DataFrame
+            the Type I and Type II multipliers on the index and the sectors
+            (activities and commodities for SUT) on the columns
+
+        Example
+        -------
+        .. code-block:: python
+
+            multipliers = database.calc_multipliers(
+                categories = 'Final consumption expenditure by households',
+                factors = ['Compensation of employees'],
+                matrix = 'E',
+                )
+
+            # induced effects
+            multipliers.loc['Type II'] - multipliers.loc['Type I']
+        """
+        if matrix not in ["X", "E", "V"]:
+            raise WrongInput("Acceptable matrices are ['X', 'E', 'V']")
+
+        if scenario not in self.scenarios:
+            raise WrongInput(
+                f"{scenario} is not a valid scenario. Existing scenarios are {self.scenarios}"
+            )
+
+        categories = [categories] if isinstance(categories, str) else categories
+        factors = [factors] if isinstance(factors, str) else factors
+
+        for items, level in zip([categories, factors], ["n", "f"]):
+            difference = set(items).difference(self.get_index(_MASTER_INDEX[level]))
+            if difference:
+                raise WrongInput(
+                    f"{difference} not a valid {_MASTER_INDEX[level]}. "
+                    f"Acceptable items are {self.get_index(_MASTER_INDEX[level])}"
+                )
+
+        self.calc_all(["z", "V", "X"], scenario=scenario)
+
+        solver = self.leontief_solver(scenario)
+        C, R = calc_households(
+            to_dense(self.matrices[scenario]["Y"]),
+            to_dense(self.matrices[scenario]["V"]),
+            self.matrices[scenario]["X"],
+            categories,
+            factors,
+        )
+        closed = BorderedSolver(solver, C, R)
+
+        z = self.matrices[scenario]["z"]
+        if matrix == "X":
+            coefficients = pd.DataFrame(1.0, index=["Production"], columns=z.columns)
+        else:
+            self.calc_all([matrix.lower()], scenario=scenario)
+            coefficients = to_dense(self.matrices[scenario][matrix.lower()])
+
+        multipliers = {
+            "Type I": calc_f(coefficients, solver=solver),
+            "Type II": calc_f(
+                coefficients.reindex(columns=closed.columns, fill_value=0),
+                solver=closed,
+            ).loc[:, z.columns],
+        }
+
+        return pd.concat(multipliers, names=["Multiplier"])
+
+    def _demand_stack(self, scenario, by):
+        """final demand of a scenario split by region, consumption category or column of Y"""
+        Y = self.matrices[scenario]["Y"]
+
+        if by == _MASTER_INDEX["r"]:
+            return Y.T.groupby(level=0, sort=False).sum().T
+
+        if by == _MASTER_INDEX["n"]:
+            return Y.T.groupby(level=-1, sort=False).sum().T
+
+        if by is not None:
+            raise WrongInput(
+                f"by can be {_MASTER_INDEX['r']}, {_MASTER_INDEX['n']} or None."
+            )
+
+        return Y
+
+    def calc_F_by_demand(self, matrix="f", origin=None, by=None, scenario="baseline"):
+        """Calculates the footprint flows split by consuming region and final
+        demand category (consumption-based accounts)
+
+        .. math::
+            F_{k,g,c} = \sum_{i \in g} f_{k,i}\cdot Y_{i,c}
+
+        .. note::
+
+            The split is calculated with one product against the final demand
+            matrix, aggregating the origins (and the consumers) while computing.
+
+        Parameters
+        ----------
+        matrix : str
+            'f' for the footprints of satellite accounts or 'm' for the
+            multipliers of factors of production
+
+        origin : str, list, Optional
+            the level(s) by which the origin of the footprints is kept:
+            'Region', 'Item' or both. If None, the origins are summed
+
+        by : str, Optional
+            the level by which the consumers are kept. 'Region' or
+            'Consumption category'. If None, every column of Y (consuming
+            region and category) is kept
+
+        scenario : str
+            the scenario to calculate the flows for
+
+        Returns
+        -------
+        pd.DataFrame
+            footprint flows with the footprints (and their origins) on the index
+            and the consumers on the columns
+
+        Example
+        -------
+        .. code-block:: python
+
+            # CO2 emissions embodied in the final demand of every region and category
+            database.calc_F_by_demand().loc['CO2']
+
+            # and by producing region
+            database.calc_F_by_demand(origin='Region', by='Region')
+        """
+        if matrix not in ["f", "m"]:
+            raise WrongInput("Acceptable matrices are ['f', 'm']")
+
+        if scenario not in self.scenarios:
+            raise WrongInput(
+                f"{scenario} is not a valid scenario. Existing scenarios are {self.scenarios}"
+            )
+
+        self.calc_all([matrix], scenario=scenario)
+
+        flows = calc_F_by_demand(
+            to_dense(self.matrices[scenario][matrix]),
+            self._demand_stack(scenario, by),
+            origin,
+        )
+        flows.index = flows.index.set_names(
+            [_MASTER_INDEX["k"] if matrix == "f" else _MASTER_INDEX["f"]]
+            + flows.index.names[1:]
+        )
+
+        return flows
+
+    def calc_F_trade(self, items=None, by=None, scenario="baseline"):
+        """Calculates the satellite account flows embodied in the trade between every pair of regions
+
+        .. math::
+            F_{k,s,r} = \sum_{i \in s} e_{k,i}\cdot (w\cdot Y_{:,r})_{i}
+
+        Every flow is emitted in the producing region s (rows) to satisfy the
+        final demand of the consuming region r (columns), through intermediate
+        and final trade. The rows sum up to the production-based accounts (E)
+        and the columns to the consumption-based footprints (:math:`f\cdot Y`).
+        The flows of the final demand (EY) are not included.
+
+        .. note::
+
+            The final demand of every region is solved against the Leontief
+            solver of the scenario with one multi right hand side solve, so f
+            and w are not needed.
+
+        Parameters
+        ----------
+        items : list, Optional
+            the satellite accounts to be calculated. If None, all of them
+
+        by : str, Optional
+            if 'Sector' (or 'Activity', 'Commodity' for SUT), the flows are kept
+            by producing sector of the level instead of by producing region
+
+        scenario : str
+            the scenario to calculate the flows for
+
+        Returns
+        -------
+        pd.DataFrame
+            the embodied flows with the satellite accounts and the producers
+            on the index and the consuming regions on the columns
+
+        Example
+        -------
+        .. code-block:: python
+
+            # CO2 emitted in every region for the final demand of every region
+            database.calc_F_trade(['CO2']).loc['CO2']
+        """
+        if scenario not in self.scenarios:
+            raise WrongInput(
+                f"{scenario} is not a valid scenario. Existing scenarios are {self.scenarios}"
+            )
+
+        if by is not None and by not in _SHOCK_LEVELS[self.table_type]:
+            raise WrongInput(
+                f"by can be {_SHOCK_LEVELS[self.table_type]} or None."
+            )
+
+        accounts = self.get_index(_MASTER_INDEX["k"])
+        items = accounts if items is None else items
+        difference = set(items).difference(accounts)
+        if difference:
+            raise WrongInput(f"{difference} not in {_MASTER_INDEX['k']}s: {accounts}")
+
+        self.calc_all(["z", "e"], scenario=scenario)
+
+        flows = calc_F_trade(
+            to_dense(self.matrices[scenario]["e"]).loc[items],
+            self.matrices[scenario]["z"],
+            self.matrices[scenario]["Y"],
+            solver=self.leontief_solver(scenario),
+            sectors=by is not None,
+        )
+        flows.index = flows.index.set_names(_MASTER_INDEX["k"], level=0)
+
+        if by is not None:
+            flows = flows.xs(by, level=2, drop_level=True)
+            flows.index = flows.index.set_names(by, level=-1)
+
+        return flows
+
+    def calc_f_dis(
+        self,
+        matrix="e",
+        items=None,
+        scenario="baseline",
+        memory=None,
+        top=None,
+        threshold=None,
+        path=None,
+    ):
+        """Calculates the footprints disaggregated by origin sector and region
+        for many satellite accounts (or factors of production)
+
+        .. math::
+            f_dis^{k} = \hat{e_k} \cdot w
+
+        .. note::
+
+            * w is never built: its columns are solved by blocks against the
+              Leontief solver of the scenario and are shared by all the items.
+            * The memory of the blocks is bounded by the memory budget (by
+              default the one set by set_out_of_core).
+
+        Parameters
+        ----------
+        matrix : str
+            'e' for satellite accounts or 'v' for factors of production
+
+        items : list, Optional
+            the satellite accounts (or factors of production) to disaggregate.
+            If None, all the items are disaggregated
+
+        scenario : str
+            the scenario to calculate f_dis for
+
+        memory : float, Optional
+            the memory budget (MB) for the blocks of consuming sectors
+
+        top : int, Optional
+            if given (at least 1), for every consuming sector only the top
+            origins are kept
+
+        threshold : float, Optional
+            if given (between 0 and 1), only the origins contributing at least
+            this share of the footprint of the consuming sector are kept
+
+        path : str, Optional
+            if given, f_dis of every item is written in a file in the path: a
+            numpy.memmap (.dat) with the shape of z, or a scipy.sparse matrix
+            (.npz) if top or threshold are given
+
+        Returns
+        -------
+        generator
+            if path is None, yields the item and the pd.DataFrame of its f_dis for
+            a block of consuming sectors (origins on the index)
+
+        dict
+            if path is given, the file of every item
+
+        Example
+        -------
+        .. code-block:: python
+
+            # hotspots: the 10 main origins of the footprint of every sector
+            for account, block in database.calc_f_dis(top=10):
+                ...
+        """
+        if matrix not in ["e", "v"]:
+            raise WrongInput("Acceptable matrices are ['e', 'v']")
+
+        if top is not None and top < 1:
+            raise WrongInput("top should be at least 1.")
+
+        if threshold is not None and not 0 <= threshold <= 1:
+            raise WrongInput("threshold should be a share between 0 and 1.")
+
+        if scenario not in self.scenarios:
+            raise WrongInput(
+                f"{scenario} is not a valid scenario. Existing scenarios are {self.scenarios}"
+            )
+
+        self.calc_all([matrix], scenario=scenario)
+        data = to_dense(self.matrices[scenario][matrix])
+
+        if items is not None:
+            difference = set(items).difference(data.index)
+            if difference:
+                raise WrongInput(f"{difference} not in the index of {matrix}.")
+            data = data.loc[items]
+
+        blocks = calc_f_dis_blocks(
+            e=data,
+            solver=self.leontief_solver(scenario),
+            memory=self._out_of_core["memory"] if memory is None else memory,
+            top=top,
+            threshold=threshold,
+        )
+
+        if path is None:
+            return blocks
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        n = data.shape[1]
+        pruned = top is not None or threshold is not None
+        extension = "npz" if pruned else "dat"
+        files = {
+            item: f"{path}/f_dis_{scenario}_{number}.{extension}".replace(" ", "_")
+            for number, item in enumerate(data.index)
+        }
+
+        if pruned:
+            results = {item: [] for item in data.index}
+        else:
+            results = {
+                item: np.memmap(files[item], dtype=self.precision, mode="w+", shape=(n, n))
+                for item in data.index
+            }
+
+        for item, block in blocks:
+            start = data.columns.get_loc(block.columns[0])
+
+            if pruned:
+                values = block.sparse.to_coo()
+                results[item].append((values.row, values.col + start, values.data))
+            else:
+                results[item][:, start : start + block.shape[1]] = block.values
+
+        for item, result in results.items():
+            if pruned:
+                rows, columns, values = (np.concatenate(part) for part in zip(*result))
+                sparse.save_npz(
+                    files[item],
+                    sparse.csc_matrix((values, (rows, columns)), shape=(n, n)),
+                )
+            else:
+                result.flush()
+
+        self.meta._add_history(
+            f"f_dis: f_dis of {matrix} for {scenario} saved in {path}"
+        )
+
+        return files
+
+    def plot_linkages(
+        self,
+        scenarios="baseline",
+        normalized=True,
+        cut_diag=True,
+        multi_mode=False,
+        path=None,
+        plot="Total",
+        auto_open=True,
+        **config,
+    ):
+
+        """Plots linkages in different modes
+
+        .. note::
+
+            when caclulating linkages, possible negative numbers, are ignore
+
+        Parameters
+        ----------
+        scenarios : str,List[str]
+            A scenario or a list of scenarios to plot
+
+        normalized : boolean
+            if True, plots normalized linkages
+
+        cut_diag : boolean
+            if True, ignores the self consumption of sectors in calculating linkages
+
+        multi_mode : boolean
+            --TODO--
+
+        path : str,Optional
+            the path and the name of the plot file. (path should contain the name of the file with .htlm extension)
+            for example 'path\\linkagesPlot.html'
+
+        plot : str
+            Options are:
+
+                * 'Total' to plot the total linkages
+                * 'Direct' to plot the direct linkages
+
+        auto_open : boolean
+            if True, opens the plot automatically
+
+        """
+        if plot not in ["Total", "Direct"]:
+            raise WrongInput(
+                "{} is not an acceptable value. Acceptable values are:\n{}".format(
+                    plot, ["Total", "Direct"]
+                )
+            )
+        if isinstance(scenarios, str):
+            scenarios = [scenarios]
+
+        difference = set(scenarios).difference(self.scenarios)
+
+        if difference:
+            raise WrongInput(
+                "Scenarios: {} do not exist in the database. Existing scenarios are:\n{}".format(
+                    difference, self.scenarios,
+                )
+            )
+
+        data = {
+            scenario: self.calc_linkages(
+                scenario=scenario,
+                normalized=normalized,
+                cut_diag=cut_diag,
+                multi_mode=multi_mode,
+            )
+            for scenario in scenarios
+        }
+
+        plt._plot_linkages(
+            data=data,
+            path=self._getdir(path, "Plots", "linkages.html"),
+            multi_mode=multi_mode,
+            plot=plot,
+            auto_open=auto_open,
+            **config,
+        )
+
+    def to_excel(
+        self,
+        path=None,
+        flows=True,
+        coefficients=False,
+        units=True,
+        scenario="baseline",
+        include_meta = False
+    ):
+
+        """Saves the database into an Excel file
+
+        .. note::
+            * The function will create a single Excel file with different sheets.
+            * The sheets bsed on the inputs will be:
+
+                * coefficients
+                * flows
+                * units
+
+            * It is suggested to keep the units = True so the output file can be used to parse with MARIO again.
+
+        Parameters
+        ----------
+        path : str
+            the path that the Excel file should be saved. If it is None, MARIO
+            will try to use the default path and inform the user with a warning.
+            (the path should contain the name of excel file like 'path\\database.xlsx')
+
+        flows : boolean
+            if True, in the Excel file, a sheet will be created named flows containing
+            the data of the flows
+
+        coefficients : boolean
+            if True, in the Excel file, a sheet will be created named coefficients containing
+            the data of the coefficients
+
+        units : boolean
+            if True, in the Excel file, a sheet will be created named units containing
+            the data of the units
+
+        scenario : str
+            defines the scenario to print out the data
+
+        include_meta : bool
+            saves the metadata as a json file along with the data
+
+        """
+
+        if scenario not in self.scenarios:
+            raise WrongInput(
+                "{} is not a valid scenario. Existing scenarios are {}".format(
+                    scenario, [*self.matrices]
+                )
+            )
+
+        
+        database_excel(
+            self,
+            flows,
+            coefficients,
+            self._getdir(path, "Database", "New_Database.xlsx"),
+            units,
+            scenario,
+        )
+        if include_meta:
+            meta = self.meta._to_dict()
+            with open(self._getdir(path, "Database", "")+"/metadata.json","w") as fp:
+                json.dump(meta,fp)
+
+    def to_txt(
+        self,
+        path=None,
+        flows=True,
+        coefficients=False,
+        units=True,
+        scenario="baseline",
+        _format="txt",
+        include_meta = False
+    ):
+
+        """Saves the database multiple text file based on given inputs
+
+        .. note::
+            * The function will create multiple text files carring on the name of the matrices based on the given inputs.
+            * It is suggested to keep the units = True so the output file can be used to parse with MARIO again.
+
+        Parameters
+        ----------
+        path : str
+            the path that the Excel file should be saved. If it is None, MARIO
+            will try to use the default path and inform the user with a warning.
+
+        flows : boolean
+            if True, in the Excel file, a sheet will be created named flows containing
+            the data of the flows
+
+        coefficients : boolean
+            if True, in the Excel file, a sheet will be created named coefficients containing
+            the data of the coefficients
+
+        units : boolean
+            if True, in the Excel file, a sheet will be created named units containing
+            the data of the units
+
+        scenario : str
+            defines the scenario to print out the data
+
+        _format : str
+            * txt to save as txt files
+            * csv to save as csv files
+
+        include_meta : bool
+            saves the metadata as a json file along with the data
+        """
+        if scenario not in self.scenarios:
+            raise WrongInput(
+                "{} is not a valid scenario. Existing scenarios are {}".format(
+                    scenario, [*self.matrices]
+                )
+            )
+
+        database_txt(
+            self,
+            flows,
+            coefficients,
+            self._getdir(path, "Database", ""),
+            units,
+            scenario,
+            _format,
+        )
+
+        if include_meta:
+            meta = self.meta._to_dict()
+            with open(self._getdir(path, "Database", "")+"/metadata.json","w") as fp:
+                json.dump(meta,fp)
+
+    def to_pymrio(
+        self,
+        satellite_account="satellite_account",
+        factor_of_production="factor_of_production",
+        include_meta=True,
+        scenario="baseline",
+        **kwargs,
+    ):
+
+        """Returns a pymrio.IOSystem from a mario.Database
+
+        Parameters
+        -----------
+        satellite_acount : str
+            Defines the name of the pymrio.Extension built from mario satellite account
+
+        factor_of_production : str
+            Defines the name of the pymrio.Extension built from mario factor of production
+
+        include_meta : str
+            If True, will record mario.meta into pymrio.meta
+
+        scenario : str
+            The specific scenario to create the pymrio.IOSystem from
+
+        **kwargs : (pymrio.IOSystem **kwargs)
+
+
+        Returns
+        -------
+        pymrio.IOSystem
+
+        Raises
+        ------
+        NotImplementable
+            if table_type is SUT
+
+        WrongInput
+            incorrect naming for factor_of_production and satellite_acount
+        """
+
+        if self.table_type != "IOT":
+            raise NotImplementable("pymrio supports only IO tables.")
+
+        if any([" " in i for i in [satellite_account, factor_of_production]]):
+            raise WrongInput(
+                "satellte_account and factor_of_production does not accept values containing space."
+            )
+
+        matrices = self.get_data(
+            matrices=["V", "Z", "Y", "E", "EY"], scenarios=[scenario], auto_calc=True,
+        )[scenario]
+
+        factor_input = pymrio.Extension(
+            name=factor_of_production,
+            F=pymrio_styling(df=matrices.V, **_PYMRIO_MATRICES["V"]),
             unit=self.units[_MASTER_INDEX["f"]],
         )
 
@@ -1745,6 +2776,7 @@ class Database(CoreModel):
         notes=[],
         scenario=None,
         force_rewrite=False,
+        max_rank=20,
         **clusters,
     ):
 
@@ -1755,6 +2787,10 @@ class Database(CoreModel):
 
             * Shocks can be implemented only with respect to the baseline
             * Shocks will be implemented only on coefficients
+            * If the shock on z changes at most max_rank columns (or rows),
+              the Leontief solver of the baseline is updated through the
+              Sherman-Morrison-Woodbury formula instead of factorizing the
+              new system. The updated solver is cached for the new scenario.
 
         Parameters
         ----------
@@ -1782,6 +2818,11 @@ class Database(CoreModel):
         fore_rewrite : boolean
             if False will avoid overwriting existing scenario
 
+        max_rank : int
+            the maximum number of columns (or rows) of z changed by the shock
+            for updating the baseline solver instead of factorizing the new
+            system (0 always factorizes it)
+
         **cluster : dict
             can be used to implement complex shocks by defining clusters (refer to tutorials)
         """
@@ -1810,7 +2851,23 @@ class Database(CoreModel):
         Y_c, note_y = Y_shock(self, io, Y, clusters, 1)
         EY_c = copy.deepcopy(self.EY)
 
-        _results = calc_all_shock(z_c, e_c, v_c, Y_c)
+        # the baseline solver is reused if the technology is not shocked and
+        # is updated if the shock on the technology is low-rank
+        solver = self.leontief_solver("baseline")
+        if z:
+            solver = low_rank_update(solver, self.z, z_c, max_rank) if max_rank else None
+
+            if solver is None:
+                log_time(logger, "Shock: Leontief system factorized for the shock.")
+                solver = self._new_solver(z_c)
+            else:
+                log_time(
+                    logger,
+                    f"Shock: baseline Leontief system updated for a change of rank "
+                    f"{getattr(solver, 'rank', 0)}.",
+                )
+
+        _results = calc_all_shock(z_c, e_c, v_c, Y_c, solver=solver)
         _results["EY"] = EY_c
 
         if scenario is None:
@@ -1818,6 +2875,8 @@ class Database(CoreModel):
             self.__counter += 1
 
         self.matrices[scenario] = _results
+        self._to_storage(scenario)
+        self._solvers[scenario] = (self.matrices[scenario]["z"], solver)
 
         self.meta._add_history(f"Shocks implemented from {io} as follow:")
 
@@ -1832,6 +2891,274 @@ class Database(CoreModel):
 
         log_time(logger, "Shock: Shock implemented successfully.")
 
+    def calc_mixed_model(
+        self,
+        items,
+        regions=None,
+        X=None,
+        Y=None,
+        scenario=None,
+        base_scenario="baseline",
+        force_rewrite=False,
+    ):
+
+        """Solves a mixed endogenous/exogenous model in which the output of some
+        sectors (activities for SUT) is fixed and their final demand is endogenous
+
+        .. math::
+            x_{F} = (I - z_{FF})^{-1}(Y_{F} + z_{FK}\cdot x_{K})
+
+        .. math::
+            Y_{K} = x_{K} - z_{KF}\cdot x_{F} - z_{KK}\cdot x_{K}
+
+        The results (X, the implied Y and the flows) are stored as a new scenario.
+
+        .. note::
+
+            * Only the block of the free sectors is factorized, with the Leontief
+              solver method of the database.
+            * The coefficients (z, e, v) of the new scenario are the ones of the
+              base scenario.
+
+        Parameters
+        ----------
+        items : str, list
+            the sectors (activities for SUT) whose output is fixed
+
+        regions : str, list, Optional
+            the regions in which the output of the items is fixed (all if not given)
+
+        X : pd.DataFrame, pd.Series, Optional
+            the fixed production of the items, on the index of z. If not given,
+            the production of the base scenario is kept
+
+        Y : pd.DataFrame, Optional
+            the final demand of the free sectors. If not given, the final
+            demand of the base scenario is used
+
+        scenario : str, Optional
+            the name of the new scenario
+
+        base_scenario : str
+            the scenario whose coefficients are used
+
+        force_rewrite : bool
+            if True, an existing scenario with the same name is overwritten
+
+        Example
+        -------
+        .. code-block:: python
+
+            # the electricity output of Italy does not follow the demand growth
+            database.calc_mixed_model(
+                items = 'Electricity',
+                regions = 'Italy',
+                Y = database.Y * 1.1,
+                scenario = 'constrained',
+                )
+
+            database.Y.loc[:, 'constrained']
+        """
+        level = _MASTER_INDEX["a"] if self.table_type == "SUT" else _MASTER_INDEX["s"]
+        items = [items] if isinstance(items, str) else items
+        regions = self.get_index(_MASTER_INDEX["r"]) if regions is None else regions
+        regions = [regions] if isinstance(regions, str) else regions
+
+        if base_scenario not in self.scenarios:
+            raise WrongInput(
+                f"{base_scenario} is not a valid scenario. Existing scenarios are {self.scenarios}"
+            )
+
+        if (scenario in self.matrices) and (not force_rewrite):
+            raise WrongInput(
+                f"Scenario {scenario} already exist. In order to re-write the scenario, you can use force_rewrite = True."
+            )
+
+        if scenario == "baseline":
+            raise WrongInput("baseline scenario can not be overwritten.")
+
+        for values, name in zip([items, regions], [level, _MASTER_INDEX["r"]]):
+            difference = set(values).difference(self.get_index(name))
+            if difference:
+                raise WrongInput(
+                    f"{difference} not a valid {name}. Acceptable items are {self.get_index(name)}"
+                )
+
+        self.calc_all(["z", "e", "v", "X"], scenario=base_scenario)
+        matrices = self.matrices[base_scenario]
+
+        z = matrices["z"]
+        fixed = (
+            z.index.get_level_values(0).isin(regions)
+            & (z.index.get_level_values(1) == level)
+            & z.index.get_level_values(2).isin(items)
+        )
+
+        X = matrices["X"].loc[fixed] if X is None else X
+        if isinstance(X, pd.DataFrame):
+            X = X.iloc[:, 0]
+
+        if not X.index.equals(z.index[fixed]):
+            X = X.reindex(z.index[fixed])
+            if X.isnull().any():
+                raise WrongInput(
+                    f"X should give the production of all the fixed items:\n{[*z.index[fixed]]}"
+                )
+
+        Y = matrices["Y"] if Y is None else Y
+
+        X_c, Y_c = calc_X_mixed(
+            z, Y, X, solver=self._new_solver(z.loc[~fixed, ~fixed])
+        )
+
+        results = dict(
+            X=X_c,
+            Y=Y_c,
+            z=copy.deepcopy(z),
+            e=copy.deepcopy(matrices["e"]),
+            v=copy.deepcopy(matrices["v"]),
+            E=calc_E(matrices["e"], X_c),
+            V=calc_V(matrices["v"], X_c),
+            Z=calc_Z(z, X_c),
+            EY=copy.deepcopy(matrices["EY"]),
+        )
+
+        if scenario is None:
+            scenario = f"shock {self.__counter}"
+            self.__counter += 1
+
+        self.matrices[scenario] = results
+        self._to_storage(scenario)
+
+        self.meta._add_history(
+            f"Mixed model: output of {items} in {regions} fixed on {base_scenario} "
+            f"and stored as {scenario}."
+        )
+
+    def calc_dynamic(
+        self,
+        B,
+        Y,
+        X0=None,
+        name="dynamic",
+        base_scenario="baseline",
+        force_rewrite=False,
+    ):
+
+        """Steps the production of a dynamic Leontief model over a final demand trajectory
+
+        .. math::
+            (I - z - B)\cdot X_{t} = Y_{t} - B\cdot X_{t-1}
+
+        where B is the capital coefficients matrix, so that the investments
+        :math:`B\cdot (X_{t} - X_{t-1})` follow the growth of production.
+
+        Every period is stored as a scenario named '{name} {period}'.
+
+        .. note::
+
+            * (I - z - B) is factorized once and every period costs one solve.
+            * The scenarios of the periods share z, e, v and EY with the base
+              scenario and store only their X and Y (in which the investments
+              are split on the columns as the final demand of every row). All
+              the other matrices (E, V, Z, f, ...) are calculated only when
+              they are requested, e.g. by calc_all or query, with the Leontief
+              solver of the base scenario.
+            * Since the coefficients are shared, they should not be changed
+              inplace in any of the scenarios.
+
+        Parameters
+        ----------
+        B : pd.DataFrame
+            capital coefficients matrix, with the same index and columns of z
+
+        Y : Dict[pd.DataFrame], pd.DataFrame
+            the final demand trajectory: a dict of final demand flows matrices
+            per period, or one column of total final demand per period (split
+            on the columns of Y as the final demand of the base scenario)
+
+        X0 : pd.DataFrame, pd.Series, Optional
+            the production of the period before the first one (the production
+            of the base scenario if not given)
+
+        name : str
+            the prefix of the names of the scenarios
+
+        base_scenario : str
+            the scenario whose coefficients are used
+
+        force_rewrite : bool
+            if True, existing scenarios with the same names are overwritten
+
+        Returns
+        -------
+        pd.DataFrame
+            the production trajectory, one column per period
+
+        Example
+        -------
+        .. code-block:: python
+
+            Y = {year: database.Y * 1.02 ** (year - 2020) for year in range(2021, 2051)}
+            X = database.calc_dynamic(B, Y)
+
+            # the emissions of 2030 are calculated only here
+            database.query('E', scenarios=['dynamic 2030'])
+        """
+        if base_scenario not in self.scenarios:
+            raise WrongInput(
+                f"{base_scenario} is not a valid scenario. Existing scenarios are {self.scenarios}"
+            )
+
+        periods = Y.columns if isinstance(Y, pd.DataFrame) else [*Y]
+        scenarios = {period: f"{name} {period}" for period in periods}
+
+        for scenario in scenarios.values():
+            if scenario == "baseline":
+                raise WrongInput("baseline scenario can not be overwritten.")
+
+            if (scenario in self.matrices) and (not force_rewrite):
+                raise WrongInput(
+                    f"Scenario {scenario} already exist. In order to re-write the scenario, you can use force_rewrite = True."
+                )
+
+        self.calc_all(["z", "e", "v", "X"], scenario=base_scenario)
+        matrices = self.matrices[base_scenario]
+
+        z = matrices["z"]
+        X0 = matrices["X"] if X0 is None else X0
+
+        X, investment = calc_X_dynamic(
+            z, B, Y, X0, solver=self._new_solver(self._format("z", z + B))
+        )
+
+        self.leontief_solver(base_scenario)
+        for period, scenario in scenarios.items():
+            if isinstance(Y, pd.DataFrame):
+                demand = matrices["Y"].copy()
+                demand.loc[:, :] = _split_rows(demand, Y[period].values)
+            else:
+                demand = Y[period].copy()
+
+            demand += _split_rows(demand, investment[period].values)
+
+            self.matrices[scenario] = {
+                "X": self._format("X", X[[period]].set_axis(["production"], axis=1)),
+                "Y": self._format("Y", demand),
+                "z": z,
+                "e": matrices["e"],
+                "v": matrices["v"],
+                "EY": matrices["EY"],
+            }
+            self._solvers[scenario] = self._solvers[base_scenario]
+
+        self.meta._add_history(
+            f"Dynamic model: {len(scenarios)} periods stepped from {base_scenario} "
+            f"and stored as {name} [period]."
+        )
+
+        return X
+
     def get_shock_excel(
         self, path=None, num_shock=10, **clusters,
     ):
@@ -13,7 +13,13 @@ from mario.log_exc.exceptions import (
 from mario.log_exc.logger import log_time
 from mario.core.mariometadata import MARIOMetaData
 from mario.tools.tableparser import dataframe_parser
-
+from mario.tools.solvers import (
+    _SOLVERS,
+    spectral_radius,
+    condition_number,
+    productivity_slacks,
+)
+from mario.tools.utilities import to_sparse, to_precision
 
 
 from mario.tools.iomath import (
@@ -32,6 +38,7 @@ from mario.tools.iomath import (
     calc_F,
     calc_f,
     calc_f_dis,
+    calc_tiers,
     calc_y,
     calc_p,
 )
@@ -46,6 +53,8 @@ import logging
 import os
 import copy
 import re
+import tempfile
+import weakref
 
 
 # constants
@@ -54,21 +63,16 @@ from mario.tools.constants import (
     _MASTER_INDEX,
     _CALC,
     _ALL_MATRICES,
+    _ACCEPTABLES,
+    _SPARSE_MATRICES,
 )
 
 logger = logging.getLogger(__name__)
 
-try:
-    import cvxpy as cp
-
-    __cvxpy__ = True
-except ModuleNotFoundError:
-    log_time(
-        logger,
-        "cvxpy module is not installed in your system. This will raise problems in some of the abilities of MARIO",
-        "critical",
-    )
-    __cvxpy__ = False
+# condition number of (I - z) above which the solves lose most of their digits
+_ILL_CONDITIONED = 1e12
+# slack of the linear program above which a sector is not productive
+_SLACK_TOL = 1e-9
 
 
 class CoreModel:
@@ -100,6 +104,8 @@ class CoreModel:
         source=None,
         calc_all=True,
         year=None,
+        storage="dense",
+        precision="float64",
         **kwargs,
     ):
 
@@ -115,6 +121,8 @@ class CoreModel:
         source: str
         calc_all: bool
         year: int
+        storage: str
+        precision: str
         """
         Initializing a BaseClass can be done based on different ways.
         1. Giving the Dataframes + units
@@ -131,6 +139,21 @@ class CoreModel:
         # Initializing metadata
         self.meta = MARIOMetaData(name=name)
 
+        # A dictionary for caching the factorized Leontief system of every scenario
+        self._solvers = {}
+        self._solver_options = {"method": "lu"}
+        self._out_of_core = {"path": None, "memory": None}
+
+        if storage not in _ACCEPTABLES["storage"]:
+            raise WrongInput(
+                f"Acceptable storage modes are {_ACCEPTABLES['storage']}"
+            )
+
+        if precision not in _ACCEPTABLES["precision"]:
+            raise WrongInput(
+                f"Acceptable precisions are {_ACCEPTABLES['precision']}"
+            )
+
         if "init_by_parsers" in kwargs:
             for item in ["matrices", "units", "_indeces"]:
                 setattr(self, item, kwargs["init_by_parsers"][item])
@@ -154,6 +177,10 @@ class CoreModel:
                 log_time(logger, "Metadata: initialized by dataframes.")
 
 
+        self.meta._add_attribute(storage=storage, precision=precision)
+        for scenario in self.scenarios:
+            self._to_storage(scenario)
+
         # Adding notes if passed by user or the parsers
         if kwargs.get("notes"):
             for note in kwargs["notes"]:
@@ -189,7 +216,8 @@ class CoreModel:
         scenario : str
             the name of the scenario
         force_rewrite : bool
-            False if over-write is not allowed (faster)
+            False if over-write is not allowed (faster). If True, the cached
+            Leontief solver of the scenario is factorized again as well
         """
 
         _OPTIONS = copy.deepcopy(_ALL_MATRICES[self.table_type])
@@ -197,6 +225,10 @@ class CoreModel:
         if scenario not in self.scenarios:
             raise WrongInput(f"Acceptable scenarios are {self.scenarios}")
 
+        if force_rewrite:
+            # z may have been modified in place, keeping the same object
+            self._solvers.pop(scenario, None)
+
         for i in matrices:
             if i not in _OPTIONS:
                 raise WrongInput(
@@ -218,6 +250,7 @@ class CoreModel:
                             data = calc_X_from_z(
                                 z=self.matrices[scenario]["z"],
                                 Y=self.matrices[scenario]["Y"],
+                                solver=self.leontief_solver(scenario),
                             )
 
                         elif "Z" in self.matrices[scenario]:
@@ -232,7 +265,7 @@ class CoreModel:
                                 " Presence of Y and of the [z,Z] is necessary."
                             )
 
-                    self.matrices[scenario].update({item: data})
+                    self.matrices[scenario].update({item: self._format(item, data)})
 
                     log_time(logger, f"Database: {item} calculated for {scenario}")
 
@@ -255,6 +288,193 @@ class CoreModel:
                             f"MARIO is not able to calculate the {item} after 5 tries becuase of missing data."
                         )
 
+    def _format(self, matrix, data):
+        """converts a matrix to the storage mode and the precision of the database"""
+        if self.storage == "sparse" and matrix in _SPARSE_MATRICES:
+            return to_sparse(data, self.precision)
+
+        return to_precision(data, self.precision)
+
+    def _to_storage(self, scenario):
+        """converts the matrices of a scenario to the storage mode and the precision of the database"""
+        for matrix, data in self.matrices[scenario].items():
+            self.matrices[scenario][matrix] = self._format(matrix, data)
+
+    def leontief_solver(self, scenario="baseline"):
+
+        """Returns the factorized Leontief system (I - z) of a scenario
+
+        .. note::
+
+            The factorization is computed only once per scenario and cached on
+            the database. It is computed again if the z matrix of the scenario
+            is replaced (e.g. by update_scenarios, shocks or resets) or if
+            calc_all is called with force_rewrite=True. Changes made in place
+            on z (e.g. database.z.loc[...] = ...) are not detected: recalculate
+            the matrices with force_rewrite=True after them.
+
+        Parameters
+        ----------
+        scenario : str
+            the name of the scenario
+
+        Returns
+        -------
+        mario.tools.solvers.LeontiefSolver
+        """
+        if scenario not in self.scenarios:
+            raise WrongInput(f"Acceptable scenarios are {self.scenarios}")
+
+        if "z" not in self.matrices[scenario]:
+            self.calc_all(["z"], scenario)
+
+        z = self.matrices[scenario]["z"]
+
+        cached = self._solvers.get(scenario)
+        if cached is None or cached[0] is not z:
+            log_time(logger, f"Database: factorizing the Leontief system for {scenario}")
+            self._solvers[scenario] = (z, self._new_solver(z))
+
+        return self._solvers[scenario][1]
+
+    def _new_solver(self, z):
+        """builds the Leontief solver of z with the method set for the database"""
+        options = copy.deepcopy(self._solver_options)
+
+        return _SOLVERS[options.pop("method")](z, **options)
+
+    def set_out_of_core(self, path=None, memory=None):
+
+        """Sets the out-of-core calculation of the Leontief inverse w
+
+        When a path is set, w is calculated in column blocks against the
+        Leontief solver of the scenario and is stored in a numpy.memmap file
+        in the path, so that its matrix is never fully kept in memory.
+        Functions as calc_linkages read it block by block.
+
+        The memory budget also bounds the blocks of extensions (rows of e and
+        v) solved at once for f and m, also when no path is set.
+
+        .. note::
+
+            * The memory budget bounds the blocks on top of the solver. For
+              tables whose factorization does not fit in memory, use it with
+              the sparse storage or the 'iterative' Leontief solver.
+            * Copying the database (or the scenario) loads w in memory.
+            * The file of w of a scenario is removed when w is calculated
+              again, and all the files when the database is garbage collected.
+
+        Parameters
+        ----------
+        path : str, None
+            the directory in which w is stored for every scenario. None sets
+            back the in memory calculation
+
+        memory : float, Optional
+            the memory budget (MB) for the blocks of w, f and m calculations
+
+        Example
+        -------
+        .. code-block:: python
+
+            database.set_out_of_core(path='w_files', memory=2000)
+            database.calc_linkages()
+        """
+        if path is not None and not os.path.isdir(path):
+            os.makedirs(path)
+
+        self._out_of_core = {"path": path, "memory": memory}
+
+        self.meta._add_history(
+            f"Out-of-core: Leontief inverse stored in {path} with a budget of {memory} MB"
+            if path is not None
+            else "Out-of-core: Leontief inverse stored in memory"
+        )
+
+    def _w_options(self, scenario):
+        """the solver and the out-of-core options for calculating w of a scenario"""
+        options = dict(
+            solver=self.leontief_solver(scenario), memory=self._out_of_core["memory"]
+        )
+
+        if self._out_of_core["path"] is not None:
+            options["path"] = self._w_file(scenario)
+
+        return options
+
+    def _w_file(self, scenario):
+        """creates the file of w of a scenario, removing the file of its previous w
+
+        A new file is created for every calculation not to truncate a file that
+        may still be mapped. The files left are removed when the database is
+        garbage collected or at exit.
+        """
+        if "_w_files" not in self.__dict__:
+            self._w_files = {}
+            weakref.finalize(self, _remove_files, self._w_files)
+
+        if scenario in self._w_files:
+            _remove_files({scenario: self._w_files.pop(scenario)})
+
+        handle, path = tempfile.mkstemp(
+            prefix=f"w_{scenario}_".replace(" ", "_"),
+            suffix=".dat",
+            dir=self._out_of_core["path"],
+        )
+        os.close(handle)
+        self._w_files[scenario] = path
+
+        return path
+
+    def _g_options(self, scenario):
+        """w, if already calculated, or the solver of a scenario for deriving g"""
+        if "w" in self.matrices[scenario]:
+            return dict(w=self.matrices[scenario]["w"])
+
+        return dict(solver=self.leontief_solver(scenario))
+
+    def set_leontief_solver(self, method="lu", **options):
+
+        """Sets the method used to solve the Leontief system in all the calculations
+
+        .. note::
+
+            Changing the method deletes the cached factorizations of all the scenarios.
+
+        Parameters
+        ----------
+        method : str
+            #. 'lu': LU factorization of (I - z) in float64 (default)
+            #. 'mixed': LU factorization in float32 refined in float64 up to tol.
+               The residuals of the last solve are reported in leontief_solver(scenario).info
+            #. 'iterative': no factorization, every query is solved by 'gmres', 'bicgstab'
+               or the 'neumann' series. Suggested for large sparse tables with few queries
+            #. 'region': only the diagonal region blocks are factorized and the trade
+               blocks are solved by block iterations. Suggested for multi-regional tables
+
+        options : dict
+            options of the method (for 'mixed': tol and max_iter; for 'iterative':
+            algorithm, preconditioner ('jacobi', 'ilu' or None), tol and max_iter;
+            for 'region': tol and max_iter)
+
+        Example
+        -------
+        .. code-block:: python
+
+            database.set_leontief_solver('mixed', tol=1e-10)
+            database.calc_all(['X','f'])
+            database.leontief_solver('baseline').info['residuals']
+        """
+        if method not in _SOLVERS:
+            raise WrongInput(f"Acceptable methods are {[*_SOLVERS]}")
+
+        self._solver_options = {"method": method, **options}
+        self._solvers.clear()
+
+        self.meta._add_history(
+            f"Solver: Leontief system solved by '{method}' method with options {options}"
+        )
+
     def add_note(self, notes):
 
         """Adds notes to the meta history
@@ -313,6 +533,8 @@ class CoreModel:
         for matrix, value in matrices.items():
             self.matrices[scenario][matrix] = value
 
+        self._to_storage(scenario)
+
     def clone_scenario(
         self,
         scenario,
@@ -570,27 +792,37 @@ class CoreModel:
 
         """Checks the productivity of the system
 
+        .. note::
+
+            Every method computes only what it needs, through products by z
+            or the Leontief solver of the scenario, so the test is usable on
+            large tables:
+
+            * 'A' estimates the spectral radius of z by ARPACK (or power
+              iteration) and, if the system is productive, the condition number
+              of (I - z) by a few solves, warning if it is ill-conditioned.
+            * 'B' runs the power series of z (supply chain tiers) on a vector of ones.
+            * 'C' solves the slack variable problem as a sparse linear program.
+
         Parameters
         ------------
         method : str
-            represents the method to check the balance:
+            represents the method to check the productivity:
 
-                #. 'flow'
-                #. 'coefficient'
-                #. 'price'
+                #. 'A': spectral radius
+                #. 'B': power series expansion
+                #. 'C': slack variable
 
         data_set: str
             defining the scenario to be checked
 
-        margin: float which will be considered as a margin for the balance
-
         RETURN
         -------------
 
         boolean
 
-                True if the dataset is balance
-                Flase if the dataset is not balance --> it also prints in a table the imbalances
+                True if the system is productive
+                False if the system is not productive
 
         """
         _methods = {
@@ -605,22 +837,19 @@ class CoreModel:
         if method.upper() not in _methods:
             raise WrongInput("Acceptable methods are: \n{}".format([*_methods]))
 
-        z = copy.deepcopy(self.matrices[data_set]["z"])
-        Y = copy.deepcopy(self.matrices[data_set]["Y"])
-        Y = Y.sum(axis=1).to_frame()
-        I = np.eye(z.shape[0])
-        L = np.linalg.inv(I - z)
+        method = method.upper()
+        self.calc_all(["z"], scenario=data_set)
+        z = self.matrices[data_set]["z"]
 
         log_time(
-            logger, "Productivity test by {} method".format(_methods[method.upper()])
+            logger, "Productivity test by {} method".format(_methods[method])
         )
 
         _productive = True
 
         if method == "A":
 
-            eigen_value = np.linalg.eig(z)[0]
-            rho = max(abs(eigen_value))
+            rho = spectral_radius(z)
 
             if rho < 1:
                 log_time(
@@ -630,6 +859,14 @@ class CoreModel:
                     ),
                 )
 
+                condition = condition_number(self.leontief_solver(data_set), z)
+                if condition > _ILL_CONDITIONED:
+                    log_time(
+                        logger,
+                        f"Test: (I - z) is ill-conditioned (estimated condition number = {condition:.2e})",
+                        "warn",
+                    )
+
             else:
                 log_time(
                     logger,
@@ -641,60 +878,44 @@ class CoreModel:
 
         elif method == "B":
 
-            M = {}
-            M[0] = I
-            M_cum = {}
-            M_cum[0] = M[0]
-            residuals = []  # initial point
-            error = 0.1
-            i = 0
-
-            while residuals[i] >= error:
-                M[i + 1] = np.linalg.matrix_power(z, i + 1)
-                M_cum[i + 1] = M_cum[i] + M[i + 1]
-                residuals.append(sum(sum(abs(L - M_cum[i + 1]))))
-                if residuals[i + 1] > residuals[i]:
-                    log_time(
-                        logger,
-                        "Test: non-productive system (non-convergent power series)",
-                    )
-                    _productive = False
-                    break
-                i += 1
-            else:
+            # the tiers of a positive vector decay (and their series converges)
+            # only if z is productive
+            tiers = calc_tiers(
+                z,
+                pd.Series(1.0, index=z.index),
+                tol=1e-6,
+                max_tiers=1000,
+            )
+
+            if tiers["remainder"].isnull().any():
                 log_time(
-                    logger, "Test: productive system (non-convergent power series)"
+                    logger,
+                    "Test: non-productive system (non-convergent power series)",
                 )
+                _productive = False
 
-        elif method == "C" and __cvxpy__:
-
-            x = cp.Variable((Y.shape[0], 1))
-            s = cp.Variable((Y.shape[0], 1))
-
-            Z = cp.sum(s, 0)
-            obj = cp.Minimize(Z)
+            else:
+                log_time(
+                    logger,
+                    f"Test: productive system (power series convergent in {tiers.shape[1] - 1} tiers)",
+                )
 
-            const = [
-                cp.matmul(I - z, x) + s == np.ones((Y.shape[0], 1)),
-                x >= 0,
-                s >= 0,
-            ]
+        elif method == "C":
 
-            prob = cp.Problem(obj, const)
-            prob.solve(verbose=False)
-            print(s.value)
+            slacks = productivity_slacks(z)
+            non_productive = int((slacks > _SLACK_TOL).sum())
 
-            if all(s.value == 0):
+            if non_productive:
                 log_time(
-                    logger, "Test: productive system (all industries are productive)"
+                    logger,
+                    f"Test: non-productive system (number of non-productive industries: {non_productive})",
                 )
+                _productive = False
 
             else:
                 log_time(
-                    logger,
-                    "Test: non-productive system (number of non-productive industries: {})",
+                    logger, "Test: productive system (all industries are productive)"
                 )
-                _productive = False
 
         return _productive
 
@@ -864,6 +1085,46 @@ class CoreModel:
         """
         return [*self.matrices]
 
+    @property
+    def storage(self):
+        """Returns the storage mode of the matrices
+
+        .. note::
+
+            * 'dense': matrices are stored as regular pd.DataFrames
+            * 'sparse': z, Z, e, E, v, V are stored as sparse pd.DataFrames
+              (only non-zero values are stored) and the calculations on them are
+              performed with scipy.sparse
+
+        Returns
+        -------
+        str
+        """
+        return self.meta.storage
+
+    @property
+    def precision(self):
+        """Returns the floating point precision in which the matrices are stored
+
+        .. note::
+
+            Precision policy:
+
+            * all the matrices (flows, coefficients, Y, EY, X and the derived ones)
+              are stored in the chosen precision, and the calc functions return
+              results in the precision of their inputs.
+            * scaling by a vector (hat operations), products and shocks are computed
+              in the storage precision.
+            * reductions producing the production vector (calc_X) and the
+              factorization of the Leontief system with its solves (X, w, f, m, p)
+              are accumulated in float64 and cast back to the storage precision.
+
+        Returns
+        -------
+        str
+        """
+        return self.meta.precision
+
     @property
     def table_type(self):
         """Returns the type of the database
@@ -1037,7 +1298,13 @@ class CoreModel:
                 raise AttributeError(attr)
 
     def __getstate__(self):
-        return self.__dict__
+        # the cached factorizations are not copied (SuperLU objects cannot be
+        # pickled): the copies factorize their Leontief systems again when needed.
+        # The files of w stay owned by the original database
+        state = {key: value for key, value in self.__dict__.items() if key != "_w_files"}
+        state["_solvers"] = {}
+
+        return state
 
     def __setstate__(self, value):
         self.__dict__ = value
@@ -1071,4 +1338,13 @@ class CoreModel:
             copy.deepcopy(self.matrices),
             copy.deepcopy(self._indeces),
             copy.deepcopy(self.units),
-        )
\ No newline at end of file
+        )
+
+
+def _remove_files(files):
+    """removes the files (values of a dict) that still exist"""
+    for path in files.values():
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -26,9 +26,15 @@ _INDEX_NAMES = {"3levels": (_MASTER_INDEX["r"], "Level", "Item"), "1level": ("It
 
 _ACCEPTABLES = {
     "table": ["SUT", "IOT"],
+    "storage": ["dense", "sparse"],
+    "precision": ["float64", "float32"],
 }
 
 
+# matrices that are stored in sparse format when storage = 'sparse'
+_SPARSE_MATRICES = ["z", "Z", "e", "E", "v", "V"]
+
+
 _UNITS = {
     "SUT": {_MASTER_INDEX[i]: i for i in ["a", "c", "f", "k"]},
     "IOT": {_MASTER_INDEX[i]: i for i in ["s", "f", "k"]},
@@ -74,25 +80,25 @@ _ADD_SECTOR_SHEETS = {
 
 
 _CALC = {
-    "m": "calc_f(self.matrices['{}']['v'],self.matrices['{}']['w'])",
+    "m": "calc_f(self.matrices['{}']['v'],solver=self.leontief_solver('{}'),memory=self._out_of_core['memory'])",
     "M": "calc_F(self.matrices['{}']['m'],self.matrices['{}']['Y'].sum(1))",
     "V": "calc_E(self.matrices['{}']['v'],self.matrices['{}']['X'])",
     "v": "calc_e(self.matrices['{}']['V'],self.matrices['{}']['X'])",
-    "f": "calc_f(self.matrices['{}']['e'],self.matrices['{}']['w'])",
+    "f": "calc_f(self.matrices['{}']['e'],solver=self.leontief_solver('{}'),memory=self._out_of_core['memory'])",
     "F": "calc_F(self.matrices['{}']['f'],self.matrices['{}']['Y'].sum(1))",
     "e": "calc_e(self.matrices['{}']['E'],self.matrices['{}']['X'])",
     "E": "calc_E(self.matrices['{}']['e'],self.matrices['{}']['X'])",
     "z": "calc_z(self.matrices['{}']['Z'],self.matrices['{}']['X'])",
     "Z": "calc_Z(self.matrices['{}']['z'],self.matrices['{}']['X'])",
-    "w": "calc_w(self.matrices['{}']['z'])",
-    "g": "calc_w(self.matrices['{}']['b'])",
+    "w": "calc_w(self.matrices['{}']['z'],**self._w_options('{}'))",
+    "g": "calc_g(X=self.matrices['{}']['X'],**self._g_options('{}'))",
     "b": "calc_b(self.matrices['{}']['X'],self.matrices['{}']['Z'])",
     "y": "calc_y(self.matrices['{}']['Y'])",
     "s": "self.matrices['{}']['z'].loc[(slice(None),_MASTER_INDEX['a'],slice(None)),(slice(None),_MASTER_INDEX['c'],slice(None))]",
     "S": "self.matrices['{}']['Z'].loc[(slice(None),_MASTER_INDEX['a'],slice(None)),(slice(None),_MASTER_INDEX['c'],slice(None))]",
     "u": "self.matrices['{}']['z'].loc[(slice(None),_MASTER_INDEX['c'],slice(None)),(slice(None),_MASTER_INDEX['a'],slice(None))]",
     "U": "self.matrices['{}']['Z'].loc[(slice(None),_MASTER_INDEX['c'],slice(None)),(slice(None),_MASTER_INDEX['a'],slice(None))]",
-    "p": "calc_p(self.matrices['{}']['v'],self.matrices['{}']['w'])",
+    "p": "calc_p(self.matrices['{}']['v'],solver=self.leontief_solver('{}'))",
     "X_Z": "calc_X(self.matrices['{}']['Z'],self.matrices['{}']['Y'])",
     "X_z": "calc_X_from_z(self.matrices['{}']['z'],self.matrices['{}']['Y'])",
 }
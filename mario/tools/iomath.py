@@ -4,18 +4,29 @@ this module contains the io calculation functions
 """
 import pandas as pd
 import numpy as np
-from copy import deepcopy as dc
+from scipy import sparse
 
 from mario.log_exc.logger import log_time
+from mario.log_exc.exceptions import WrongInput
+from mario.tools.solvers import LeontiefSolver, RegionBlockSolver, _selection
+from mario.tools.utilities import (
+    is_sparse,
+    to_spmatrix,
+    from_spmatrix,
+    float_dtype,
+)
 import logging
+import heapq
+import math
 
 logger = logging.getLogger(__name__)
 
+_SDA_METHODS = ["shapley", "polar"]
 
-def calc_all_shock(z, e, v, Y):
 
-    w = calc_w(z)
-    X = calc_X_from_w(w, Y)
+def calc_all_shock(z, e, v, Y, solver=None):
+
+    X = calc_X_from_z(z, Y, solver=solver)
     E = calc_E(e, X)
     V = calc_V(v, X)
     Z = calc_Z(z, X)
@@ -45,7 +56,9 @@ def calc_X(
         Production flows vector
     """
 
-    return pd.DataFrame(Z.sum(1) + Y.sum(1), columns=["production"])
+    X = pd.Series(_row_sums(Z), index=Z.index) + pd.Series(_row_sums(Y), index=Y.index)
+
+    return pd.DataFrame(X.astype(_precision(Z, Y)), columns=["production"])
 
 
 def calc_Z(
@@ -69,54 +82,110 @@ def calc_Z(
     pd.DataFrame
         Intersectoral transaction flows matrix
     """
-    X = dc(X)
-    if isinstance(X, pd.DataFrame):
-        X = X.sum(1)
-    _X = np.diagflat(X.values)
+    return _hat_right(z, X)
 
-    return pd.DataFrame(z.values @ _X, index=z.index, columns=z.columns)
 
-
-def calc_w(z):
+def calc_w(z, solver=None, path=None, memory=None):
     """Calculates Leontief coefficients matrix
 
     .. math::
         w = (I - z)^{-1}
 
+    .. note::
+
+        If a path is given, w is built out-of-core: the columns are solved in
+        blocks against the solver and written into a numpy.memmap file, so
+        that on top of the solver only one block is kept in memory. The
+        returned pd.DataFrame is backed by the file.
+
     Parameters
     ----------
     z : pd.DataFrame
         Intersectoral transaction coefficients matrix
 
+    solver : mario.tools.solvers.LeontiefSolver, Optional
+        an existing solver of (I - z) (LU, mixed precision or iterative) to build the inverse from
+
+    path : str, Optional
+        the file in which w is stored as a numpy.memmap
+
+    memory : float, Optional
+        the memory budget (MB) for the blocks of the out-of-core calculation
+
     Returns
     -------
     pd.Dataframe
         Leontief coefficients matrix
     """
-    I = np.eye(z.shape[0])
+    if solver is None:
+        solver = LeontiefSolver(z)
 
-    return pd.DataFrame(np.linalg.inv(I - z.values), index=z.index, columns=z.columns)   
+    if path is None:
+        w = solver.inverse().astype(_precision(z), copy=False)
+
+    else:
+        w = np.memmap(path, dtype=_precision(z), mode="w+", shape=z.shape)
+        solver.inverse(out=w, block_size=_block_size(*z.shape, memory))
+        w.flush()
+
+    return pd.DataFrame(w, index=z.index, columns=z.columns, copy=False)
 
 
-def calc_g(b):
+def calc_g(b=None, X=None, w=None, solver=None):
     """Calculates Ghosh coefficients matrix
 
     .. math::
-        g = (I - b)^{-1}
+        g = (I - b)^{-1} = \hat{X}^{-1}\cdot w\cdot \hat{X}
+
+    .. note::
+
+        If X is given together with w or with a solver of (I - z), g is
+        derived from the Leontief inverse and b is not inverted again. Sectors
+        with null production have null rows and columns in b, so their
+        diagonal element in g is 1.
 
     Parameters
     ----------
-    b : pd.DataFrame
+    b : pd.DataFrame, Optional
         Intersectoral transaction direct-output coefficients matrix
 
+    X : pd.DataFrame, Optional
+        Production flows vector
+
+    w : pd.DataFrame, Optional
+        Leontief coefficients matrix
+
+    solver : mario.tools.solvers.LeontiefSolver, Optional
+        an existing solver of (I - z) to build w from, if w is not given
+
     Returns
     -------
     pd.DataFrame
         Gosh coefficients matrix
 
     """
+    if X is None or (w is None and solver is None):
+        if b is None:
+            raise WrongInput("b or X and one of w and solver are needed to calculate g.")
+
+        return calc_w(b)
 
-    return calc_w(b)
+    x = np.asarray(X.values, dtype=np.float64).ravel()
+
+    if w is None:
+        values = solver.inverse()
+        dtype = _precision(solver, X)
+    else:
+        values = np.array(w.values, dtype=np.float64)
+        dtype = _precision(w, X)
+
+    # values is a temporary owned here, so it is scaled in place
+    values = _hat_right(_hat_left(X_inverse(x), values, inplace=True), x, inplace=True)
+    values[np.diag_indices_from(values)] += x == 0
+
+    return pd.DataFrame(
+        values.astype(dtype, copy=False), index=X.index, columns=X.index, copy=False
+    )
 
 
 def calc_X_from_w(
@@ -141,23 +210,30 @@ def calc_X_from_w(
         Production flows vector
     """
     if isinstance(Y, pd.DataFrame):
-        Y = dc(Y.sum(1))
+        Y = Y.sum(1)
 
     return pd.DataFrame(w.dot(Y).values, index=Y.index, columns=["production"])
 
 
-def calc_X_from_z(z, Y):
+def calc_X_from_z(z, Y, solver=None):
     """Calculates Production vector from Intersectoral transaction coefficients matrix
 
     .. math::
         x = (I - z)^{-1} Y
 
+    .. note::
+
+        The system is solved through the LU factorization of (I - z) and the
+        Leontief inverse is never built.
+
     Parameters
     ----------
     z : pd.DataFrame
         Intersectoral transaction coefficients matrix
     Y : pd.DataFrame
         Final demand flows matrix
+    solver : mario.tools.solvers.LeontiefSolver, Optional
+        an existing solver of (I - z) (LU, mixed precision or iterative) to be reused
 
     Returns
     -------
@@ -166,11 +242,760 @@ def calc_X_from_z(z, Y):
     """
 
     if isinstance(Y, pd.DataFrame):
-        Y = dc(Y.sum(1))
+        Y = Y.sum(1)
 
-    w = calc_w(z)
+    if solver is None:
+        solver = LeontiefSolver(z)
 
-    return pd.DataFrame(w.dot(Y).values, index=Y.index, columns=["production"])
+    return pd.DataFrame(
+        solver.solve(Y.values).astype(_precision(z, Y), copy=False),
+        index=Y.index,
+        columns=["production"],
+    )
+
+
+def calc_X_batch(z, Y, solver=None):
+    """Calculates the production vectors of a stack of final demand vectors
+
+    .. math::
+        X = (I - z)^{-1} [Y_1, Y_2, ..., Y_k]
+
+    .. note::
+
+        All the production vectors are calculated with one multi right hand
+        side solve against the same factorization of (I - z).
+
+    Parameters
+    ----------
+    z : pd.DataFrame
+        Intersectoral transaction coefficients matrix
+    Y : pd.DataFrame
+        Final demand vectors (one column per vector)
+    solver : mario.tools.solvers.LeontiefSolver, Optional
+        an existing solver of (I - z) (LU, mixed precision or iterative) to be reused
+
+    Returns
+    -------
+    pd.DataFrame
+        Production vectors with the same columns of Y
+    """
+
+    if solver is None:
+        solver = LeontiefSolver(z)
+
+    return pd.DataFrame(
+        solver.solve(Y.values).astype(_precision(z, Y), copy=False),
+        index=Y.index,
+        columns=Y.columns,
+    )
+
+
+def calc_X_region(z, Y, region, solver=None):
+    """Calculates the production vector of one region
+
+    .. math::
+        x_r = S_r^{-1}(Y_r - A_{rR}\cdot A_{RR}^{-1}\cdot Y_R)
+
+    .. note::
+
+        The region is solved through the Schur complement of its block of
+        (I - z), so only the diagonal region blocks are factorized.
+
+    Parameters
+    ----------
+    z : pd.DataFrame
+        Intersectoral transaction coefficients matrix
+    Y : pd.DataFrame
+        Final demand flows matrix
+    region : str
+        the region to calculate the production for
+    solver : mario.tools.solvers.RegionBlockSolver, Optional
+        an existing region block solver of (I - z) to be reused
+
+    Returns
+    -------
+    pd.DataFrame
+        Production flows vector of the region
+    """
+
+    if isinstance(Y, pd.DataFrame):
+        Y = Y.sum(1)
+
+    if not isinstance(solver, RegionBlockSolver):
+        solver = RegionBlockSolver(z)
+
+    return pd.DataFrame(
+        solver.solve_region(region, Y.values).astype(_precision(z, Y), copy=False),
+        index=Y.index[Y.index.get_level_values(0) == region],
+        columns=["production"],
+    )
+
+
+def calc_X_mixed(z, Y, X, solver=None):
+    """Calculates the production and the final demand of a mixed endogenous/exogenous model
+
+    The output of the sectors in X is fixed (exogenous) and their final
+    demand becomes endogenous, while the output of the other (free) sectors
+    is driven by their final demand
+
+    .. math::
+        x_{F} = (I - z_{FF})^{-1}(Y_{F} + z_{FK}\cdot x_{K})
+
+    .. math::
+        Y_{K} = x_{K} - z_{KF}\cdot x_{F} - z_{KK}\cdot x_{K}
+
+    .. note::
+
+        Only the block of the free sectors is factorized. The endogenous final
+        demand of every fixed sector is split among the columns of Y as its
+        final demand in Y (or as the total final demand if it is null).
+
+    Parameters
+    ----------
+    z : pd.DataFrame
+        Intersectoral transaction coefficients matrix
+    Y : pd.DataFrame
+        Final demand flows matrix (only the rows of the free sectors are used)
+    X : pd.DataFrame, pd.Series
+        the fixed production of the exogenous sectors (a subset of the index of z)
+    solver : mario.tools.solvers.LeontiefSolver, Optional
+        an existing solver of the free block (I - z_FF) to be reused
+
+    Returns
+    -------
+    tuple
+        the production flows vector and the final demand flows matrix with
+        the endogenous final demand of the fixed sectors
+    """
+    if isinstance(X, pd.DataFrame):
+        X = X.iloc[:, 0]
+
+    difference = X.index.difference(z.index)
+    if len(difference):
+        raise WrongInput(f"{[*difference]} not in the index of z.")
+
+    fixed = z.index.isin(X.index)
+    free = ~fixed
+    x_K = np.asarray(X.reindex(z.index[fixed]).values, dtype=np.float64)
+
+    values = to_spmatrix(z).tocsr() if is_sparse(z) else z.values
+    if solver is None:
+        solver = LeontiefSolver(z.loc[free, free])
+
+    demand = np.asarray(_row_sums(Y), dtype=np.float64)
+    x_F = solver.solve(demand[free] + values[free][:, fixed] @ x_K)
+    y_K = x_K - values[fixed][:, free] @ x_F - values[fixed][:, fixed] @ x_K
+
+    production = np.empty(z.shape[0])
+    production[free] = x_F
+    production[fixed] = x_K
+
+    Y_new = Y.astype(np.float64)
+    Y_new.loc[fixed] = _split_rows(Y, y_K, fixed)
+
+    dtype = _precision(z, Y)
+
+    return (
+        pd.DataFrame(production.astype(dtype), index=z.index, columns=["production"]),
+        Y_new.astype(dtype),
+    )
+
+
+def calc_X_dynamic(z, B, Y, X0, solver=None):
+    """Calculates the production trajectory of a dynamic Leontief model
+
+    The investments of every period follow the growth of production through
+    the capital coefficients B
+
+    .. math::
+        x_{t} = z\cdot x_{t} + B\cdot (x_{t} - x_{t-1}) + y_{t}
+
+    so that every period is solved as
+
+    .. math::
+        (I - z - B)\cdot x_{t} = y_{t} - B\cdot x_{t-1}
+
+    .. note::
+
+        (I - z - B) is factorized once and every period costs one solve
+        against the same factorization.
+
+    Parameters
+    ----------
+    z : pd.DataFrame
+        Intersectoral transaction coefficients matrix
+    B : pd.DataFrame
+        Capital coefficients matrix (same index and columns of z)
+    Y : pd.DataFrame, Dict[pd.DataFrame]
+        the final demand trajectory: one column of total final demand per
+        period or a dict of final demand flows matrices per period
+    X0 : pd.DataFrame, pd.Series
+        the production of the period before the first one
+    solver : mario.tools.solvers.LeontiefSolver, Optional
+        an existing solver of (I - z - B) to be reused
+
+    Returns
+    -------
+    tuple
+        the production and the investment trajectories (one column per period)
+    """
+    if not (B.index.equals(z.index) and B.columns.equals(z.columns)):
+        raise WrongInput("B should have the same index and columns of z.")
+
+    if isinstance(Y, pd.DataFrame):
+        Y = {period: Y[period] for period in Y.columns}
+
+    if solver is None:
+        solver = LeontiefSolver(z + B)
+
+    capital = to_spmatrix(B).tocsr() if is_sparse(B) else B.values
+    previous = np.asarray(_as_vector(X0), dtype=np.float64)
+
+    production = np.empty((z.shape[0], len(Y)))
+    investment = np.empty((z.shape[0], len(Y)))
+
+    for step, demand in enumerate(Y.values()):
+        demand = np.asarray(_as_vector(demand), dtype=np.float64)
+        production[:, step] = solver.solve(demand - capital @ previous)
+        investment[:, step] = capital @ (production[:, step] - previous)
+        previous = production[:, step]
+
+    periods = pd.Index([*Y], name="Period")
+    dtype = _precision(z, B)
+
+    return (
+        pd.DataFrame(production.astype(dtype), index=z.index, columns=periods),
+        pd.DataFrame(investment.astype(dtype), index=z.index, columns=periods),
+    )
+
+
+def calc_tiers(z, Y, tol=1e-6, max_tiers=100):
+    """Calculates the production layers (supply chain tiers) of a final demand
+
+    .. math::
+        X = Y + z\cdot Y + z^{2}\cdot Y + ... = \sum_{t=0}^{T} z^{t}\cdot Y + R_{T}
+
+    .. note::
+
+        Every tier costs one (sparse) product by z and no inverse is built.
+        The tiers stop when the last one is below tol times the cumulated
+        production. The remainder :math:`R_{T}` is extrapolated from the
+        decay of the last tiers, so the sum of all the columns is a preview
+        of X.
+
+    Parameters
+    ----------
+    z : pd.DataFrame
+        Intersectoral transaction coefficients matrix
+    Y : pd.DataFrame, pd.Series
+        Final demand flows (summed on the columns)
+    tol : float
+        relative contribution of a tier at which the decomposition stops
+    max_tiers : int
+        maximum number of tiers after the final demand
+
+    Returns
+    -------
+    pd.DataFrame
+        the production of every tier (0 is the final demand) and the remainder
+    """
+    if isinstance(Y, pd.DataFrame):
+        Y = Y.sum(1)
+
+    values = to_spmatrix(z).tocsr() if is_sparse(z) else z.values
+
+    tiers = [np.asarray(Y.values, dtype=np.float64)]
+    total = tiers[0].copy()
+
+    with np.errstate(over="ignore", invalid="ignore"):
+        while True:
+            following = values @ tiers[-1]
+            converged = np.abs(following).sum() <= tol * np.abs(total).sum()
+            diverged = not np.isfinite(following).all()
+
+            if converged or diverged or len(tiers) > max_tiers:
+                break
+
+            tiers.append(following)
+            total += following
+
+    # decay per tier, measured on two tiers not to be biased by alternating
+    # structures (as the commodity-activity blocks of SUTs)
+    with np.errstate(over="ignore", invalid="ignore"):
+        previous = np.abs(tiers[-2 if len(tiers) > 1 else -1]).sum()
+        steps = 2 if len(tiers) > 1 else 1
+        ratio = (np.abs(following).sum() / previous) ** (1 / steps) if previous else 0
+
+    if ratio < 1 and not diverged:
+        remainder = following / (1 - ratio)
+    else:
+        remainder = np.full(following.shape, np.nan)
+
+    if not converged:
+        log_time(
+            logger,
+            f"Tiers: the contribution of tier {len(tiers)} is still above tol={tol} "
+            f"(decay ratio = {ratio:.3f})",
+            "warn",
+        )
+
+    tiers = pd.DataFrame(
+        np.column_stack(tiers + [remainder]).astype(_precision(z, Y), copy=False),
+        index=Y.index,
+        columns=[*range(len(tiers)), "remainder"],
+    )
+    tiers.columns.name = "Tier"
+
+    return tiers
+
+
+def calc_spa(z, e, sector, demand=1.0, solver=None, threshold=1e-3, depth=8, max_paths=100):
+    """Structural path analysis of the footprint of the final demand of one sector
+
+    The value of the path :math:`j \leftarrow i_1 \leftarrow ... \leftarrow i_k`
+    is the extension directly activated in its last sector
+
+    .. math::
+        e_{i_k}\cdot z_{i_k,i_{k-1}} \cdots z_{i_1,j}\cdot y_{j}
+
+    Paths are searched best-first with a priority queue on their upper bound,
+    the footprint of the whole subtree of their last sector
+
+    .. math::
+        f_{i_k}\cdot z_{i_k,i_{k-1}} \cdots z_{i_1,j}\cdot y_{j}
+
+    and a branch is pruned as soon as its bound is below threshold times the
+    total footprint. The search stops when no bound left in the queue can
+    beat the max_paths most important paths already found.
+
+    .. note::
+
+        * The inputs of every sector are expanded at once from the sparse
+          column of z.
+        * The bounds are exact for non-negative z and e.
+
+    Parameters
+    ----------
+    z : pd.DataFrame
+        Intersectoral transaction coefficients matrix
+    e : pd.Series
+        the coefficients of one extension (e.g. one row of e) on the columns of z
+    sector : tuple
+        the label of the sector (on the columns of z) of the final demand
+    demand : float
+        the final demand of the sector
+    solver : mario.tools.solvers.LeontiefSolver, Optional
+        an existing solver of (I - z) for the footprint multipliers
+    threshold : float
+        the share of the total footprint below which paths are pruned
+    depth : int
+        the maximum number of upstream stages
+    max_paths : int
+        the maximum number of paths returned
+
+    Returns
+    -------
+    pd.DataFrame
+        the paths ranked by value, with the labels of their stages (0 being
+        the sector of the final demand)
+    """
+    if sector not in z.columns:
+        raise WrongInput(f"{sector} not in the columns of z.")
+
+    if solver is None:
+        solver = LeontiefSolver(z)
+
+    labels = z.columns
+    root = labels.get_loc(sector)
+
+    e = np.asarray(e.reindex(labels).values, dtype=np.float64)
+    f = np.asarray(solver.solve(e, trans=True), dtype=np.float64).ravel()
+    z = sparse.csc_matrix(to_spmatrix(z) if is_sparse(z) else z.values, dtype=np.float64)
+
+    total = demand * f[root]
+    cutoff = threshold * abs(total)
+
+    # (-bound, order, path, value of the path up to its last sector)
+    queue = [(-abs(total), 0, (root,), demand)]
+    paths = []  # min-heap of the best paths found (value, order, path)
+    order = 1
+
+    while queue:
+        bound, _, path, prefix = heapq.heappop(queue)
+
+        if len(paths) == max_paths and -bound <= paths[0][0]:
+            break
+
+        node = path[-1]
+        value = prefix * e[node]
+
+        if value and abs(value) >= cutoff:
+            item = (abs(value), order, path, value)
+            if len(paths) < max_paths:
+                heapq.heappush(paths, item)
+            elif item[0] > paths[0][0]:
+                heapq.heapreplace(paths, item)
+
+        if len(path) > depth:
+            continue
+
+        start, stop = z.indptr[node], z.indptr[node + 1]
+        inputs = z.indices[start:stop]
+        prefixes = prefix * z.data[start:stop]
+        bounds = np.abs(prefixes * f[inputs])
+
+        for child in np.flatnonzero((bounds >= cutoff) & (bounds > 0)):
+            order += 1
+            heapq.heappush(
+                queue,
+                (-bounds[child], order, path + (inputs[child],), prefixes[child]),
+            )
+
+    paths = sorted(paths, key=lambda item: (-item[0], item[1]))
+    stages = max([len(path) for _, _, path, _ in paths], default=1)
+
+    # one column per level of the labels (the whole label if they are unnamed)
+    names = labels.names if None not in labels.names else ["Stage"]
+    split = _as_tuple if None not in labels.names else lambda label: (label,)
+
+    table = pd.DataFrame(
+        [
+            [value, value / total if total else np.nan, len(path) - 1]
+            + [
+                label
+                for stage in range(stages)
+                for label in (
+                    split(labels[path[stage]])
+                    if stage < len(path)
+                    else [None] * len(names)
+                )
+            ]
+            for _, _, path, value in paths
+        ],
+        columns=["Value", "Share", "Depth"]
+        + [f"{name} {stage}" for stage in range(stages) for name in names],
+        index=pd.RangeIndex(1, len(paths) + 1, name="Rank"),
+    )
+
+    return table
+
+
+def _as_tuple(label):
+    """a label of a (Multi)Index as a tuple"""
+    return label if isinstance(label, tuple) else (label,)
+
+
+def calc_extraction(z, Y, groups, solver=None, memory=None):
+    """Hypothetical extraction of groups of sectors: the output lost if their
+    rows and columns of z and their final demand are removed
+
+    .. math::
+        \bar{x}_{R} = (I - z_{RR})^{-1}\cdot y_{R} = u_{R} - w_{RS}\cdot w_{SS}^{-1}\cdot u_{S}
+
+    where S are the extracted sectors, R all the others and
+    :math:`u = w\cdot y_{R} = x - w_{:,S}\cdot y_{S}`.
+
+    .. note::
+
+        Every extraction needs only the columns of w of its sectors, solved
+        against the factorization of the baseline system in blocks of many
+        groups at once (within the memory budget), so no extracted system is
+        factorized or inverted.
+
+    Parameters
+    ----------
+    z : pd.DataFrame
+        Intersectoral transaction coefficients matrix
+    Y : pd.DataFrame
+        Final demand flows matrix
+    groups : dict
+        the name of every extraction and the labels of its sectors (on the index of z)
+    solver : mario.tools.solvers.LeontiefSolver, Optional
+        an existing solver of (I - z) to be reused
+    memory : float, Optional
+        the memory budget (MB) for the columns of w solved at once
+
+    Returns
+    -------
+    pd.DataFrame
+        the total output loss and its share of the total output for every extraction
+    """
+    if solver is None:
+        solver = LeontiefSolver(z)
+
+    positions = {}
+    for name, labels in groups.items():
+        indexer = z.index.get_indexer(labels)
+        if (indexer < 0).any() or not len(indexer):
+            raise WrongInput(f"The sectors of {name} are not in the index of z.")
+        positions[name] = indexer
+
+    demand = np.asarray(_row_sums(Y), dtype=np.float64)
+    x = np.asarray(solver.solve(demand), dtype=np.float64).ravel()
+    total = x.sum()
+
+    n = z.shape[0]
+    size = _block_size(n, sum(map(len, positions.values())), memory)
+
+    # consecutive groups solved together while their columns fit in the block
+    blocks = [[]]
+    width = 0
+    for name, S in positions.items():
+        if blocks[-1] and width + len(S) > size:
+            blocks.append([])
+            width = 0
+        blocks[-1].append(name)
+        width += len(S)
+
+    loss = {}
+    for block in blocks:
+        columns = np.concatenate([positions[name] for name in block])
+        W = np.asarray(solver.solve(_selection(n, columns)), dtype=np.float64)
+
+        start = 0
+        for name in block:
+            S = positions[name]
+            W_S = W[:, start : start + len(S)]
+            start += len(S)
+
+            u = x - W_S @ demand[S]
+            x_bar = u - W_S @ np.linalg.solve(W_S[S], u[S])
+            x_bar[S] = 0
+
+            loss[name] = total - x_bar.sum()
+
+    loss = pd.Series(loss, dtype=np.float64)
+
+    return pd.DataFrame(
+        {"Output loss": loss, "Relative loss": loss / total if total else np.nan}
+    )
+
+
+def calc_sda(z, Y, z_new, Y_new, e=None, e_new=None, solver=None, solver_new=None, method="shapley"):
+    """Structural decomposition analysis of the change of production (or of a footprint)
+
+    .. math::
+        X = L\cdot B\cdot d\cdot l \qquad E = e\cdot L\cdot B\cdot d\cdot l
+
+    where L is the Leontief inverse (technology), B the product mix of every
+    column of Y, d the share of every column in the final demand (demand
+    mix) and l its total (level). The change between the two tables is
+    split in the effects of the factors (e being the intensity):
+
+    #. 'shapley': average over all the orderings of the factors
+    #. 'polar': average of the two polar decompositions
+
+    .. note::
+
+        The chain is evaluated from the right with all the combinations of
+        the old and the new factors at once: every factor doubles the
+        batch of vectors, L is applied by one solve with many right hand
+        sides per table, and every effect is a weighted sum of the
+        2^K results.
+
+    Parameters
+    ----------
+    z, z_new : pd.DataFrame
+        Intersectoral transaction coefficients matrices of the two tables
+    Y, Y_new : pd.DataFrame
+        Final demand flows matrices of the two tables
+    e, e_new : pd.DataFrame, Optional
+        Satellite (or factor of production) transaction coefficients
+        matrices. If not given, the change of X is decomposed
+    solver, solver_new : mario.tools.solvers.LeontiefSolver, Optional
+        existing solvers of (I - z) and (I - z_new) to be reused
+    method : str
+        'shapley' or 'polar'
+
+    Returns
+    -------
+    pd.DataFrame
+        the effects of the factors (on the columns) for every row of X (or e)
+    """
+    if method not in _SDA_METHODS:
+        raise WrongInput(f"Acceptable methods are {_SDA_METHODS}")
+
+    if not (z.index.equals(z_new.index) and Y.columns.equals(Y_new.columns)):
+        raise WrongInput("The two tables should have the same indices.")
+
+    solvers = [
+        LeontiefSolver(z) if solver is None else solver,
+        LeontiefSolver(z_new) if solver_new is None else solver_new,
+    ]
+
+    levels, mixes, products = [], [], []
+    for demand in [Y, Y_new]:
+        columns = np.asarray(_row_sums(demand.T), dtype=np.float64)
+        level = columns.sum()
+
+        levels.append(np.array([[level]]))
+        mixes.append(columns[:, None] * X_inverse(np.array([level])))
+        products.append(np.asarray(demand.values, dtype=np.float64) * X_inverse(columns)[None, :])
+
+    # the factors from the right of the chain: (name, old, new, operator)
+    factors = [
+        ("Level", *levels, lambda factor, state: factor * state),
+        ("Demand mix", *mixes, lambda factor, state: factor @ state),
+        ("Product mix", *products, lambda factor, state: factor @ state),
+        ("Technology", *solvers, lambda factor, state: factor.solve(state)),
+    ]
+
+    if e is not None:
+        intensities = [
+            to_spmatrix(item).tocsr() if is_sparse(item) else item.values
+            for item in [e, e_new]
+        ]
+        factors.append(("Intensity", *intensities, lambda factor, state: factor @ state))
+
+    # column c of the state has the factor k at its new value if the bit k of c is 1
+    state = np.ones((1, 1))
+    for _, old, new, operator in factors:
+        state = np.hstack(
+            [
+                np.asarray(operator(old, state), dtype=np.float64),
+                np.asarray(operator(new, state), dtype=np.float64),
+            ]
+        )
+
+    effects = _sda_effects(state, method)[:, ::-1]
+    names = [name for name, *_ in factors][::-1]
+
+    return pd.DataFrame(
+        effects.astype(_precision(z, Y), copy=False),
+        index=z.index if e is None else e.index,
+        columns=pd.Index(names, name="Effect"),
+    )
+
+
+def _sda_effects(values, method):
+    """effects of the K factors from the results of all the 2^K combinations
+    of old (bit 0) and new (bit 1) factors
+    """
+    combinations = values.shape[1]
+    K = combinations.bit_length() - 1
+    effects = np.zeros((values.shape[0], K))
+
+    for k in range(K):
+        bit = 1 << k
+
+        if method == "shapley":
+            before = np.array([c for c in range(combinations) if not c & bit])
+            sizes = np.array([bin(c).count("1") for c in before])
+            weights = np.array(
+                [
+                    math.factorial(size) * math.factorial(K - size - 1) / math.factorial(K)
+                    for size in sizes
+                ]
+            )
+        else:
+            # factors before k at new and after k at old values, and the opposite
+            before = np.array([bit - 1, (combinations - 1) & ~(2 * bit - 1)])
+            weights = np.array([0.5, 0.5])
+
+        effects[:, k] = (values[:, before | bit] - values[:, before]) @ weights
+
+    return effects
+
+
+def calc_gvc(z, Y, X, v, solver=None):
+    """Decomposition of the gross exports of every region to every other region
+    by the origin of their value added
+
+    .. math::
+        DVA_{sr} = v_{s}\cdot L_{ss}\cdot \hat{E}_{sr}
+
+    .. math::
+        DDC_{sr} = v_{s}\cdot (B_{ss} - L_{ss})\cdot \hat{E}_{sr}
+
+    .. math::
+        FVA_{sr} = \sum_{t \neq s} v_{t}\cdot B_{ts}\cdot \hat{E}_{sr}
+
+    where B is the global Leontief inverse, :math:`L_{ss} = (I - z_{ss})^{-1}`
+    the local inverse of the exporter s and :math:`E_{sr}` its gross exports
+    (intermediate and final) to the importer r. DVA is the domestic value
+    added in the exports, DDC the domestic value added that is counted again
+    as it returns to s embodied in imported intermediates, and FVA the foreign
+    value added. If the table is balanced, the three terms sum to the gross exports.
+
+    .. note::
+
+        The value added multipliers of all the region pairs come from a single
+        transposed solve with one right hand side per region against the
+        global factorization, and from one transposed solve per region against
+        its local factorization (reused from a region block solver), so no
+        block of B or L is ever built.
+
+    Parameters
+    ----------
+    z : pd.DataFrame
+        Intersectoral transaction coefficients matrix with the Region level
+        as the first level of the index
+    Y : pd.DataFrame
+        Final demand flows matrix
+    X : pd.DataFrame
+        Production flows vector
+    v : pd.DataFrame
+        Factor of production transaction coefficients matrix
+    solver : mario.tools.solvers.LeontiefSolver, Optional
+        an existing solver of (I - z) to be reused. If it is a region block
+        solver, its factorized diagonal blocks are used as local inverses
+
+    Returns
+    -------
+    pd.DataFrame
+        the gross exports and their DVA, DDC and FVA for every exporting sector and importer
+    """
+    if solver is None:
+        solver = LeontiefSolver(z)
+
+    regions = z.index.get_level_values(0)
+    importers = regions.unique()
+    if len(importers) < 2:
+        raise WrongInput("The decomposition needs at least two regions.")
+
+    # region indicator of the rows (n x regions)
+    P = (regions.values[:, None] == importers.values[None, :]).astype(np.float64)
+    own = P.astype(bool)
+
+    values = to_spmatrix(z).tocsr() if is_sparse(z) else z.values
+    demand = to_spmatrix(Y).tocsr() if is_sparse(Y) else Y.values
+    buyers = (
+        Y.columns.get_level_values(0).values[:, None] == importers.values[None, :]
+    ).astype(np.float64)
+
+    x = np.asarray(_as_vector(X), dtype=np.float64)
+    exports = np.asarray(values @ (x[:, None] * P) + demand @ buyers, dtype=np.float64)
+    exports[own] = 0
+
+    g = np.asarray(_row_sums(v.T), dtype=np.float64)
+
+    # value added of every region embodied in one unit of output of every sector
+    content = np.asarray(solver.solve(g[:, None] * P, trans=True), dtype=np.float64)
+    domestic = content[own]
+    foreign = content.sum(1) - domestic
+
+    local = np.empty_like(g)
+    for region in importers:
+        rows = np.flatnonzero(regions == region)
+        if isinstance(solver, RegionBlockSolver):
+            local[rows] = solver.solve_local(region, g[rows], trans=True)
+        else:
+            local[rows] = LeontiefSolver(z.iloc[rows, rows]).solve(g[rows], trans=True)
+
+    table = pd.DataFrame(
+        {
+            "Gross exports": exports.ravel(),
+            "DVA": (local[:, None] * exports).ravel(),
+            "DDC": ((domestic - local)[:, None] * exports).ravel(),
+            "FVA": (foreign[:, None] * exports).ravel(),
+        },
+        index=pd.MultiIndex.from_tuples(
+            [(*_as_tuple(row), importer) for row in z.index for importer in importers],
+            names=[*z.index.names, "Importer"],
+        ),
+    )
+
+    return table[~own.ravel()].astype(_precision(z, Y), copy=False)
 
 
 def calc_E(e, X):
@@ -239,25 +1064,42 @@ def calc_e(E, X):
 
 def calc_p(
     v,
-    w,
+    w=None,
+    solver=None,
 ):
     """Calculating Price index coefficients vector
 
     .. math::
         p = v\cdot w
 
+    .. note::
+
+        If a solver is given, p is calculated by a transposed solve of the
+        factorized Leontief system and w is not needed.
+
     Parameters
     ----------
     v : pd.DataFrame
         Factor of production transaction coefficients matrix
     w : pd.DataFrame
         Leontief coefficients matrix
+    solver : mario.tools.solvers.LeontiefSolver, Optional
+        the solver of (I - z) (LU, mixed precision or iterative) to be used instead of w
 
     Returns
     -------
     pd.DataFrame
         Price index coefficients vector
     """
+    if solver is not None:
+        return pd.DataFrame(
+            solver.solve(v.sum().values, trans=True).astype(
+                _precision(v, solver), copy=False
+            ),
+            columns=["price index"],
+            index=v.columns,
+        )
+
     v = v.sum().values.reshape(1, v.shape[1])
 
     return pd.DataFrame(
@@ -265,6 +1107,60 @@ def calc_p(
     )
 
 
+def calc_p_batch(v, shocks, w=None, solver=None):
+    """Calculates the price index coefficients vectors of a batch of cost shocks
+
+    .. math::
+        p_{k} = (v^{T}\cdot 1 + s_{k})^{T}\cdot w
+
+    where :math:`s_{k}` is the cost added to every unit of output of the
+    sectors by the shock k (e.g. a carbon price times the emission coefficients).
+
+    .. note::
+
+        If a solver is given, all the shocks are solved at once by one
+        transposed solve with one right hand side per shock and w is not needed.
+
+    Parameters
+    ----------
+    v : pd.DataFrame
+        Factor of production transaction coefficients matrix
+    shocks : pd.DataFrame, pd.Series
+        the cost added per unit of output of the sectors (on the index) by
+        every shock (on the columns)
+    w : pd.DataFrame, Optional
+        Leontief coefficients matrix
+    solver : mario.tools.solvers.LeontiefSolver, Optional
+        the solver of (I - z) to be used instead of w
+
+    Returns
+    -------
+    pd.DataFrame
+        Price index coefficients vectors, one column per shock
+    """
+    if isinstance(shocks, pd.Series):
+        shocks = shocks.to_frame()
+
+    shocks = shocks.reindex(v.columns)
+    if shocks.isnull().values.any():
+        raise WrongInput("shocks should be given for all the columns of v.")
+
+    costs = _row_sums(v.T)[:, None] + shocks.values
+
+    if solver is not None:
+        prices = solver.solve(costs, trans=True)
+        dtype = _precision(v, solver)
+    else:
+        prices = w.values.T @ costs
+        dtype = _precision(v, w)
+
+    return pd.DataFrame(
+        np.asarray(prices).astype(dtype, copy=False),
+        index=v.columns,
+        columns=shocks.columns,
+    )
+
+
 def calc_v(
     V,
     X,
@@ -289,7 +1185,7 @@ def calc_v(
     return calc_z(V, X)
 
 
-def calc_m(v, w):
+def calc_m(v, w=None, solver=None, memory=None):
     """Calculates Multipliers coefficients matrix
 
     .. math::
@@ -301,13 +1197,17 @@ def calc_m(v, w):
         Factor of production transaction coefficients matrix
     w : pd.DataFrame
         Leontief coefficients matrix
+    solver : mario.tools.solvers.LeontiefSolver, Optional
+        the solver of (I - z) (LU, mixed precision or iterative) to be used instead of w
+    memory : float, Optional
+        the memory budget (MB) for the blocks of rows of v solved at once
 
     Returns
     -------
     pd.DataFrame
         Multipliers coefficients matrix
     """
-    return calc_f(v, w)
+    return calc_f(v, w, solver, memory)
 
 
 def calc_M(m, Y):
@@ -351,10 +1251,7 @@ def calc_z(Z, X):
     pd.DataFrame
         Intersectoral transaction coefficients matrix
     """
-    X_inv = X_inverse(X)
-    X_inv = np.diagflat(X_inv)
-
-    return pd.DataFrame(Z.values @ X_inv, index=Z.index, columns=Z.columns)
+    return _hat_right(Z, X_inverse(X))
 
 
 def calc_b(X, Z):
@@ -375,10 +1272,64 @@ def calc_b(X, Z):
     pd.DataFrame
         Intersectoral transaction direct-output coefficients
     """
-    X_inv = X_inverse(X)
-    X_inv = np.diagflat(X_inv)
+    return _hat_left(X_inverse(X), Z)
+
+
+def calc_households(Y, V, X, categories, factors):
+    """Calculates the coefficients that close the model with respect to the households of every region
+
+    .. math::
+        C_{:,r} = \frac{Y_{:,r}}{\sum_{j \in r} V_{j}}
+
+    .. math::
+        R_{r,j} = \frac{V_{j}}{X_{j}} \quad j \in r
+
+    where :math:`Y_{:,r}` is the final demand of the given categories of region r
+    and :math:`V_{j}` the value added of the given factors in j.
+
+    Parameters
+    ----------
+    Y : pd.DataFrame
+        Final demand flows matrix
+    V : pd.DataFrame
+        Factor of production transaction flows matrix
+    X : pd.DataFrame
+        Production flows vector
+    categories : list
+        the consumption categories spent by the households
+    factors : list
+        the factors of production earned by the households
+
+    Returns
+    -------
+    tuple
+        C (consumption coefficients, n x regions) and R (income coefficients, regions x n)
+    """
+    V = V.loc[factors].sum(0)
+    Y = Y.loc[:, Y.columns.get_level_values(-1).isin(categories)]
+
+    regions = V.index.get_level_values(0).unique()
+    households = pd.MultiIndex.from_product(
+        [regions, ["Household"], ["Household"]], names=V.index.names
+    )
+
+    income = V.groupby(level=0, sort=False).sum().reindex(regions)
+    consumption = Y.T.groupby(level=0, sort=False).sum().T.reindex(columns=regions, fill_value=0)
+
+    C = pd.DataFrame(
+        consumption.values * X_inverse(income)[None, :],
+        index=Y.index,
+        columns=households,
+    )
 
-    return pd.DataFrame(X_inv @ Z.values, index=Z.index, columns=Z.columns)
+    R = pd.DataFrame(
+        (V.index.get_level_values(0).values[None, :] == regions.values[:, None])
+        * (V.values * X_inverse(X.iloc[:, 0]))[None, :],
+        index=households,
+        columns=V.index,
+    )
+
+    return C, R
 
 
 def calc_F(f, Y):
@@ -403,27 +1354,240 @@ def calc_F(f, Y):
     return calc_Z(f, Y)
 
 
-def calc_f(e, w):
+def calc_F_by_demand(f, Y, origin=None):
+    """Calculates Footprint flows split by final demand (consuming region and category)
+
+    .. math::
+        F_{k,g,c} = \sum_{i \in g} f_{k,i}\cdot Y_{i,c}
+
+    .. note::
+
+        Without origin the result is a single product :math:`f\cdot Y`. With
+        an origin, the origins are aggregated while computing, so only one
+        n x c temporary is built for every footprint.
+
+    Parameters
+    ----------
+    f : pd.DataFrame
+        Footprint coefficients matrix
+    Y : pd.DataFrame
+        Final Demand flows matrix (one column per consumer)
+    origin : str, list, Optional
+        the level(s) of the columns of f by which the origin of the footprints
+        is kept (e.g. 'Region' or ['Region','Item']). If None, the origins
+        are summed
+
+    Returns
+    -------
+    pd.DataFrame
+        Footprint flows with the footprints (and the origins) on the index and
+        the columns of Y on the columns
+    """
+    values = np.asarray(f.values, dtype=np.float64)
+    demand = np.asarray(Y.values, dtype=np.float64)
+    dtype = _precision(f, Y)
+
+    if origin is None:
+        return pd.DataFrame(
+            (values @ demand).astype(dtype, copy=False), index=f.index, columns=Y.columns
+        )
+
+    levels = [origin] if isinstance(origin, str) else list(origin)
+    difference = set(levels).difference(f.columns.names)
+    if difference:
+        raise WrongInput(
+            f"{difference} not in the levels of the columns of f: {f.columns.names}"
+        )
+
+    groups = pd.MultiIndex.from_arrays(
+        [f.columns.get_level_values(level) for level in levels]
+    )
+    codes, groups = groups.factorize()
+    aggregation = sparse.csr_matrix(
+        (np.ones(len(codes)), (np.arange(len(codes)), codes)),
+        shape=(len(codes), len(groups)),
+    ).T.tocsr()
+
+    flows = np.empty((f.shape[0], len(groups), Y.shape[1]), dtype=dtype)
+    for row in range(f.shape[0]):
+        flows[row] = aggregation @ (values[row][:, None] * demand)
+
+    index = pd.MultiIndex.from_arrays(
+        [np.repeat(f.index.values, len(groups))]
+        + [
+            np.tile(groups.get_level_values(level).values, f.shape[0])
+            for level in range(len(levels))
+        ],
+        names=[f.index.names[0], *levels],
+    )
+
+    return pd.DataFrame(
+        flows.reshape(-1, Y.shape[1]), index=index, columns=Y.columns, copy=False
+    )
+
+
+def calc_F_trade(e, z, Y, solver=None, sectors=False):
+    """Calculates the extension flows embodied in the trade between every pair of regions
+
+    .. math::
+        F_{k,s,r} = \sum_{i \in s} e_{k,i}\cdot (w\cdot Y_{:,r})_{i}
+
+    that are the flows emitted in the region s to satisfy the final demand of
+    the region r, through intermediate and final trade. The sum over the
+    consumers r is the production-based account of s (E) and the sum over the
+    producers s is the consumption-based footprint of r (:math:`f\cdot Y_{:,r}`).
+
+    .. note::
+
+        The final demand is aggregated by consuming region and solved with one
+        multi right hand side solve (one column per region), so neither w nor
+        f is built and no diagonal matrix is formed.
+
+    Parameters
+    ----------
+    e : pd.DataFrame
+        Satellite transaction coefficients matrix
+    z : pd.DataFrame
+        Intersectoral transaction coefficients matrix with the Region level
+        as the first level of the index
+    Y : pd.DataFrame
+        Final demand flows matrix with the Region level as the first level of the columns
+    solver : mario.tools.solvers.LeontiefSolver, Optional
+        an existing solver of (I - z) to be reused
+    sectors : boolean
+        if True, the flows are kept by producing sector instead of by producing region
+
+    Returns
+    -------
+    pd.DataFrame
+        the embodied flows with the satellite accounts and the producers on
+        the index and the consuming regions on the columns
+    """
+    if solver is None:
+        solver = LeontiefSolver(z)
+
+    consumers = Y.columns.get_level_values(0).unique()
+    buyers = (
+        Y.columns.get_level_values(0).values[:, None] == consumers.values[None, :]
+    ).astype(np.float64)
+
+    demand = to_spmatrix(Y).tocsr() if is_sparse(Y) else Y.values
+    production = np.asarray(
+        solver.solve(np.asarray(demand @ buyers, dtype=np.float64)), dtype=np.float64
+    )
+
+    if sectors:
+        producers = pd.MultiIndex.from_tuples(map(_as_tuple, z.index))
+        aggregation = sparse.identity(z.shape[0], format="csr")
+    else:
+        codes, producers = z.index.get_level_values(0).factorize()
+        producers = pd.MultiIndex.from_arrays([producers])
+        aggregation = sparse.csr_matrix(
+            (np.ones(len(codes)), (codes, np.arange(len(codes)))),
+            shape=(len(producers), len(codes)),
+        )
+
+    values = np.asarray(e.values, dtype=np.float64)
+    dtype = _precision(e, Y)
+
+    flows = np.empty((e.shape[0], len(producers), len(consumers)), dtype=dtype)
+    for row in range(e.shape[0]):
+        flows[row] = aggregation @ (values[row][:, None] * production)
+
+    index = pd.MultiIndex.from_arrays(
+        [np.repeat(e.index.values, len(producers))]
+        + [
+            np.tile(producers.get_level_values(level).values, e.shape[0])
+            for level in range(producers.nlevels)
+        ],
+        names=[e.index.names[0], *z.index.names[: producers.nlevels]],
+    )
+
+    return pd.DataFrame(
+        flows.reshape(-1, len(consumers)),
+        index=index,
+        columns=pd.Index(consumers, name=Y.columns.names[0]),
+        copy=False,
+    )
+
+
+def calc_f(e, w=None, solver=None, memory=None):
     """Calculates Footprint coefficients matrix
 
     .. math::
         f = e\cdot w
 
+    .. note::
+
+        If a solver is given, f is calculated by solving the transposed system
+        :math:`(I - z)^{T} f^{T} = e^{T}` and w is not needed. The rows of e
+        are solved as multi right hand side blocks fitting in the memory budget.
+
     Parameters
     ----------
     e : pd.DataFrame
         Satellite transaction coefficients matrix
     w : pd.DataFrame
         Leontief coefficients matrix
+    solver : mario.tools.solvers.LeontiefSolver, Optional
+        the solver of (I - z) (LU, mixed precision or iterative) to be used instead of w
+    memory : float, Optional
+        the memory budget (MB) for the blocks of rows of e solved at once.
+        If None, all the rows are solved at once
 
     Returns
     -------
     pd.DataFrame
         Footprint coefficients matrix
     """
+    if solver is not None:
+        f = np.empty(e.shape, dtype=_precision(e, solver))
+
+        for block, values in _row_blocks(e, memory):
+            f[block] = solver.solve(values.T, trans=True).T
+
+        return pd.DataFrame(f, index=e.index, columns=e.columns, copy=False)
+
     return e.dot(w)
 
 
+def calc_f_region(e, region, solver):
+    """Calculates the Footprint coefficients of the sectors of one region
+
+    .. math::
+        f_r = e\cdot w_{:,r}
+
+    .. note::
+
+        The columns of the region are solved through the Schur complement of
+        the transposed Leontief system, so w is never built.
+
+    Parameters
+    ----------
+    e : pd.DataFrame
+        Satellite transaction coefficients matrix
+    region : str
+        the region to calculate the footprint coefficients for
+    solver : mario.tools.solvers.RegionBlockSolver
+        the region block solver of (I - z)
+
+    Returns
+    -------
+    pd.DataFrame
+        Footprint coefficients of the region
+    """
+    if not isinstance(solver, RegionBlockSolver):
+        raise WrongInput("calc_f_region needs a RegionBlockSolver.")
+
+    return pd.DataFrame(
+        solver.solve_region(region, e.values.T, trans=True).T.astype(
+            _precision(e, solver), copy=False
+        ),
+        index=e.index,
+        columns=e.columns[e.columns.get_level_values(0) == region],
+    )
+
+
 def calc_f_dis(e,w):
     """Calculates Footprint coefficients matrix disaggregated by origin sector and region
 
@@ -432,8 +1596,8 @@ def calc_f_dis(e,w):
 
     Parameters
     ----------
-    e : pd.DataFrame
-        Satellite transaction coefficients matrix
+    e : pd.DataFrame, pd.Series
+        Satellite transaction coefficients of a single satellite account
     w : pd.DataFrame
         Leontief coefficients matrix
 
@@ -443,10 +1607,99 @@ def calc_f_dis(e,w):
         Footprint coefficients matrix disaggregated by origin sector and region
     """
 
-    f_dis = np.diagflat(e.values) @ w    
-    f_dis.index = e.columns
-    
-    return f_dis
+    if isinstance(e, pd.DataFrame):
+        if e.shape[0] != 1:
+            raise WrongInput(
+                "calc_f_dis can be calculated only for a single satellite account."
+            )
+        e = e.iloc[0]
+
+    return _hat_left(e, w)
+
+
+def calc_f_dis_blocks(e, solver, memory=None, top=None, threshold=None):
+    """Yields the Footprint coefficients disaggregated by origin sector and region
+    of every satellite account, by blocks of consuming sectors
+
+    .. math::
+        f_dis^{k}_{:,J} = \hat{e_k} \cdot w_{:,J}
+
+    .. note::
+
+        Every block of columns of w is solved once against the solver and is
+        shared by all the satellite accounts, so w is never built. Only one
+        block of w and one block of f_dis are in memory at the same time.
+
+    Parameters
+    ----------
+    e : pd.DataFrame
+        Satellite transaction coefficients matrix
+    solver : mario.tools.solvers.LeontiefSolver
+        the solver of (I - z)
+    memory : float, Optional
+        the memory budget (MB) for the blocks. If None, all the consuming
+        sectors are solved at once
+    top : int, Optional
+        if given, for every consuming sector only the top origins (by absolute
+        value) are kept
+    threshold : float, Optional
+        if given, only the origins contributing at least this share of the
+        footprint coefficient of the consuming sector are kept
+
+    Yields
+    ------
+    tuple
+        the satellite account and the pd.DataFrame of its f_dis for a block of
+        consuming sectors (origins on the index, consuming sectors on the
+        columns). If top or threshold are given, the block is in sparse storage
+    """
+    values = np.asarray(e.values, dtype=np.float64)
+    dtype = _precision(e, solver)
+    prune = top is not None or threshold is not None
+    n = e.shape[1]
+    size = _block_size(n, n, memory)
+
+    for start in range(0, n, size):
+        block = slice(start, min(start + size, n))
+        identity = np.zeros((n, block.stop - block.start))
+        identity[block] = np.eye(block.stop - block.start)
+
+        w = solver.solve(identity)
+
+        for row, account in enumerate(e.index):
+            f_dis = values[row][:, None] * w
+
+            if prune:
+                f_dis = from_spmatrix(
+                    sparse.csc_matrix(_prune(f_dis, top, threshold).astype(dtype)),
+                    index=e.columns,
+                    columns=e.columns[block],
+                )
+            else:
+                f_dis = pd.DataFrame(
+                    f_dis.astype(dtype, copy=False),
+                    index=e.columns,
+                    columns=e.columns[block],
+                )
+
+            yield account, f_dis
+
+
+def _prune(f_dis, top=None, threshold=None):
+    """sets to zero the contributions out of the top origins or below the threshold share of every column"""
+    magnitude = np.abs(f_dis)
+    keep = magnitude > 0
+
+    if threshold is not None:
+        keep &= magnitude >= threshold * np.abs(f_dis.sum(0))
+
+    if top is not None and top < f_dis.shape[0]:
+        largest = np.argpartition(-magnitude, top - 1, axis=0)[:top]
+        is_top = np.zeros(f_dis.shape, dtype=bool)
+        is_top[largest, np.arange(f_dis.shape[1])] = True
+        keep &= is_top
+
+    return np.where(keep, f_dis, 0)
 
 
 def calc_y(Y):
@@ -467,71 +1720,149 @@ def calc_y(Y):
 
 def X_inverse(X):
 
-    X_inv = dc(X)
-
-    if isinstance(X_inv, (pd.Series, pd.DataFrame)):
-        X_inv = X_inv.values.astype(float)
+    if isinstance(X, (pd.Series, pd.DataFrame)):
+        X = X.values
 
-    X_inv[X_inv != 0] = 1 / X_inv[X_inv != 0]
+    X_inv = np.zeros(X.shape, dtype=np.result_type(X.dtype, np.float32))
+    np.divide(1, X, out=X_inv, where=X != 0)
 
     return X_inv
 
 
+def _split_rows(Y, values, rows=None):
+    """splits the values of some rows of Y (all if rows is None) on the columns
+    of Y, as their final demand (or as the total final demand if it is null)
+    """
+    Y = np.asarray(Y.values, dtype=np.float64)
+    totals = Y.sum(1)
+    rows = slice(None) if rows is None else rows
+
+    shares = np.where(
+        (totals[rows] != 0)[:, None],
+        Y[rows] * X_inverse(totals[rows])[:, None],
+        Y.sum(0) * X_inverse(totals.sum()),
+    )
 
+    return shares * np.asarray(values, dtype=np.float64)[:, None]
 
-def linkages_calculation(cut_diag, matrices, multi_mode, normalized):
-    """calculates the linkages"""
-    if cut_diag:
-        for key, value in matrices.items():
-            np.fill_diagonal(value.values, 0)
 
-    if multi_mode:
+def _precision(*items):
+    """returns the float dtype in which the results on the given items are stored
 
-        link_types = [
-            "Total Forward",
-            "Total Backward",
-            "Direct Forward",
-            "Direct Backward",
-        ]
-        geo_types = ["Local", "Foreign"]
-        links = pd.DataFrame(
-            0,
-            index=matrices["g"].index,
-            columns=pd.MultiIndex.from_product([link_types, geo_types]),
+    Integers are promoted to float64 while float32 inputs keep float32.
+    """
+    dtypes = [
+        item.dtype if isinstance(item, (np.ndarray, LeontiefSolver)) else float_dtype(item)
+        for item in items
+    ]
+
+    return np.result_type(*dtypes, np.float32)
+
+
+def _row_sums(M):
+    """returns the sums over the rows of M accumulated in float64"""
+    if is_sparse(M):
+        return np.asarray(to_spmatrix(M).sum(axis=1, dtype=np.float64)).ravel()
+
+    return M.values.sum(axis=1, dtype=np.float64)
+
+
+def _as_vector(x):
+    """returns the diagonal of a hat-operation as a 1-D np.ndarray"""
+    if isinstance(x, pd.DataFrame):
+        x = x.sum(1)
+
+    if isinstance(x, pd.Series):
+        x = x.values
+
+    return np.asarray(x).ravel()
+
+
+def _hat_right(M, x, inplace=False):
+    """Scales the columns of M by x without building the diagonal matrix
+
+    .. math::
+        M\cdot \hat{x}
+
+    Dense matrices are scaled by broadcasting in a single pass (the only allocation
+    is the output), sparse matrices keep their sparsity pattern. If M is a
+    np.ndarray owned by the caller, inplace=True overwrites it instead of allocating.
+    """
+    x = _as_vector(x).astype(_precision(M), copy=False)
+
+    if isinstance(M, np.ndarray):
+        return np.multiply(M, x[np.newaxis, :], out=M if inplace else None)
+
+    if is_sparse(M):
+        return from_spmatrix(
+            to_spmatrix(M) @ sparse.diags(x), index=M.index, columns=M.columns
         )
 
-        for index, values in links.iterrows():
-            links.loc[index, ("Total Forward", "Local")] = (
-                matrices["g"].loc[index, index[0]].sum().sum()
-            )
-            links.loc[index, ("Total Forward", "Foreign")] = (
-                matrices["g"].loc[index].sum().sum()
-                - matrices["g"].loc[index, index[0]].sum().sum()
-            )
+    return pd.DataFrame(
+        np.multiply(M.values, x[np.newaxis, :]), index=M.index, columns=M.columns
+    )
 
-            links.loc[index, ("Total Backward", "Local")] = (
-                matrices["w"].loc[index, index[0]].sum().sum()
-            )
-            links.loc[index, ("Total Backward", "Foreign")] = (
-                matrices["w"].loc[index].sum().sum()
-                - matrices["w"].loc[index, index[0]].sum().sum()
-            )
 
-            links.loc[index, ("Direct Forward", "Local")] = (
-                matrices["b"].loc[index, index[0]].sum().sum()
-            )
-            links.loc[index, ("Direct Forward", "Foreign")] = (
-                matrices["b"].loc[index].sum().sum()
-                - matrices["b"].loc[index, index[0]].sum().sum()
-            )
+def _hat_left(x, M, inplace=False):
+    """Scales the rows of M by x without building the diagonal matrix
 
-            links.loc[index, ("Direct Backward", "Local")] = (
-                matrices["z"].loc[index, index[0]].sum().sum()
-            )
-            links.loc[index, ("Direct Backward", "Foreign")] = (
-                matrices["z"].loc[index].sum().sum()
-                - matrices["z"].loc[index, index[0]].sum().sum()
+    .. math::
+        \hat{x}\cdot M
+
+    As for _hat_right, inplace=True overwrites a np.ndarray M owned by the caller.
+    """
+    x = _as_vector(x).astype(_precision(M), copy=False)
+
+    if isinstance(M, np.ndarray):
+        return np.multiply(x[:, np.newaxis], M, out=M if inplace else None)
+
+    if is_sparse(M):
+        return from_spmatrix(
+            sparse.diags(x) @ to_spmatrix(M), index=M.index, columns=M.columns
+        )
+
+    return pd.DataFrame(
+        np.multiply(x[:, np.newaxis], M.values), index=M.index, columns=M.columns
+    )
+
+
+def linkages_calculation(cut_diag, matrices, multi_mode, normalized, memory=None):
+    """calculates the linkages reading the matrices block by block
+
+    if g is not in the matrices, its sums are taken from w and X
+    (g = X^-1 w X) on the same blocks on which w is read
+    """
+    sums = {}
+    for key, value in matrices.items():
+        if key == "X":
+            continue
+
+        if key == "w" and "g" not in matrices:
+            sums["w"], sums["g"] = _linkage_sums(
+                value, cut_diag, multi_mode, memory, X=matrices["X"]
             )
+        else:
+            sums[key] = _linkage_sums(value, cut_diag, multi_mode, memory)
+
+    if multi_mode:
+
+        link_types = {
+            "Total Forward": "g",
+            "Total Backward": "w",
+            "Direct Forward": "b",
+            "Direct Backward": "z",
+        }
+        geo_types = ["Local", "Foreign"]
+        links = pd.DataFrame(
+            0.0,
+            index=matrices["w"].index,
+            columns=pd.MultiIndex.from_product([[*link_types], geo_types]),
+        )
+
+        for link, key in link_types.items():
+            rows, _, local = sums[key]
+            links[(link, "Local")] = local
+            links[(link, "Foreign")] = rows - local
 
         if normalized:
             log_time(
@@ -540,32 +1871,106 @@ def linkages_calculation(cut_diag, matrices, multi_mode, normalized):
 
     # Computing linkages as if there were only one unique region
     else:
-        _forward_t = matrices["g"].sum(axis=1).to_frame()
-        _backward_t = matrices["w"].sum(axis=0).to_frame()
-        _forward_d = matrices["b"].sum(axis=1).to_frame()
-        _backward_d = matrices["z"].sum(axis=0).to_frame()
-
-        _forward_t.columns = ["Total Forward"]
-        _backward_t.columns = ["Total Backward"]
-        _forward_d.columns = ["Direct Forward"]
-        _backward_d.columns = ["Direct Backward"]
+        links = pd.DataFrame(
+            {
+                "Total Forward": sums["g"][0],
+                "Total Backward": sums["w"][1],
+                "Direct Forward": sums["b"][0],
+                "Direct Backward": sums["z"][1],
+            },
+            index=matrices["w"].index,
+        )
 
         if normalized:
+            links = links / links.mean()
 
-            _forward_t.iloc[:, 0] = _forward_t.iloc[:, 0] / np.average(
-                _forward_t.values
-            )
-            _backward_t.iloc[:, 0] = _backward_t.iloc[:, 0] / np.average(
-                _backward_t.values
-            )
-            _forward_d.iloc[:, 0] = _forward_d.iloc[:, 0] / np.average(
-                _forward_d.values
-            )
-            _backward_d.iloc[:, 0] = _backward_d.iloc[:, 0] / np.average(
-                _backward_d.values
-            )
+    return links
 
-        links = pd.concat([_forward_t, _backward_t, _forward_d, _backward_d], axis=1)
 
-    return links
+def _linkage_sums(matrix, cut_diag, multi_mode, memory=None, X=None):
+    """row sums, column sums and row sums within the region of every row of a
+    matrix (without the diagonal if cut_diag), reading it block by block
+
+    if X is given, the matrix is w and the sums of the Ghosh matrix derived
+    from it (g = X^-1 w X) are returned as well, from the same blocks
+    """
+    n_rows, n_cols = matrix.shape
+
+    if multi_mode:
+        row_regions = matrix.index.get_level_values(0).values
+        col_regions = matrix.columns.get_level_values(0).values
+
+    def accumulate(sums, values, block, diagonal):
+        rows, columns, local = sums
+        if cut_diag:
+            values[diagonal, diagonal - block.start] = 0
+
+        rows += values.sum(1)
+        columns[block] = values.sum(0)
+
+        if multi_mode:
+            same_region = row_regions[:, None] == col_regions[None, block]
+            local += np.where(same_region, values, 0).sum(1)
+
+    sums = (np.zeros(n_rows), np.zeros(n_cols), np.zeros(n_rows))
+
+    if X is not None:
+        x = np.asarray(X.values, dtype=np.float64).ravel()
+        x_inv = X_inverse(x)
+        ghosh_sums = (np.zeros(n_rows), np.zeros(n_cols), np.zeros(n_rows))
+
+    for block, values in _column_blocks(matrix, memory):
+        diagonal = np.arange(block.start, min(block.stop, n_rows))
+
+        if X is not None:
+            ghosh = values * x_inv[:, None]
+            ghosh *= x[None, block]
+            ghosh[diagonal, diagonal - block.start] += x[diagonal] == 0
+            accumulate(ghosh_sums, ghosh, block, diagonal)
+
+        accumulate(sums, values, block, diagonal)
+
+    if X is not None:
+        return sums, ghosh_sums
+
+    return sums
+
+
+def _block_size(n_rows, n_cols, memory=None, copies=3):
+    """number of float64 columns of n_rows fitting (copies times) in the memory budget (MB)"""
+    if memory is None:
+        return n_cols
+
+    size = int(memory * 2 ** 20 // (copies * n_rows * 8))
+
+    return min(n_cols, max(1, size))
+
+
+def _row_blocks(matrix, memory=None):
+    """yields the row slices and a dense float64 copy of the row blocks of a
+    pd.DataFrame (also in sparse storage) within the memory budget (MB)
+    """
+    values = to_spmatrix(matrix).tocsr() if is_sparse(matrix) else matrix.values
+    n_rows, n_cols = values.shape
+    size = _block_size(n_cols, n_rows, memory)
+
+    for start in range(0, n_rows, size):
+        block = slice(start, min(start + size, n_rows))
+        rows = values[block]
+        rows = rows.toarray() if sparse.issparse(rows) else rows
+
+        yield block, np.array(rows, dtype=np.float64)
+
+
+def _column_blocks(matrix, memory=None):
+    """yields the column slices and a float64 copy of the column blocks of a
+    matrix (pd.DataFrame, np.ndarray or np.memmap) within the memory budget (MB)
+    """
+    values = matrix.values if isinstance(matrix, pd.DataFrame) else matrix
+    n_rows, n_cols = values.shape
+    size = _block_size(n_rows, n_cols, memory)
+
+    for start in range(0, n_cols, size):
+        block = slice(start, min(start + size, n_cols))
+        yield block, np.array(values[:, block], dtype=np.float64)
 
@@ -8,6 +8,7 @@ import pandas as pd
 import logging
 from mario.log_exc.logger import log_time
 from mario.log_exc.exceptions import WrongInput
+from mario.tools.utilities import to_dense
 from mario.tools.constants import (
     _MASTER_INDEX,
     _SHOCKS,
@@ -173,14 +174,14 @@ def V_shock(instance, path, matrix, boolean, clusters, to_baseline):
 
     notes = []
     if matrix == "V":
-        v = copy.deepcopy(instance.v)
-        V = copy.deepcopy(instance.V)
+        v = to_dense(copy.deepcopy(instance.v))
+        V = to_dense(copy.deepcopy(instance.V))
         X = copy.deepcopy(instance.X)
         _id = "f"
 
     else:
-        v = copy.deepcopy(instance.e)
-        V = copy.deepcopy(instance.E)
+        v = to_dense(copy.deepcopy(instance.e))
+        V = to_dense(copy.deepcopy(instance.E))
         X = copy.deepcopy(instance.X)
         _id = "k"
 
@@ -290,11 +291,11 @@ def V_shock(instance, path, matrix, boolean, clusters, to_baseline):
 
 def Z_shock(instance, path, boolean, clusters, to_baseline):
 
-    z = copy.deepcopy(instance.z)
+    z = to_dense(copy.deepcopy(instance.z))
 
     notes = []
     if boolean:
-        Z = copy.deepcopy(instance.Z)
+        Z = to_dense(copy.deepcopy(instance.Z))
         X = copy.deepcopy(instance.X)
         if isinstance(path, str):
             info = pd.read_excel(path, "z", header=[0])
@@ -16,10 +16,17 @@ from mario.tools.tableparser import (
 )
 
 from mario.log_exc.exceptions import WrongInput, LackOfInput
+from mario.tools.constants import _ACCEPTABLES
 
 models = {"Database": Database}
 
 
+def _check_precision(precision):
+    """checks the precision before the matrices are read in it"""
+    if precision not in _ACCEPTABLES["precision"]:
+        raise WrongInput(f"Acceptable precisions are {_ACCEPTABLES['precision']}")
+
+
 def parse_from_txt(
     path,
     table,
@@ -29,6 +36,8 @@ def parse_from_txt(
     name=None,
     source=None,
     model="Database",
+    storage="dense",
+    precision="float64",
     **kwargs,
 ):
 
@@ -65,6 +74,13 @@ def parse_from_txt(
     name : str, Optional
         optional but suggested. is useful for visualization and metadata.
 
+    storage : str, Optional
+        'dense' (default) or 'sparse'. In 'sparse' mode z, Z, e, E, v, V are stored as sparse matrices
+
+    precision : str, Optional
+        'float64' (default) or 'float32'. the floating point precision in which the matrices are stored.
+        Every matrix is cast as soon as its file is read, so float32 also lowers the peak memory of parsing
+
     Returns
     -------
     mario.Database
@@ -72,7 +88,8 @@ def parse_from_txt(
     if model not in models:
         raise WrongInput("Available models are {}".format([*models]))
 
-    matrices, indeces, units = txt_praser(path, table, mode)
+    _check_precision(precision)
+    matrices, indeces, units = txt_praser(path, table, mode, precision)
 
     return models[model](
         name=name,
@@ -80,6 +97,8 @@ def parse_from_txt(
         source=source,
         year=year,
         init_by_parsers={"matrices": matrices, "_indeces": indeces, "units": units},
+        storage=storage,
+        precision=precision,
         calc_all=calc_all,
         **kwargs,
     )
@@ -96,6 +115,8 @@ def parse_from_excel(
     name=None,
     source=None,
     model="Database",
+    storage="dense",
+    precision="float64",
     **kwargs,
 ):
 
@@ -138,6 +159,13 @@ def parse_from_excel(
     name : str, Optional
         optional but suggested. is useful for visualization and metadata.
 
+    storage : str, Optional
+        'dense' (default) or 'sparse'. In 'sparse' mode z, Z, e, E, v, V are stored as sparse matrices
+
+    precision : str, Optional
+        'float64' (default) or 'float32'. the floating point precision in which the matrices are stored.
+        The tables are read in float64 and cast after parsing, so float32 lowers only the memory after loading
+
     Returns
     -------
     mario.Database
@@ -154,13 +182,15 @@ def parse_from_excel(
         source=source,
         year=year,
         init_by_parsers={"matrices": matrices, "_indeces": indeces, "units": units},
+        storage=storage,
+        precision=precision,
         calc_all=calc_all,
         **kwargs,
     )
 
 
 def parse_exiobase_sut(
-    path, calc_all=False, name=None, year=None, model="Database", **kwargs,
+    path, calc_all=False, name=None, year=None, model="Database", storage="dense", precision="float64", **kwargs,
 ):
 
     """Parsing exiobase mrsut
@@ -183,6 +213,13 @@ def parse_exiobase_sut(
     name : str, Optional
         optional but suggested. is useful for visualization and metadata.
 
+    storage : str, Optional
+        'dense' (default) or 'sparse'. In 'sparse' mode z, Z, e, E, v, V are stored as sparse matrices
+
+    precision : str, Optional
+        'float64' (default) or 'float32'. the floating point precision in which the matrices are stored.
+        Every matrix is cast as soon as its file is read, so float32 also lowers the peak memory of parsing
+
     Returns
     -------
     mario.Database
@@ -191,7 +228,8 @@ def parse_exiobase_sut(
     if model not in models:
         raise WrongInput("Available models are {}".format([*models]))
 
-    matrices, indeces, units = monetary_sut_exiobase(path,)
+    _check_precision(precision)
+    matrices, indeces, units = monetary_sut_exiobase(path, precision)
 
     return models[model](
         name=name,
@@ -199,6 +237,8 @@ def parse_exiobase_sut(
         source="Exiobase Monetary Multi Regional Supply and Use Table (https://www.exiobase.eu/)",
         year=year,
         init_by_parsers={"matrices": matrices, "_indeces": indeces, "units": units},
+        storage=storage,
+        precision=precision,
         calc_all=calc_all,
         **kwargs,
     )
@@ -211,6 +251,8 @@ def parse_exiobase_3(
     name=None,
     model="Database",
     version="3.8.2",
+    storage="dense",
+    precision="float64",
     **kwargs,
 ):
 
@@ -241,6 +283,13 @@ def parse_exiobase_3(
             * 3.8.2: F_Y for the final demand satellite account
             * 3.8.1: F_hh for the final demand satellite account
 
+    storage : str, Optional
+        'dense' (default) or 'sparse'. In 'sparse' mode z, Z, e, E, v, V are stored as sparse matrices
+
+    precision : str, Optional
+        'float64' (default) or 'float32'. the floating point precision in which the matrices are stored.
+        Every matrix is cast as soon as its file is read, so float32 also lowers the peak memory of parsing
+
     Returns
     -------
     mario.Database
@@ -251,7 +300,8 @@ def parse_exiobase_3(
 
     if version not in ["3.8.2", "3.8.1"]:
         raise WrongInput("Acceptable versions are {}".format(["3.8.2", "3.8.1"]))
-    matrices, indeces, units = exio3(path, version)
+    _check_precision(precision)
+    matrices, indeces, units = exio3(path, version, precision)
 
     return models[model](
         name=name,
@@ -259,6 +309,8 @@ def parse_exiobase_3(
         source="Exiobase3",
         year=year,
         init_by_parsers={"matrices": matrices, "_indeces": indeces, "units": units},
+        storage=storage,
+        precision=precision,
         calc_all=calc_all,
         **kwargs,
     )
@@ -274,6 +326,8 @@ def parse_eora(
     name=None,
     calc_all=False,
     model="Database",
+    storage="dense",
+    precision="float64",
     **kwargs,
 ) -> object:
     """Parsing eora databases
@@ -313,6 +367,14 @@ def parse_eora(
     calc_all : boolean
         if True, will calculate the main missing matrices
 
+    storage : str, Optional
+        'dense' (default) or 'sparse'. In 'sparse' mode z, Z, e, E, v, V are stored as sparse matrices
+
+    precision : str, Optional
+        'float64' (default) or 'float32'. the floating point precision in which the matrices are stored.
+        For multi region Eora every matrix is cast as soon as its file is read, so float32 also lowers the
+        peak memory of parsing. The single region tables are read in float64 and cast after parsing
+
     Returns
     -------
     mario.Database
@@ -326,8 +388,9 @@ def parse_eora(
                 "For multi region Eora, the year and indeces path should be defined"
             )
 
+        _check_precision(precision)
         matrices, indeces, units = eora_multi_region(
-            data_path=path, index_path=indeces, year=year, price="bp"
+            data_path=path, index_path=indeces, year=year, price="bp", precision=precision
         )
 
         kwargs["notes"] = [
@@ -347,6 +410,8 @@ def parse_eora(
         year=year,
         source="Eora website @ https://www.worldmrio.com/",
         init_by_parsers={"matrices": matrices, "_indeces": indeces, "units": units},
+        storage=storage,
+        precision=precision,
         calc_all=calc_all,
         **kwargs,
     )
@@ -373,6 +438,8 @@ def parse_eurostat(
     model="Database",
     name=None,
     calc_all=False,
+    storage="dense",
+    precision="float64",
     **kwargs,
 ) -> object:
 
@@ -415,6 +482,13 @@ def parse_eurostat(
     calc_all : bool, Optional
         if True, will calculate the main missing matrices
 
+    storage : str, Optional
+        'dense' (default) or 'sparse'. In 'sparse' mode z, Z, e, E, v, V are stored as sparse matrices
+
+    precision : str, Optional
+        'float64' (default) or 'float32'. the floating point precision in which the matrices are stored.
+        The tables are read in float64 and cast after parsing, so float32 lowers only the memory after loading
+
     Returns
     -------
     mario.Database
@@ -441,6 +515,8 @@ def parse_eurostat(
         source="eurostat",
         year=year,
         init_by_parsers={"matrices": matrices, "_indeces": indeces, "units": units},
+        storage=storage,
+        precision=precision,
         calc_all=calc_all,
         **kwargs,
     )
@@ -450,7 +526,9 @@ def parse_from_pymrio(
     io,
     value_added,
     satellite_account,
-    include_meta=True
+    include_meta=True,
+    storage="dense",
+    precision="float64",
     ):
     """Parsing a pymrio database
 
@@ -470,6 +548,13 @@ def parse_from_pymrio(
     include_meta : bool
         if True, will record the pymrio.meta into mario.meta
 
+    storage : str, Optional
+        'dense' (default) or 'sparse'. In 'sparse' mode z, Z, e, E, v, V are stored as sparse matrices
+
+    precision : str, Optional
+        'float64' (default) or 'float32'. the floating point precision in which the matrices are stored.
+        The tables are read in float64 and cast after parsing, so float32 lowers only the memory after loading
+
     Returns:
        mario.Database
     """
@@ -489,5 +574,7 @@ def parse_from_pymrio(
         table="IOT",
         init_by_parsers={"matrices": matrices, "_indeces": indeces, "units": units},
         notes=notes,
+        storage=storage,
+        precision=precision,
     )
 
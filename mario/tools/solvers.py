@@ -0,0 +1,1154 @@
+# -*- coding: utf-8 -*-
+"""
+this module contains the solvers of the Leontief system (I - z)
+"""
+import numpy as np
+import pandas as pd
+import inspect
+from scipy import sparse
+from scipy.linalg import lu_factor, lu_solve
+from scipy.sparse.linalg import (
+    splu,
+    spilu,
+    gmres,
+    bicgstab,
+    eigs,
+    onenormest,
+    LinearOperator,
+    ArpackNoConvergence,
+)
+from scipy.optimize import linprog
+
+from mario.log_exc.logger import log_time
+from mario.log_exc.exceptions import WrongInput
+from mario.tools.utilities import is_sparse, to_spmatrix, float_dtype
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LeontiefSolver:
+
+    """Factorized Leontief system
+
+    .. math::
+        (I - z) = P\cdot L\cdot U
+
+    The LU factorization of (I - z) is computed once when the solver is built
+    and is reused to answer every query through triangular solves, so that the
+    Leontief inverse never needs to be materialized.
+
+    Notes
+    -----
+    The solver works on numpy arrays. Labels are kept only to be used by the
+    iomath functions when wrapping the results into pd.DataFrames.
+
+    If z is stored in sparse format, a sparse LU (SuperLU) is used and (I - z)
+    is never densified.
+
+    After every solve, the info attribute reports how the last system was solved.
+    """
+
+    _factor_dtype = np.float64
+
+    def __init__(self, z):
+
+        """Factorizes (I - z)
+
+        Parameters
+        ----------
+        z : pd.DataFrame
+            Intersectoral transaction coefficients matrix
+        """
+        self.index = z.index
+        self.columns = z.columns
+        self.shape = z.shape
+        self.sparse = is_sparse(z)
+        # precision in which z is stored (not the one of the factorization)
+        self.dtype = float_dtype(z)
+        self.info = {}
+
+        self._lu = self._factorize(z)
+
+    def _factorize(self, z):
+        """LU factorization of (I - z) in the precision of the solver"""
+        dtype = self._factor_dtype
+
+        if self.sparse:
+            A = sparse.identity(z.shape[0], dtype=dtype, format="csc")
+            A = A - to_spmatrix(z).astype(dtype)
+            return splu(A.tocsc())
+
+        A = np.eye(z.shape[0], dtype=dtype)
+        A -= z.values
+
+        return lu_factor(A, overwrite_a=True, check_finite=False)
+
+    def _lu_solve(self, B, trans):
+        """triangular solves against the stored factorization"""
+        B = np.asarray(B, dtype=self._factor_dtype)
+
+        if self.sparse:
+            return self._lu.solve(B, trans="T" if trans else "N")
+
+        return lu_solve(self._lu, B, trans=int(trans), check_finite=False)
+
+    def solve(self, B, trans=False):
+        """Solves the Leontief system for one or more right hand sides
+
+        .. math::
+            x = (I - z)^{-1} B
+
+        Parameters
+        ----------
+        B : np.ndarray, pd.DataFrame, pd.Series
+            right hand side(s) of the system (one column per system)
+
+        trans : boolean
+            if True, solves the transposed system :math:`(I - z)^{T} x = B`
+
+        Returns
+        -------
+        np.ndarray
+        """
+        x = self._lu_solve(_as_array(B), trans)
+        self.info = {"method": "lu"}
+
+        return x
+
+    def inverse(self, out=None, block_size=None):
+        """Builds the dense Leontief inverse from the factorization
+
+        .. math::
+            w = (I - z)^{-1}
+
+        Parameters
+        ----------
+        out : np.ndarray, np.memmap, Optional
+            array of shape (n, n) in which the inverse is written
+
+        block_size : int, Optional
+            number of columns solved at once. If given, the inverse is built
+            in column blocks so that only one block of the identity and of
+            the solution are in memory at the same time
+
+        Returns
+        -------
+        np.ndarray
+        """
+        n = self.shape[0]
+
+        if out is None and block_size is None:
+            return self.solve(np.eye(n))
+
+        if out is None:
+            out = np.empty(self.shape)
+
+        block_size = n if block_size is None else block_size
+
+        for start in range(0, n, block_size):
+            stop = min(start + block_size, n)
+            identity = np.zeros((n, stop - start))
+            identity[start:stop] = np.eye(stop - start)
+
+            out[:, start:stop] = self.solve(identity)
+
+        return out
+
+
+class MixedPrecisionSolver(LeontiefSolver):
+
+    """Mixed precision Leontief system
+
+    (I - z) is factorized in float32, halving the memory and the bandwidth of
+    the factorization, and every solve is refined in float64:
+
+    .. math::
+        r_k = B - (I - z)\cdot x_k
+
+    .. math::
+        x_{k+1} = x_k + (LU)^{-1}_{float32}\cdot r_k
+
+    until the relative residual :math:`||r_k|| / ||B||` is below tol.
+
+    Notes
+    -----
+    The residuals are computed against z in the precision it is stored, so
+    if z is stored in float32 the achievable accuracy is the one of the stored
+    data. The history of the relative residuals of the last solve is reported
+    in info['residuals'].
+    """
+
+    _factor_dtype = np.float32
+
+    def __init__(self, z, tol=1e-12, max_iter=20):
+
+        """Factorizes (I - z) in float32
+
+        Parameters
+        ----------
+        z : pd.DataFrame
+            Intersectoral transaction coefficients matrix
+
+        tol : float
+            the relative residual at which the refinement stops
+
+        max_iter : int
+            maximum number of refinement steps
+        """
+        super().__init__(z)
+        self.tol = tol
+        self.max_iter = max_iter
+        self._z = to_spmatrix(z) if self.sparse else z.values
+
+    def _residual(self, B, x, trans):
+        """float64 residual of the Leontief system"""
+        z = self._z.T if trans else self._z
+
+        return B - x + z @ x
+
+    def solve(self, B, trans=False):
+        """Solves the Leontief system with iterative refinement
+
+        Parameters
+        ----------
+        B : np.ndarray, pd.DataFrame, pd.Series
+            right hand side(s) of the system (one column per system)
+
+        trans : boolean
+            if True, solves the transposed system :math:`(I - z)^{T} x = B`
+
+        Returns
+        -------
+        np.ndarray
+        """
+        B = np.asarray(_as_array(B), dtype=np.float64)
+        norm = _norm(B)
+
+        x = self._lu_solve(B, trans).astype(np.float64)
+        r = self._residual(B, x, trans)
+        residuals = [float(np.max(np.linalg.norm(r, axis=0) / norm))]
+
+        while residuals[-1] > self.tol and len(residuals) <= self.max_iter:
+            x += self._lu_solve(r, trans)
+            r = self._residual(B, x, trans)
+            residuals.append(float(np.max(np.linalg.norm(r, axis=0) / norm)))
+
+        converged = residuals[-1] <= self.tol
+        self.info = {
+            "method": "mixed",
+            "iterations": len(residuals) - 1,
+            "residuals": residuals,
+            "converged": converged,
+        }
+
+        if not converged:
+            log_time(
+                logger,
+                f"Solver: mixed precision refinement did not reach tol={self.tol} "
+                f"after {self.max_iter} steps (residual = {residuals[-1]:.2e})",
+                "warn",
+            )
+
+        return x
+
+
+class IterativeSolver(LeontiefSolver):
+
+    """Iterative Leontief system
+
+    No factorization is computed: every right hand side is solved by a
+    Krylov method (GMRES or BiCGSTAB) or by the Neumann series
+
+    .. math::
+        x_{k+1} = B + z\cdot x_k
+
+    that converges as z is productive. Every iteration costs one product by z,
+    so on sparse tables a query costs a handful of sparse mat-vecs instead of a
+    factorization of (I - z).
+
+    Notes
+    -----
+    The Krylov methods solve one right hand side at a time, while the Neumann
+    series iterates all of them together. The iterations and the relative
+    residuals :math:`||B - (I - z)\cdot x|| / ||B||` of the last solve are
+    reported in info.
+    """
+
+    _algorithms = ["gmres", "bicgstab", "neumann"]
+    _preconditioners = ["jacobi", "ilu", None]
+
+    def __init__(
+        self, z, algorithm="gmres", preconditioner="jacobi", tol=1e-10, max_iter=1000
+    ):
+
+        """Builds the operator (I - z)
+
+        Parameters
+        ----------
+        z : pd.DataFrame
+            Intersectoral transaction coefficients matrix
+
+        algorithm : str
+            'gmres', 'bicgstab' or 'neumann'
+
+        preconditioner : str, None
+            'jacobi', 'ilu' or None. Not used by the 'neumann' algorithm
+
+        tol : float
+            relative residual at which the iterations stop
+
+        max_iter : int
+            maximum number of iterations for every right hand side (at least 1)
+        """
+        if algorithm not in self._algorithms:
+            raise WrongInput(f"Acceptable algorithms are {self._algorithms}")
+
+        if max_iter < 1:
+            raise WrongInput("max_iter should be at least 1.")
+
+        if preconditioner not in self._preconditioners:
+            raise WrongInput(
+                f"Acceptable preconditioners are {self._preconditioners}"
+            )
+
+        self.algorithm = algorithm
+        self.preconditioner = preconditioner
+        self.tol = tol
+        self.max_iter = max_iter
+        self._preconditioner = {}
+
+        super().__init__(z)
+
+    def _factorize(self, z):
+        """stores z and (I - z) without factorizing them"""
+        if self.sparse:
+            self._z = to_spmatrix(z).tocsr()
+            self._A = (sparse.identity(z.shape[0], format="csr") - self._z).tocsr()
+        else:
+            self._z = z.values
+            self._A = np.eye(z.shape[0]) - self._z
+
+        return None
+
+    def _operator(self, trans):
+        """(I - z) or its transpose"""
+        return self._A.T if trans else self._A
+
+    def _get_preconditioner(self, trans):
+        """builds (once) the preconditioner of the (transposed) system"""
+        if self.preconditioner is None:
+            return None
+
+        if trans not in self._preconditioner:
+            A = self._operator(trans)
+
+            if self.preconditioner == "jacobi":
+                diagonal = 1 / A.diagonal()
+                matvec = lambda x: diagonal * x
+            else:
+                ilu = spilu(sparse.csc_matrix(A))
+                matvec = ilu.solve
+
+            self._preconditioner[trans] = LinearOperator(
+                A.shape, matvec=matvec, dtype=np.float64
+            )
+
+        return self._preconditioner[trans]
+
+    def _krylov(self, A, b, M):
+        """solves one right hand side, returning the solution and the iterations"""
+        counter = [0]
+
+        def callback(*args):
+            counter[0] += 1
+
+        kwargs = dict(maxiter=self.max_iter, M=M, callback=callback, atol=0)
+        kwargs[_TOL] = self.tol
+
+        if self.algorithm == "gmres":
+            x, _ = gmres(A, b, callback_type="pr_norm", **kwargs)
+        else:
+            x, _ = bicgstab(A, b, **kwargs)
+
+        return x, counter[0]
+
+    def _neumann(self, B, trans):
+        """Neumann series for all the right hand sides"""
+        z = self._z.T if trans else self._z
+        norm = _norm(B)
+
+        x = B.copy()
+        iteration = 0
+        for iteration in range(1, self.max_iter + 1):
+            x_new = B + z @ x
+            step = np.max(np.linalg.norm(x_new - x, axis=0) / norm)
+            x = x_new
+
+            if step <= self.tol:
+                break
+
+        return x, iteration
+
+    def solve(self, B, trans=False):
+        """Solves the Leontief system iteratively
+
+        Parameters
+        ----------
+        B : np.ndarray, pd.DataFrame, pd.Series
+            right hand side(s) of the system (one column per system)
+
+        trans : boolean
+            if True, solves the transposed system :math:`(I - z)^{T} x = B`
+
+        Returns
+        -------
+        np.ndarray
+        """
+        B = np.asarray(_as_array(B), dtype=np.float64)
+        vector = B.ndim == 1
+        B = B.reshape(B.shape[0], -1)
+
+        if self.algorithm == "neumann":
+            x, iterations = self._neumann(B, trans)
+            iterations = [iterations] * B.shape[1]
+        else:
+            A = self._operator(trans)
+            M = self._get_preconditioner(trans)
+
+            x = np.zeros_like(B)
+            iterations = []
+            for column in range(B.shape[1]):
+                x[:, column], its = self._krylov(A, B[:, column], M)
+                iterations.append(its)
+
+        residuals = np.linalg.norm(B - self._operator(trans) @ x, axis=0) / _norm(B)
+        converged = bool(np.all(residuals <= self.tol))
+
+        self.info = {
+            "method": "iterative",
+            "algorithm": self.algorithm,
+            "iterations": iterations,
+            "residuals": residuals.tolist(),
+            "converged": converged,
+        }
+
+        if not converged:
+            log_time(
+                logger,
+                f"Solver: {self.algorithm} did not reach tol={self.tol} "
+                f"after {self.max_iter} iterations "
+                f"(residual = {residuals.max():.2e})",
+                "warn",
+            )
+
+        return x[:, 0] if vector else x
+
+
+class RegionBlockSolver(LeontiefSolver):
+
+    """Region-block Leontief system for multi-regional tables
+
+    (I - z) is split in region x region blocks following the Region level of
+    the index. Only the diagonal (domestic) blocks are factorized, while the
+    off-diagonal (trade) blocks are kept as a sparse coupling matrix C:
+
+    .. math::
+        (I - z) = D - C
+
+    The system of the world is solved by block iterations
+
+    .. math::
+        x_{k+1} = D^{-1}(B + C\cdot x_k)
+
+    that converge as (I - z) is an M-matrix, and the production of a single
+    region r is solved exactly through the Schur complement of the block of r
+    over the rest of the world R
+
+    .. math::
+        S_r = A_{rr} - A_{rR}\cdot A_{RR}^{-1}\cdot A_{Rr}
+
+    .. math::
+        x_r = S_r^{-1}(B_r - A_{rR}\cdot A_{RR}^{-1}\cdot B_R)
+
+    where :math:`A_{RR}^{-1}` is never built but is applied by block
+    iterations on the rest of the world. The factorizations scale with the
+    size of the regions instead of the size of the world.
+
+    Notes
+    -----
+    The iterations and the relative residuals of the last solve are reported
+    in info. The LU factorization of every Schur complement is cached.
+    """
+
+    def __init__(self, z, tol=1e-12, max_iter=1000):
+
+        """Factorizes the diagonal region blocks of (I - z)
+
+        Parameters
+        ----------
+        z : pd.DataFrame
+            Intersectoral transaction coefficients matrix with the Region level
+            as the first level of the index
+
+        tol : float
+            relative step at which the block iterations stop
+
+        max_iter : int
+            maximum number of block iterations (at least 1)
+        """
+        if max_iter < 1:
+            raise WrongInput("max_iter should be at least 1.")
+
+        self.tol = tol
+        self.max_iter = max_iter
+
+        regions = z.index.get_level_values(0)
+        self.regions = regions.unique().tolist()
+        self._groups = {
+            region: np.flatnonzero(regions == region) for region in self.regions
+        }
+        self._schur = {}
+
+        super().__init__(z)
+
+    def _factorize(self, z):
+        """LU factorization of the diagonal blocks and sparse coupling blocks"""
+        z = to_spmatrix(z).tocoo() if self.sparse else sparse.coo_matrix(z.values)
+
+        region = np.empty(z.shape[0], dtype=int)
+        for number, group in enumerate(self._groups.values()):
+            region[group] = number
+
+        trade = region[z.row] != region[z.col]
+        self._A = (sparse.identity(z.shape[0], format="csr") - z.tocsr()).tocsr()
+        self._coupling = sparse.csr_matrix(
+            (z.data[trade], (z.row[trade], z.col[trade])), shape=z.shape
+        )
+
+        return {
+            region: lu_factor(
+                self._A[group][:, group].toarray(), check_finite=False
+            )
+            for region, group in self._groups.items()
+        }
+
+    def _positions(self, regions):
+        """positions of the regions in the index and their local slices"""
+        positions = np.concatenate([self._groups[region] for region in regions])
+        local, start = {}, 0
+        for region in regions:
+            local[region] = slice(start, start + len(self._groups[region]))
+            start = local[region].stop
+
+        return positions, local
+
+    def _block_iterations(self, B, regions, trans):
+        """solves the subsystem of the given regions by block iterations (B and
+        the solution are ordered as the positions of the regions)
+        """
+        positions, local = self._positions(regions)
+        coupling = self._coupling[positions][:, positions]
+        coupling = coupling.T.tocsr() if trans else coupling
+        norm = _norm(B)
+
+        def diagonal_solve(rhs):
+            out = np.empty_like(rhs)
+            for region in regions:
+                out[local[region]] = lu_solve(
+                    self._lu[region], rhs[local[region]], trans=int(trans)
+                )
+            return out
+
+        x = diagonal_solve(B)
+        iteration, step = 0, np.inf
+        for iteration in range(1, self.max_iter + 1):
+            x_new = diagonal_solve(B + coupling @ x)
+            step = np.max(np.linalg.norm(x_new - x, axis=0) / norm)
+            x = x_new
+
+            if step <= self.tol:
+                break
+
+        if step > self.tol:
+            log_time(
+                logger,
+                f"Solver: region block iterations did not reach tol={self.tol} "
+                f"after {self.max_iter} iterations (step = {step:.2e})",
+                "warn",
+            )
+
+        return x, iteration, step <= self.tol
+
+    def _system(self, trans):
+        """(I - z) or its transpose"""
+        return self._A.T.tocsr() if trans else self._A
+
+    def solve(self, B, trans=False):
+        """Solves the Leontief system of the world by block iterations
+
+        Parameters
+        ----------
+        B : np.ndarray, pd.DataFrame, pd.Series
+            right hand side(s) of the system (one column per system)
+
+        trans : boolean
+            if True, solves the transposed system :math:`(I - z)^{T} x = B`
+
+        Returns
+        -------
+        np.ndarray
+        """
+        B = np.asarray(_as_array(B), dtype=np.float64)
+        vector = B.ndim == 1
+        B = B.reshape(B.shape[0], -1)
+
+        positions = self._positions(self.regions)[0]
+        x = np.empty_like(B)
+        x[positions], iterations, converged = self._block_iterations(
+            B[positions], self.regions, trans
+        )
+
+        self.info = {
+            "method": "region",
+            "iterations": iterations,
+            "residuals": (
+                np.linalg.norm(B - self._system(trans) @ x, axis=0) / _norm(B)
+            ).tolist(),
+            "converged": converged,
+        }
+
+        return x[:, 0] if vector else x
+
+    def solve_region(self, region, B, trans=False):
+        """Solves the production of one region through its Schur complement
+
+        Parameters
+        ----------
+        region : str
+            the region to solve for
+
+        B : np.ndarray, pd.DataFrame, pd.Series
+            right hand side(s) of the system of the world (one column per system)
+
+        trans : boolean
+            if True, solves the transposed system :math:`(I - z)^{T} x = B`
+
+        Returns
+        -------
+        np.ndarray
+            the rows of the solution for the region
+        """
+        if region not in self._groups:
+            raise WrongInput(f"Acceptable regions are {self.regions}")
+
+        B = np.asarray(_as_array(B), dtype=np.float64)
+        vector = B.ndim == 1
+        B = B.reshape(B.shape[0], -1)
+
+        A = self._system(trans)
+        rows = self._groups[region]
+        rest = [item for item in self.regions if item != region]
+        rest_rows = self._positions(rest)[0] if rest else np.array([], dtype=int)
+
+        A_rR = A[rows][:, rest_rows]
+        iterations, converged = 0, True
+
+        if (region, trans) not in self._schur:
+            schur = A[rows][:, rows].toarray()
+            if rest:
+                A_Rr = A[rest_rows][:, rows].toarray()
+                coupled = np.flatnonzero(np.abs(A_Rr).sum(0))
+                if coupled.size:
+                    y, iterations, converged = self._block_iterations(
+                        A_Rr[:, coupled], rest, trans
+                    )
+                    schur[:, coupled] -= A_rR @ y
+
+            self._schur[(region, trans)] = lu_factor(schur, check_finite=False)
+
+        rhs = B[rows].copy()
+        if rest and np.any(B[rest_rows]):
+            y, its, done = self._block_iterations(B[rest_rows], rest, trans)
+            iterations, converged = max(iterations, its), converged and done
+            rhs -= A_rR @ y
+
+        x = lu_solve(self._schur[(region, trans)], rhs, check_finite=False)
+
+        self.info = {
+            "method": "region",
+            "region": region,
+            "iterations": iterations,
+            "converged": converged,
+        }
+
+        return x[:, 0] if vector else x
+
+    def solve_local(self, region, B, trans=False):
+        """Solves the domestic system of one region on its diagonal block
+
+        .. math::
+            x_r = (I - z_{rr})^{-1} B_r
+
+        Parameters
+        ----------
+        region : str
+            the region to solve for
+
+        B : np.ndarray, pd.DataFrame, pd.Series
+            right hand side(s) of the system of the region (one column per system)
+
+        trans : boolean
+            if True, solves the transposed system :math:`(I - z_{rr})^{T} x = B`
+
+        Returns
+        -------
+        np.ndarray
+        """
+        if region not in self._groups:
+            raise WrongInput(f"Acceptable regions are {self.regions}")
+
+        B = np.asarray(_as_array(B), dtype=np.float64)
+        vector = B.ndim == 1
+        x = lu_solve(
+            self._lu[region], B.reshape(B.shape[0], -1), trans=int(trans), check_finite=False
+        )
+
+        return x[:, 0] if vector else x
+
+
+class WoodburySolver(LeontiefSolver):
+
+    """Leontief system of a low-rank change of z
+
+    If the new coefficients differ from the ones of an existing solver only
+    in k columns (or rows), the change is written as
+
+    .. math::
+        z_{new} - z = U\cdot V^{T}
+
+    and the new system is solved through the existing solver with the
+    Sherman-Morrison-Woodbury formula
+
+    .. math::
+        (I - z_{new})^{-1} B = y + W\cdot C^{-1}\cdot V^{T}\cdot y
+
+    where :math:`y = (I - z)^{-1} B`, :math:`W = (I - z)^{-1} U` and
+    :math:`C = I_k - V^{T}\cdot W`, so that no new factorization is needed.
+
+    Notes
+    -----
+    Building the solver costs k solves against the existing solver and a
+    k x k factorization. It is built by :func:`low_rank_update`.
+    """
+
+    def __init__(self, z, base, U, V):
+
+        """Builds the low-rank update
+
+        Parameters
+        ----------
+        z : pd.DataFrame
+            the new intersectoral transaction coefficients matrix
+
+        base : mario.tools.solvers.LeontiefSolver
+            the solver of the original system
+
+        U : np.ndarray
+            n x k left factor of the change
+
+        V : np.ndarray
+            n x k right factor of the change
+        """
+        self.base = base
+        self.rank = U.shape[1]
+        self._U = U
+        self._V = V
+        self._update = {}
+
+        super().__init__(z)
+
+    def _factorize(self, z):
+        """no factorization: the terms of the update are built on demand"""
+        return None
+
+    def _terms(self, trans):
+        """W and the factorized capacitance matrix of the (transposed) update"""
+        if trans not in self._update:
+            U, V = (self._V, self._U) if trans else (self._U, self._V)
+            W = self.base.solve(U, trans=trans)
+            capacitance = np.eye(self.rank) - V.T @ W
+
+            self._update[trans] = (W, lu_factor(capacitance, check_finite=False))
+
+        return self._update[trans]
+
+    def solve(self, B, trans=False):
+        """Solves the updated Leontief system
+
+        Parameters
+        ----------
+        B : np.ndarray, pd.DataFrame, pd.Series
+            right hand side(s) of the system (one column per system)
+
+        trans : boolean
+            if True, solves the transposed system :math:`(I - z)^{T} x = B`
+
+        Returns
+        -------
+        np.ndarray
+        """
+        W, capacitance = self._terms(trans)
+        V = self._U if trans else self._V
+
+        y = np.asarray(self.base.solve(_as_array(B), trans=trans), dtype=np.float64)
+        x = y + W @ lu_solve(capacitance, V.T @ y, check_finite=False)
+
+        self.info = {"method": "woodbury", "rank": self.rank, "base": self.base.info}
+
+        return x
+
+
+class BorderedSolver(LeontiefSolver):
+
+    """Leontief system of z closed with respect to k endogenous agents
+
+    The closed coefficients matrix borders z with the consumption
+    coefficients C (n x k), the input coefficients R (k x n) and the
+    coefficients D (k x k) among the endogenous agents (e.g. households)
+
+    .. math::
+        \bar{z} = \begin{bmatrix} z & C \\ R & D \end{bmatrix}
+
+    and the system is solved by block elimination through the existing
+    solver of (I - z)
+
+    .. math::
+        x_{2} = S^{-1}(B_{2} + R\cdot (I - z)^{-1} B_{1})
+
+    .. math::
+        x_{1} = (I - z)^{-1} (B_{1} + C\cdot x_{2})
+
+    where :math:`S = I_k - D - R\cdot (I - z)^{-1} C` is the Schur complement,
+    so that the (n + k) system is never factorized.
+
+    Notes
+    -----
+    Building the solver costs k solves against the existing solver and a
+    k x k factorization.
+    """
+
+    def __init__(self, base, C, R, D=None):
+
+        """Borders the solver of (I - z)
+
+        Parameters
+        ----------
+        base : mario.tools.solvers.LeontiefSolver
+            the solver of the open system (I - z)
+
+        C : pd.DataFrame
+            n x k coefficients of the sectors in the endogenous agents (columns)
+
+        R : pd.DataFrame
+            k x n coefficients of the endogenous agents (rows) in the sectors
+
+        D : pd.DataFrame, Optional
+            k x k coefficients among the endogenous agents (null if not given)
+        """
+        k = R.shape[0]
+
+        if C.shape != (base.shape[0], k) or R.shape != (k, base.shape[1]):
+            raise WrongInput(
+                f"C and R should be of shape {(base.shape[0], k)} and {(k, base.shape[1])}."
+            )
+
+        self.base = base
+        self.rank = k
+        self.index = base.index.append(R.index)
+        self.columns = base.columns.append(C.columns)
+        self.shape = (base.shape[0] + k, base.shape[1] + k)
+        self.sparse = base.sparse
+        self.dtype = base.dtype
+        self.info = {}
+
+        self._C = np.asarray(_as_array(C), dtype=np.float64)
+        self._R = np.asarray(_as_array(R), dtype=np.float64)
+        self._D = np.zeros((k, k)) if D is None else np.asarray(_as_array(D), dtype=np.float64)
+        self._terms = {}
+
+        # the Schur complement is factorized once for both the directions
+        W = self._solution(False)
+        self._lu = lu_factor(np.eye(k) - self._D - self._R @ W, check_finite=False)
+
+    def _solution(self, trans):
+        """(I - z)^-1 C (or (I - z)^-T R^T for the transposed system)"""
+        if trans not in self._terms:
+            border = self._R.T if trans else self._C
+            self._terms[trans] = np.asarray(
+                self.base.solve(border, trans=trans), dtype=np.float64
+            )
+
+        return self._terms[trans]
+
+    def solve(self, B, trans=False):
+        """Solves the closed Leontief system
+
+        Parameters
+        ----------
+        B : np.ndarray, pd.DataFrame, pd.Series
+            right hand side(s) of the system (one column per system) of n + k rows
+
+        trans : boolean
+            if True, solves the transposed system :math:`(I - \bar{z})^{T} x = B`
+
+        Returns
+        -------
+        np.ndarray
+        """
+        B = np.asarray(_as_array(B), dtype=np.float64)
+        n = self.base.shape[0]
+
+        if B.shape[0] != self.shape[0]:
+            raise WrongInput(f"B should have {self.shape[0]} rows.")
+
+        W = self._solution(trans)
+        R = self._C.T if trans else self._R
+
+        y = np.asarray(self.base.solve(B[:n], trans=trans), dtype=np.float64)
+        x_2 = lu_solve(self._lu, B[n:] + R @ y, trans=int(trans), check_finite=False)
+        x_1 = y + W @ x_2
+
+        self.info = {"method": "bordered", "rank": self.rank, "base": self.base.info}
+
+        return np.concatenate([x_1, x_2])
+
+
+def low_rank_update(solver, z, z_new, max_rank=20):
+    """Returns a solver of (I - z_new) updating the solver of (I - z)
+
+    Parameters
+    ----------
+    solver : mario.tools.solvers.LeontiefSolver
+        the solver of (I - z)
+
+    z : pd.DataFrame
+        the original intersectoral transaction coefficients matrix
+
+    z_new : pd.DataFrame
+        the new intersectoral transaction coefficients matrix (same labels of z)
+
+    max_rank : int
+        the maximum number of changed columns (or rows) for updating the solver
+
+    Returns
+    -------
+    mario.tools.solvers.LeontiefSolver, None
+        the same solver if z is not changed, a WoodburySolver if the change
+        has at most max_rank columns or rows, None otherwise (a new
+        factorization is needed)
+    """
+    if not (z.index.equals(z_new.index) and z.columns.equals(z_new.columns)):
+        raise WrongInput("z and z_new should have the same index and columns.")
+
+    delta = sparse.csc_matrix(
+        to_spmatrix(z_new).astype(np.float64) - to_spmatrix(z).astype(np.float64)
+    )
+    delta.eliminate_zeros()
+
+    rows = np.unique(delta.indices)
+    columns = np.flatnonzero(np.diff(delta.indptr))
+
+    if not columns.size:
+        return solver
+
+    if min(rows.size, columns.size) > max_rank:
+        return None
+
+    # the change is split on the smaller dimension
+    if columns.size <= rows.size:
+        U = delta[:, columns].toarray()
+        V = _selection(z.shape[1], columns)
+    else:
+        U = _selection(z.shape[0], rows)
+        V = delta[rows].T.toarray()
+
+    return WoodburySolver(z_new, solver, U, V)
+
+
+def spectral_radius(z, tol=1e-8, max_iter=1000):
+    """Estimates the spectral radius of z without its dense eigen-decomposition
+
+    The eigenvalue of largest modulus is found by ARPACK through products
+    by z only. If ARPACK does not converge, it is estimated by power
+    iteration on :math:`z^{2}` (not to be biased by the alternating blocks
+    of SUTs).
+
+    Parameters
+    ----------
+    z : pd.DataFrame
+        Intersectoral transaction coefficients matrix
+
+    tol : float
+        relative tolerance of the estimate
+
+    max_iter : int
+        maximum number of iterations
+
+    Returns
+    -------
+    float
+    """
+    values = _as_operator(z)
+
+    if z.shape[0] < 3:
+        return float(max(abs(np.linalg.eigvals(_as_array(z).astype(np.float64)))))
+
+    try:
+        eigenvalue = eigs(
+            values, k=1, which="LM", tol=tol, maxiter=max_iter, return_eigenvectors=False
+        )
+        return float(abs(eigenvalue[0]))
+
+    except ArpackNoConvergence:
+        log_time(logger, "Solver: ARPACK not converged, spectral radius by power iteration", "warn")
+
+    x = np.ones(z.shape[0]) / z.shape[0]
+    rho = 0
+
+    for _ in range(max_iter):
+        y = values @ (values @ x)
+        norm = np.linalg.norm(y)
+
+        if norm == 0:
+            return 0.0
+
+        rho, previous = np.sqrt(norm / np.linalg.norm(x)), rho
+        x = y / norm
+
+        if abs(rho - previous) <= tol * rho:
+            break
+
+    return float(rho)
+
+
+def condition_number(solver, z):
+    """Estimates the 1-norm condition number of (I - z) with its solver
+
+    .. math::
+        \kappa_{1} = ||I - z||_{1}\cdot ||(I - z)^{-1}||_{1}
+
+    The norm of the inverse is estimated by a few (transposed) solves
+    (scipy.sparse.linalg.onenormest), so the inverse is never built.
+
+    Parameters
+    ----------
+    solver : mario.tools.solvers.LeontiefSolver
+        the solver of (I - z)
+
+    z : pd.DataFrame
+        Intersectoral transaction coefficients matrix
+
+    Returns
+    -------
+    float
+    """
+    values = _as_operator(z)
+    diagonal = values.diagonal()
+
+    absolute = abs(values)
+    norm = np.asarray(absolute.sum(0)).ravel() - abs(diagonal) + abs(1 - diagonal)
+
+    inverse = LinearOperator(
+        solver.shape,
+        matvec=lambda x: solver.solve(x),
+        rmatvec=lambda x: solver.solve(x, trans=True),
+        matmat=lambda X: solver.solve(X),
+        dtype=np.float64,
+    )
+
+    return float(norm.max() * onenormest(inverse))
+
+
+def productivity_slacks(z):
+    """Solves the slack variable problem of the productivity of z
+
+    .. math::
+        \min \sum s \quad s.t. \quad (I - z)\cdot x + s = 1, \; x \geq 0, \; s \geq 0
+
+    The system is productive if all the slacks are null. The problem is
+    solved as a sparse linear program (HiGHS).
+
+    Parameters
+    ----------
+    z : pd.DataFrame
+        Intersectoral transaction coefficients matrix
+
+    Returns
+    -------
+    np.ndarray
+        the slacks of the sectors
+    """
+    n = z.shape[0]
+    identity = sparse.identity(n, format="csr")
+
+    constraints = sparse.hstack(
+        [identity - sparse.csr_matrix(_as_operator(z)), identity], format="csr"
+    )
+
+    result = linprog(
+        c=np.concatenate([np.zeros(n), np.ones(n)]),
+        A_eq=constraints,
+        b_eq=np.ones(n),
+        bounds=(0, None),
+        method="highs",
+    )
+
+    # always feasible (x = 0, s = 1)
+    return result.x[n:]
+
+
+# methods available for solving the Leontief system in a Database
+_SOLVERS = {
+    "lu": LeontiefSolver,
+    "mixed": MixedPrecisionSolver,
+    "iterative": IterativeSolver,
+    "region": RegionBlockSolver,
+}
+
+# keyword of the relative tolerance of the scipy Krylov solvers (renamed in scipy 1.12)
+_TOL = "rtol" if "rtol" in inspect.signature(gmres).parameters else "tol"
+
+
+def _as_operator(z):
+    """z as a float64 np.ndarray or scipy.sparse csr matrix"""
+    if is_sparse(z):
+        return to_spmatrix(z).tocsr().astype(np.float64)
+
+    return np.asarray(z.values, dtype=np.float64)
+
+
+def _as_array(B):
+    """returns the values of a right hand side as a np.ndarray"""
+    if isinstance(B, (pd.DataFrame, pd.Series)):
+        return B.values
+
+    if sparse.issparse(B):
+        return B.toarray()
+
+    return B
+
+
+def _selection(n, positions):
+    """n x k matrix selecting the given positions"""
+    selection = np.zeros((n, len(positions)))
+    selection[positions, np.arange(len(positions))] = 1
+
+    return selection
+
+
+def _norm(B):
+    """column-wise 2-norm of the right hand sides (zero columns are not scaled)"""
+    norm = np.linalg.norm(B, axis=0)
+
+    return np.where(norm == 0, 1, norm)
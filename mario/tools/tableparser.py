@@ -35,8 +35,6 @@ from mario.tools.parsers_id import (
 
 from mario.tools.iomath import (
     calc_X,
-    calc_X_from_w,
-    calc_w,
     calc_X_from_z,
 )
 
@@ -306,7 +304,7 @@ def get_units(units, table, indeces):
     return _
 
 
-def txt_praser(path, table, mode):
+def txt_praser(path, table, mode, precision=None):
 
     if mode == "coefficients":
         v, e, z = list("vez")
@@ -320,6 +318,7 @@ def txt_praser(path, table, mode):
         sub_folder=False,
         sep=",",
         exceptions=("EY"),
+        dtype=precision,
     )
 
     log_time(logger, "Parser: Reading files finished.")
@@ -345,7 +344,9 @@ def txt_praser(path, table, mode):
         read["matrices"]["X"] = calc_X(read["matrices"]["Z"], read["matrices"]["Y"])
 
     else:
-        read["matrices"]["X"] = calc_X_from_w(calc_w(z), read["matrices"]["Y"])
+        read["matrices"]["X"] = calc_X_from_z(
+            read["matrices"]["z"], read["matrices"]["Y"]
+        )
 
     log_time(logger, "Parser: Production matrix calculated and added.")
 
@@ -457,10 +458,12 @@ def excel_parser(path, table, mode, sheet_name, unit_sheet):
     return matrices, indeces, units
 
 
-def exio3(path, version):
+def exio3(path, version, precision=None):
 
     log_time(logger, "Parser: Parsing exiobase database from {}".format(path))
-    read = all_file_reader(path, exiobase_version_3[version], sub_folder=True)
+    read = all_file_reader(
+        path, exiobase_version_3[version], sub_folder=True, dtype=precision
+    )
 
     log_time(logger, "Parser: Parsing finished. Reshaping the datbase to MARIO format.")
     # we need to reshape the V and E matrix from F
@@ -550,10 +553,10 @@ def dataframe_parser(Z, Y, E, V, EY, units, table):
     return matrices, indeces, units
 
 
-def monetary_sut_exiobase(path):
+def monetary_sut_exiobase(path, precision=None):
 
     # reading the files
-    read = all_file_reader(path, exiobase_mrsut, sub_folder=True)
+    read = all_file_reader(path, exiobase_mrsut, sub_folder=True, dtype=precision)
 
     V = read["matrices"]["V"]
     U = read["matrices"]["U"]
@@ -774,7 +777,7 @@ def eora_single_region(path, name_convention="full_name", aggregate_trade=True):
     return matrices, indeces, units
 
 
-def eora_multi_region(data_path, index_path, year, price):
+def eora_multi_region(data_path, index_path, year, price, precision=None):
     """
     Eora 26 multi-region parser
     """
@@ -791,7 +794,7 @@ def eora_multi_region(data_path, index_path, year, price):
 
     # reading the files
     read = all_file_reader(
-        data_path, dict(matrices=parser_ids["matrices"]), sub_folder=False
+        data_path, dict(matrices=parser_ids["matrices"]), sub_folder=False, dtype=precision
     )
 
     Z = copy.deepcopy(read["matrices"]["Z"])
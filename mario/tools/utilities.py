@@ -8,6 +8,7 @@ import numpy as np
 import logging
 import math
 import os
+from scipy import sparse
 
 
 from mario.tools.constants import (
@@ -143,8 +144,12 @@ def check_clusters(index_dict,table,clusters):
                 )
 
 def all_file_reader(
-    path, guide, sub_folder=False, sep="\t", exceptions=[], engine=None
+    path, guide, sub_folder=False, sep="\t", exceptions=[], engine=None, dtype=None
 ):
+    """reads the files of a guide. If dtype is given, every matrix is cast to it
+    as soon as its file is read, so that the matrices read are never all kept
+    in float64 at the same time
+    """
     read = {}
 
     def readers(file_to_read, file):
@@ -168,6 +173,9 @@ def all_file_reader(
                     else inner_value["sheet_name"],
                 )
 
+            if dtype is not None and key == "matrices":
+                read[key][inner_key] = read[key][inner_key].astype(dtype, copy=False)
+
         except FileNotFoundError:
             if inner_key not in exceptions:
                 raise FileNotFoundError(f"No such file or directory: {file}")
@@ -329,3 +337,63 @@ def to_single_index(df):
     return df
 
 # %%
+
+
+def is_sparse(df):
+    """Checks if all the columns of a pd.DataFrame are stored with a sparse dtype"""
+    return (
+        isinstance(df, pd.DataFrame)
+        and df.shape[1] > 0
+        and all(isinstance(dtype, pd.SparseDtype) for dtype in df.dtypes)
+    )
+
+
+def to_sparse(df, dtype="float64"):
+    """Converts a pd.DataFrame to the sparse storage (zeros are not stored)"""
+    if is_sparse(df) and float_dtype(df) == dtype:
+        return df
+
+    return df.astype(pd.SparseDtype(dtype, 0))
+
+
+def to_precision(df, dtype="float64"):
+    """Casts the values of a pd.DataFrame to the given float precision keeping its storage"""
+    if float_dtype(df) == dtype:
+        return df
+
+    if is_sparse(df):
+        return to_sparse(df, dtype)
+
+    return df.astype(dtype)
+
+
+def float_dtype(df):
+    """Returns the numpy dtype in which the values of a pd.DataFrame/pd.Series are stored"""
+    dtypes = df.dtypes if isinstance(df, pd.DataFrame) else [df.dtype]
+    dtypes = [
+        dtype.subtype if isinstance(dtype, pd.SparseDtype) else dtype
+        for dtype in dtypes
+    ]
+
+    return np.result_type(*dtypes) if dtypes else np.dtype("float64")
+
+
+def to_dense(df):
+    """Converts a pd.DataFrame stored in sparse format to the dense storage"""
+    if is_sparse(df):
+        return df.sparse.to_dense()
+
+    return df
+
+
+def to_spmatrix(df):
+    """Returns the values of a pd.DataFrame as a scipy.sparse.csc_matrix"""
+    if is_sparse(df):
+        return df.sparse.to_coo().tocsc()
+
+    return sparse.csc_matrix(df.values)
+
+
+def from_spmatrix(matrix, index, columns):
+    """Wraps a scipy.sparse matrix into a sparse pd.DataFrame with the given labels"""
+    return pd.DataFrame.sparse.from_spmatrix(matrix, index=index, columns=columns)
@@ -20,6 +20,7 @@ setup(
     install_requires=[
         "pandas >= 1.3.3",
         "numpy >= 1.21.2",
+        "scipy >= 1.7.0",
         "xlsxwriter <= 1.3.7",
         "plotly >= 4.12.0",
         "tabulate >= 0.8.9",
@@ -2,7 +2,9 @@
 
 import sys
 import os
+import gc
 from numpy import eye
+import numpy as np
 import pytest
 import pandas.testing as pdt
 import pandas as pd
@@ -21,7 +23,7 @@ from mario.log_exc.exceptions import (
     NotImplementable,
     DataMissing
 )
-from mario import parse_from_excel
+from mario import parse_from_excel, calc_g, calc_households, calc_X_from_z, calc_X
 
 
 @pytest.fixture()
@@ -260,3 +262,393 @@ def test_to_pymrio(CoreDataIOT,CoreDataSUT):
 
     
 
+
+
+def test_calc_X_batch(CoreDataIOT, CoreDataSUT):
+
+    for data in [CoreDataIOT, CoreDataSUT]:
+        X = data.X.values
+
+        by_region = data.calc_X_batch(by="Region")
+        assert set(by_region.columns) == set(data.get_index("Region"))
+        pdt.assert_series_equal(
+            by_region.sum(1), data.X["production"], check_names=False
+        )
+
+        by_category = data.calc_X_batch(by="Consumption category")
+        assert set(by_category.columns) == set(data.get_index("Consumption category"))
+        assert abs(by_category.sum(1).values - X[:, 0]).max() < 1e-6 * abs(X).max()
+
+        assert data.calc_X_batch(by=None).shape[1] == data.Y.shape[1]
+
+        users = data.calc_X_batch(Y={"all": data.Y, "half": data.Y.sum(1) / 2})
+        pdt.assert_series_equal(
+            users["half"] * 2, users["all"], check_names=False
+        )
+
+        with pytest.raises(WrongInput):
+            data.calc_X_batch(by="Item")
+
+        with pytest.raises(WrongInput):
+            data.calc_X_batch(Y=data.Y.iloc[1:])
+
+
+def test_out_of_core(CoreDataIOT,tmp_path):
+
+    links = CoreDataIOT.calc_linkages()
+
+    CoreDataIOT.set_out_of_core(path=f"{tmp_path}/w",memory=0.0005)
+    CoreDataIOT.calc_all(["w"],force_rewrite=True)
+
+    assert len(os.listdir(f"{tmp_path}/w")) == 1
+    pdt.assert_frame_equal(CoreDataIOT.calc_linkages(),links)
+
+    # the file of the previous w is replaced
+    CoreDataIOT.calc_all(["w"],force_rewrite=True)
+    assert len(os.listdir(f"{tmp_path}/w")) == 1
+    pdt.assert_frame_equal(CoreDataIOT.calc_linkages(),links)
+
+    for normalized in [True,False]:
+        pdt.assert_frame_equal(
+            CoreDataIOT.calc_linkages(multi_mode=False,normalized=normalized),
+            load_test("IOT").calc_linkages(multi_mode=False,normalized=normalized),
+        )
+
+    # the files are removed with the database
+    other = load_test("IOT")
+    other.set_out_of_core(path=f"{tmp_path}/other")
+    other.calc_all(["w"])
+    assert len(os.listdir(f"{tmp_path}/other")) == 1
+
+    del other
+    gc.collect()
+    assert not os.listdir(f"{tmp_path}/other")
+
+
+def test_linkages_without_g(CoreDataIOT):
+
+    links = CoreDataIOT.calc_linkages(cut_diag=False)
+    assert "g" not in CoreDataIOT.matrices["baseline"]
+
+    CoreDataIOT.calc_all(["g"])
+    pdt.assert_frame_equal(
+        CoreDataIOT.g, calc_g(CoreDataIOT.b), check_names=False
+    )
+    pdt.assert_frame_equal(CoreDataIOT.calc_linkages(cut_diag=False), links)
+
+
+def test_shock_low_rank(CoreDataIOT):
+
+    sectors = CoreDataIOT.get_index("Sector")
+    shock = pd.DataFrame(
+        {
+            "row region": ["Italy", "RoW"],
+            "row level": ["Sector", "Sector"],
+            "row sector": sectors[:2],
+            "column region": ["Italy", "Italy"],
+            "column level": ["Sector", "Sector"],
+            "column sector": [sectors[2], sectors[2]],
+            "type": ["Percentage", "Percentage"],
+            "value": [0.5, -0.2],
+        }
+    )
+
+    CoreDataIOT.shock_calc({"Z": shock}, z=True, scenario="updated")
+    CoreDataIOT.shock_calc({"Z": shock}, z=True, scenario="factorized", max_rank=0)
+
+    assert CoreDataIOT.leontief_solver("updated").rank == 1
+    assert not hasattr(CoreDataIOT.leontief_solver("factorized"), "rank")
+
+    for matrix in ["X", "f", "p"]:
+        CoreDataIOT.calc_all([matrix], scenario="updated")
+        CoreDataIOT.calc_all([matrix], scenario="factorized")
+        pdt.assert_frame_equal(
+            CoreDataIOT.matrices["updated"][matrix],
+            CoreDataIOT.matrices["factorized"][matrix],
+        )
+
+
+def test_calc_f_dis(CoreDataIOT,tmp_path):
+
+    w = CoreDataIOT.w
+    e = CoreDataIOT.e
+
+    blocks = {}
+    for account, block in CoreDataIOT.calc_f_dis(memory=2e-4):
+        blocks.setdefault(account, []).append(block)
+
+    assert [*blocks] == e.index.tolist()
+    for account in e.index:
+        pdt.assert_frame_equal(
+            pd.concat(blocks[account], axis=1),
+            (w.T * e.loc[account]).T,
+        )
+
+    files = CoreDataIOT.calc_f_dis(items=["CO2"], path=f"{tmp_path}/f_dis")
+    f_dis = np.memmap(files["CO2"], dtype="float64", shape=w.shape)
+    assert abs(f_dis - (w.T * e.loc["CO2"]).T.values).max() < 1e-6
+
+    for account, block in CoreDataIOT.calc_f_dis(top=3):
+        assert ((block.sparse.to_dense() != 0).sum() <= 3).all()
+
+    with pytest.raises(WrongInput):
+        CoreDataIOT.calc_f_dis(items=["dummy"])
+
+    for pruning in [{"top": 0}, {"top": -1}, {"threshold": 1.5}, {"threshold": -0.1}]:
+        with pytest.raises(WrongInput):
+            CoreDataIOT.calc_f_dis(**pruning)
+
+
+def test_calc_F_by_demand(CoreDataIOT):
+
+    F = CoreDataIOT.F
+    flows = CoreDataIOT.calc_F_by_demand()
+
+    pdt.assert_index_equal(flows.columns, CoreDataIOT.Y.columns)
+    assert np.allclose(flows.sum(1).values, F.sum(1).values)
+
+    flows = CoreDataIOT.calc_F_by_demand(origin=["Region", "Level", "Item"], by="Region")
+    assert flows.index.names == ["Satellite account", "Region", "Level", "Item"]
+    assert set(flows.columns) == set(CoreDataIOT.get_index("Region"))
+    assert np.allclose(
+        flows.sum(1).unstack([1, 2, 3]).loc[F.index, F.columns].values, F.values
+    )
+
+    flows = CoreDataIOT.calc_F_by_demand(matrix="m", origin="Region")
+    assert flows.index.names == ["Factor of production", "Region"]
+
+    with pytest.raises(WrongInput):
+        CoreDataIOT.calc_F_by_demand(origin="dummy")
+
+    with pytest.raises(WrongInput):
+        CoreDataIOT.calc_F_by_demand(by="Item")
+
+
+def test_calc_F_trade(CoreDataIOT):
+
+    flows = CoreDataIOT.calc_F_trade()
+    assert flows.index.names == ["Satellite account", "Region"]
+    assert set(flows.columns) == set(CoreDataIOT.get_index("Region"))
+
+    # production-based accounts on the rows, footprints on the columns
+    E = CoreDataIOT.E.T.groupby(level=0, sort=False).sum().T
+    assert np.allclose(flows.sum(1).unstack().loc[E.index, E.columns].values, E.values)
+
+    footprints = CoreDataIOT.calc_F_by_demand(by="Region")
+    assert np.allclose(
+        flows.groupby(level=0, sort=False).sum().loc[footprints.index, footprints.columns].values,
+        footprints.values,
+    )
+
+    sectors = CoreDataIOT.calc_F_trade(["CO2"], by="Sector")
+    assert sectors.index.names == ["Satellite account", "Region", "Sector"]
+    assert np.allclose(
+        sectors.groupby(level=[0, 1], sort=False).sum().values, flows.loc[["CO2"]].values
+    )
+
+    with pytest.raises(WrongInput):
+        CoreDataIOT.calc_F_trade(["dummy"])
+
+    with pytest.raises(WrongInput):
+        CoreDataIOT.calc_F_trade(by="Activity")
+
+
+def test_calc_tiers(CoreDataIOT):
+
+    tiers = CoreDataIOT.calc_tiers(tol=1e-10, max_tiers=500)
+    pdt.assert_index_equal(tiers.index, CoreDataIOT.X.index)
+    assert np.allclose(tiers.sum(1).values, CoreDataIOT.X.iloc[:, 0].values)
+
+    tiers = CoreDataIOT.calc_tiers("E", tol=1e-10, max_tiers=500)
+    assert np.allclose(tiers.sum(1).values, CoreDataIOT.E.sum(1).values)
+
+    with pytest.raises(WrongInput):
+        CoreDataIOT.calc_tiers("Z")
+
+    assert CoreDataIOT.is_productive("B")
+
+    CoreDataIOT.update_scenarios("baseline", z=CoreDataIOT.z * 3)
+    assert not CoreDataIOT.is_productive("B")
+
+
+def test_calc_multipliers(CoreDataIOT):
+
+    CoreDataIOT.calc_all(["z", "V", "X", "v"])
+    # households spending less than their wages
+    CoreDataIOT.update_scenarios("baseline", Y=CoreDataIOT.Y * 0.4)
+
+    multipliers = CoreDataIOT.calc_multipliers("Final Demand", "Wages")
+    w = CoreDataIOT.w
+    assert np.allclose(multipliers.loc["Type I"].values, w.sum(0).values)
+    assert (multipliers.loc["Type II"].values > multipliers.loc["Type I"].values).all()
+
+    # the same as the inverse of the closed coefficients matrix
+    C, R = calc_households(
+        CoreDataIOT.Y, CoreDataIOT.V, CoreDataIOT.X, ["Final Demand"], ["Wages"]
+    )
+    closed = np.block([[CoreDataIOT.z.values, C.values], [R.values, np.zeros((2, 2))]])
+    closed = np.linalg.inv(np.eye(closed.shape[0]) - closed)[: len(w), : len(w)]
+
+    multipliers = CoreDataIOT.calc_multipliers("Final Demand", ["Wages"], matrix="V")
+    assert np.allclose(multipliers.loc["Type II"].values, CoreDataIOT.v.values @ closed)
+
+    with pytest.raises(WrongInput):
+        CoreDataIOT.calc_multipliers("dummy", "Wages")
+
+    with pytest.raises(WrongInput):
+        CoreDataIOT.calc_multipliers("Final Demand", "Wages", matrix="Z")
+
+
+def test_calc_mixed_model(CoreDataIOT):
+
+    sector = CoreDataIOT.get_index("Sector")[0]
+    CoreDataIOT.calc_mixed_model(
+        sector, "Italy", Y=CoreDataIOT.Y * 1.1, scenario="mixed"
+    )
+
+    assert "mixed" in CoreDataIOT.scenarios
+    mixed = CoreDataIOT.matrices["mixed"]
+    fixed = ("Italy", "Sector", sector)
+    assert mixed["X"].loc[fixed].iloc[0] == pytest.approx(CoreDataIOT.X.loc[fixed].iloc[0])
+
+    # the implied final demand gives back the production of the scenario
+    pdt.assert_frame_equal(
+        mixed["X"],
+        calc_X_from_z(mixed["z"], mixed["Y"]),
+        check_names=False,
+    )
+
+    with pytest.raises(WrongInput):
+        CoreDataIOT.calc_mixed_model(sector, scenario="mixed")
+
+    with pytest.raises(WrongInput):
+        CoreDataIOT.calc_mixed_model("dummy")
+
+
+def test_calc_dynamic(CoreDataIOT):
+
+    B = CoreDataIOT.z * 0.1
+    Y = {year: CoreDataIOT.Y * 1.02 ** (year - 2020) for year in [2021, 2022]}
+
+    X = CoreDataIOT.calc_dynamic(B, Y)
+    assert CoreDataIOT.scenarios == ["baseline", "dynamic 2021", "dynamic 2022"]
+
+    # only X and Y are stored and the coefficients are shared
+    assert CoreDataIOT.matrices["dynamic 2022"]["z"] is CoreDataIOT.matrices["baseline"]["z"]
+    assert "E" not in CoreDataIOT.matrices["dynamic 2022"]
+
+    # the investments are in the final demand of the scenarios
+    CoreDataIOT.calc_all(["Z", "E"], scenario="dynamic 2022")
+    matrices = CoreDataIOT.matrices["dynamic 2022"]
+    assert np.allclose(
+        calc_X(matrices["Z"], matrices["Y"]).values, X[[2022]].values
+    )
+
+    with pytest.raises(WrongInput):
+        CoreDataIOT.calc_dynamic(B, Y)
+
+
+def test_calc_p_batch(CoreDataIOT):
+
+    prices = pd.DataFrame({price: {"CO2": price} for price in [0, 1e-6, 2e-6]})
+    p = CoreDataIOT.calc_p_batch(prices)
+
+    assert list(p.columns) == [0, 1e-6, 2e-6]
+    assert np.allclose(p[0].values, CoreDataIOT.p.values[:, 0])
+
+    # price index linear in the carbon price
+    assert np.allclose(p[2e-6] - p[1e-6], p[1e-6] - p[0])
+    assert np.allclose(
+        p[1e-6].values - p[0].values,
+        1e-6 * CoreDataIOT.f.loc["CO2"].values,
+    )
+
+    wages = CoreDataIOT.calc_p_batch(pd.Series({"Wages": 0.1}), matrix="v")
+    assert (wages.iloc[:, 0] > p[0]).all()
+
+    with pytest.raises(WrongInput):
+        CoreDataIOT.calc_p_batch(pd.Series({"Wages": 0.1}))
+
+
+def test_calc_spa(CoreDataIOT):
+
+    paths = CoreDataIOT.calc_spa("CO2", "Italy", "Construction", max_paths=10)
+
+    assert len(paths) == 10
+    assert paths.iloc[0]["Depth"] == 0
+    assert paths["Share"].sum() <= 1
+    assert (paths["Share"].values * CoreDataIOT.f.loc["CO2", ("Italy", "Sector", "Construction")]
+            == pytest.approx(paths["Value"].values))
+
+    with pytest.raises(WrongInput):
+        CoreDataIOT.calc_spa("Wages", "Italy", "Construction")
+
+    with pytest.raises(WrongInput):
+        CoreDataIOT.calc_spa("CO2", "Italy", "dummy")
+
+
+def test_calc_extraction(CoreDataIOT):
+
+    loss = CoreDataIOT.calc_extraction()
+    pdt.assert_index_equal(loss.index, CoreDataIOT.z.index)
+    assert (loss["Output loss"] > 0).all()
+
+    regions = CoreDataIOT.calc_extraction("Region")
+    assert set(regions.index) == set(CoreDataIOT.get_index("Region"))
+
+    sectors = CoreDataIOT.calc_extraction("Sector")
+    # extracting a sector in all the regions costs more than in any of them
+    assert (
+        sectors["Output loss"]
+        >= loss["Output loss"].groupby(level="Item").max().loc[sectors.index]
+    ).all()
+
+    with pytest.raises(WrongInput):
+        CoreDataIOT.calc_extraction("Item")
+
+
+def test_calc_gvc(CoreDataIOT,CoreDataSUT):
+
+    gvc = CoreDataIOT.calc_gvc()
+    assert list(gvc.index.names) == [*CoreDataIOT.z.index.names, "Importer"]
+    assert (gvc.index.get_level_values("Region") != gvc.index.get_level_values("Importer")).all()
+    assert np.allclose(
+        gvc[["DVA", "DDC", "FVA"]].sum(1), gvc["Gross exports"], rtol=1e-6
+    )
+
+    CoreDataIOT.set_leontief_solver("region")
+    pdt.assert_frame_equal(gvc, CoreDataIOT.calc_gvc())
+
+    # X is calculated when missing
+    del CoreDataIOT.matrices["baseline"]["X"]
+    pdt.assert_frame_equal(gvc, CoreDataIOT.calc_gvc(), check_exact=False)
+
+    with pytest.raises(NotImplementable):
+        CoreDataSUT.calc_gvc()
+
+    with pytest.raises(WrongInput):
+        CoreDataIOT.calc_gvc("dummy")
+
+
+def test_calc_sda(CoreDataIOT):
+
+    other = load_test("IOT")
+    other.update_scenarios("baseline", Y=other.Y * 1.1, e=other.e * 0.9)
+
+    effects = CoreDataIOT.calc_sda("baseline", database=other, matrix="E")
+    pdt.assert_index_equal(effects.index, CoreDataIOT.e.index)
+    assert np.allclose(effects["Technology"], 0)
+    assert (effects["Intensity"] < 0).all() and (effects["Level"] > 0).all()
+
+    other.calc_all(["X", "E"], force_rewrite=True)
+    assert np.allclose(
+        effects.sum(1).values, (other.E.sum(1) - CoreDataIOT.E.sum(1)).values
+    )
+
+    # scenarios of the same database
+    CoreDataIOT.clone_scenario("baseline", "clone")
+    effects = CoreDataIOT.calc_sda("clone", matrix="X", method="polar")
+    assert np.allclose(effects.values, 0)
+
+    with pytest.raises(WrongInput):
+        CoreDataIOT.calc_sda("clone", matrix="Z")
@@ -3,6 +3,7 @@ import os
 import pytest
 import pandas.testing as pdt
 import pandas as pd
+import numpy as np
 
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
 
@@ -11,7 +12,7 @@ MAIN_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 from mario.core.CoreIO import CoreModel
 from mario.test.mario_test import load_test
 from mario.log_exc.exceptions import DataMissing, LackOfInput, WrongInput, NotImplementable
-from mario import calc_Z
+from mario import calc_Z, parse_from_excel
 
 @pytest.fixture()
 def CoreDataIOT():
@@ -390,7 +391,7 @@ def test_cvxpy_exist():
     except ModuleNotFoundError:
         _cvxpy_here = False
 
-    from mario.core.CoreIO import __cvxpy__
+    from mario.core.AttrData import __cvxpy__
 
     assert __cvxpy__ == _cvxpy_here
 
@@ -578,4 +579,161 @@ def test_GDP(CoreDataIOT,CoreDataSUT):
 
     pdt.assert_frame_equal(
         GDP,CoreDataSUT.GDP(total=False)
-    )
\ No newline at end of file
+    )
+
+def test_leontief_solver(CoreDataIOT):
+
+    solver = CoreDataIOT.leontief_solver('baseline')
+    assert CoreDataIOT.leontief_solver('baseline') is solver
+
+    CoreDataIOT.calc_all(['f','p'])
+    assert 'w' not in CoreDataIOT['baseline']
+
+    CoreDataIOT.update_scenarios('baseline',z=CoreDataIOT.z.copy())
+    assert CoreDataIOT.leontief_solver('baseline') is not solver
+
+    # changes in place keep the same z object
+    f = CoreDataIOT.f.copy()
+    CoreDataIOT.matrices['baseline']['z'].iloc[0,0] += 0.1
+    CoreDataIOT.calc_all(['f'],force_rewrite=True)
+    assert not np.allclose(CoreDataIOT.f.values,f.values)
+    z = CoreDataIOT.z.values
+    assert np.allclose(
+        CoreDataIOT.f.values,CoreDataIOT.e.values@np.linalg.inv(np.eye(len(z))-z)
+    )
+
+    with pytest.raises(WrongInput):
+        CoreDataIOT.leontief_solver('dummy')
+
+
+def test_set_leontief_solver(CoreDataIOT):
+
+    X = CoreDataIOT.X.copy()
+    solver = CoreDataIOT.leontief_solver('baseline')
+
+    CoreDataIOT.set_leontief_solver('mixed',tol=1e-13)
+    mixed = CoreDataIOT.leontief_solver('baseline')
+    assert mixed is not solver
+    assert mixed.tol == 1e-13
+
+    CoreDataIOT.update_scenarios('baseline',Y=CoreDataIOT.Y.copy())
+    CoreDataIOT.calc_all(['X'],force_rewrite=True)
+    pdt.assert_frame_equal(CoreDataIOT.X,X,check_names=False)
+    assert CoreDataIOT.leontief_solver('baseline').info['converged']
+
+    with pytest.raises(WrongInput):
+        CoreDataIOT.set_leontief_solver('dummy')
+
+
+def test_blocked_extensions(CoreDataIOT):
+
+    f = CoreDataIOT.f.copy()
+    m = CoreDataIOT.m.copy()
+
+    CoreDataIOT.set_out_of_core(memory=1e-5)
+    CoreDataIOT.calc_all(['f','m'],force_rewrite=True)
+
+    pdt.assert_frame_equal(CoreDataIOT.f,f)
+    pdt.assert_frame_equal(CoreDataIOT.m,m)
+    assert 'w' not in CoreDataIOT['baseline']
+
+
+def test_sparse_storage(CoreDataIOT):
+
+    sparse = parse_from_excel(
+        path = f"{MAIN_PATH}/mario/test/IOT.xlsx",
+        table = "IOT",
+        storage = "sparse",
+    )
+
+    assert sparse.storage == "sparse"
+    assert CoreDataIOT.storage == "dense"
+
+    for matrix in ["z","e","v","Z","E","V"]:
+        assert isinstance(getattr(sparse,matrix).dtypes.iloc[0], pd.SparseDtype)
+
+    for matrix in ["X","z","f","p","Z"]:
+        pdt.assert_frame_equal(
+            getattr(CoreDataIOT,matrix),
+            getattr(sparse,matrix).sparse.to_dense() if matrix in ["z","Z"] else getattr(sparse,matrix),
+            check_names=False,
+        )
+
+    with pytest.raises(WrongInput):
+        parse_from_excel(
+            path = f"{MAIN_PATH}/mario/test/IOT.xlsx",
+            table = "IOT",
+            storage = "compressed",
+        )
+
+
+def test_sparse_copy():
+
+    sparse = parse_from_excel(
+        path = f"{MAIN_PATH}/mario/test/IOT.xlsx",
+        table = "IOT",
+        storage = "sparse",
+    )
+    sparse.calc_all(["X","f","m","p"])
+    assert sparse._solvers
+
+    new = sparse.copy()
+    assert not new._solvers
+    assert sparse._solvers
+
+    new.calc_all(["X","f"],force_rewrite=True)
+    pdt.assert_frame_equal(new.f,sparse.f)
+    pdt.assert_frame_equal(new.X,sparse.X,check_names=False)
+
+    aggregated = sparse.to_single_region("Italy",inplace=False)
+    assert aggregated.storage == "sparse"
+
+
+def test_precision(CoreDataIOT):
+
+    single = parse_from_excel(
+        path = f"{MAIN_PATH}/mario/test/IOT.xlsx",
+        table = "IOT",
+        precision = "float32",
+    )
+
+    assert single.precision == "float32"
+    assert CoreDataIOT.precision == "float64"
+
+    for matrix in ["Z","Y","X","z","e","v","f","p","w","F"]:
+        assert (getattr(single,matrix).dtypes == "float32").all()
+        pdt.assert_frame_equal(
+            getattr(CoreDataIOT,matrix),
+            getattr(single,matrix),
+            check_dtype=False,
+            rtol=1e-4,
+        )
+
+    with pytest.raises(WrongInput):
+        parse_from_excel(
+            path = f"{MAIN_PATH}/mario/test/IOT.xlsx",
+            table = "IOT",
+            precision = "float16",
+        )
+
+
+@pytest.mark.parametrize("storage",["dense","sparse"])
+def test_is_productive(CoreDataSUT,storage):
+
+    if storage == "sparse":
+        CoreDataSUT = parse_from_excel(
+            path = f"{MAIN_PATH}/mario/test/SUT.xlsx",
+            table = "SUT",
+            storage = "sparse",
+        )
+
+    for method in ["A","B","C","a"]:
+        assert CoreDataSUT.is_productive(method)
+
+    CoreDataSUT.update_scenarios("baseline",z=CoreDataSUT.z*3)
+
+    for method in ["A","B","C"]:
+        assert not CoreDataSUT.is_productive(method)
+
+    with pytest.raises(WrongInput):
+        CoreDataSUT.is_productive("D")
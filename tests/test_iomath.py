@@ -6,6 +6,7 @@ import pandas.testing as pdt
 import numpy.testing as npt
 import os
 import sys
+import itertools
 
 import pandas as pd
 import numpy as np
@@ -33,9 +34,37 @@ from mario.tools.iomath import (
     calc_M,
     calc_y,
     calc_p,
+    calc_p_batch,
     X_inverse,
     calc_all_shock,
+    calc_f_dis,
+    calc_f_region,
+    calc_X_region,
+    calc_X_mixed,
+    calc_X_dynamic,
+    calc_tiers,
+    calc_spa,
+    calc_extraction,
+    calc_sda,
+    calc_gvc,
+    _hat_left,
+    _hat_right,
 )
+from mario.tools.solvers import (
+    LeontiefSolver,
+    MixedPrecisionSolver,
+    IterativeSolver,
+    RegionBlockSolver,
+    WoodburySolver,
+    BorderedSolver,
+    low_rank_update,
+    spectral_radius,
+    condition_number,
+    productivity_slacks,
+)
+from mario.tools.utilities import to_sparse
+from scipy.sparse.linalg import ArpackNoConvergence
+from mario.log_exc.exceptions import WrongInput
 
 
 @pytest.fixture()
@@ -143,6 +172,27 @@ def test_calc_g(IOT_table):
         IOT_table['g'],calc_g(IOT_table['b'])
     )
 
+    # derived from the Leontief inverse
+    pdt.assert_frame_equal(
+        IOT_table['g'],calc_g(X=IOT_table['X'],w=IOT_table['w'])
+    )
+    pdt.assert_frame_equal(
+        IOT_table['g'],calc_g(X=IOT_table['X'],solver=LeontiefSolver(IOT_table['z']))
+    )
+
+    # a sector with null production
+    X = IOT_table['X'].copy()
+    X.iloc[1] = 0
+    z = IOT_table['z'].copy()
+    z.iloc[:,1] = 0
+    Z = calc_Z(z,X)
+    pdt.assert_frame_equal(
+        calc_g(calc_b(X,Z)),calc_g(X=X,w=calc_w(z))
+    )
+
+    with pytest.raises(WrongInput):
+        calc_g(X=IOT_table['X'])
+
 def test_calc_f(IOT_table):
     pdt.assert_frame_equal(
         IOT_table['f'],calc_f(IOT_table['e'],IOT_table['w'])
@@ -162,3 +212,469 @@ def test_calcM(IOT_table):
     pdt.assert_frame_equal(
         IOT_table['M'],calc_M(IOT_table['m'],IOT_table['Y'])
     )
+
+
+def test_leontief_solver(IOT_table):
+    solver = LeontiefSolver(IOT_table['z'])
+
+    npt.assert_allclose(IOT_table['w'].values, solver.inverse())
+    npt.assert_allclose(
+        IOT_table['X'].values[:,0], solver.solve(IOT_table['Y'].sum(1))
+    )
+
+    pdt.assert_frame_equal(
+        IOT_table['w'],calc_w(IOT_table['z'],solver=solver)
+    )
+    pdt.assert_frame_equal(
+        IOT_table['f'],calc_f(IOT_table['e'],solver=solver)
+    )
+    pdt.assert_frame_equal(
+        IOT_table['m'],calc_m(IOT_table['v'],solver=solver)
+    )
+    pdt.assert_frame_equal(
+        IOT_table['p'],calc_p(IOT_table['v'],solver=solver)
+    )
+
+
+def test_hat_kernels(IOT_table):
+    z = IOT_table['z']
+    x = IOT_table['X']
+
+    npt.assert_allclose(
+        _hat_right(z,x).values, z.values @ np.diagflat(x.values)
+    )
+    npt.assert_allclose(
+        _hat_left(x,z).values, np.diagflat(x.values) @ z.values
+    )
+
+    values = z.values.copy()
+    out = _hat_right(values,x,inplace=True)
+    assert out is values
+    npt.assert_allclose(values, z.values @ np.diagflat(x.values))
+
+
+def test_calc_f_dis(IOT_table):
+    e = IOT_table['e'].iloc[[1]]
+    f_dis = calc_f_dis(e,IOT_table['w'])
+
+    npt.assert_allclose(f_dis.sum().values, IOT_table['f'].iloc[1].values)
+    pdt.assert_index_equal(f_dis.index, IOT_table['w'].index)
+
+    with pytest.raises(ValueError):
+        calc_f_dis(IOT_table['e'],IOT_table['w'])
+
+
+def test_precision_chain(IOT_table):
+    single = {k:v.astype('float32') for k,v in IOT_table.items()}
+    solver = LeontiefSolver(single['z'])
+
+    outputs = [
+        calc_X(single['Z'],single['Y']),
+        calc_Z(single['z'],single['X']),
+        calc_z(single['Z'],single['X']),
+        calc_b(single['X'],single['Z']),
+        calc_w(single['z'],solver=solver),
+        calc_X_from_z(single['z'],single['Y'],solver=solver),
+        calc_f(single['e'],solver=solver),
+        calc_p(single['v'],solver=solver),
+        calc_F(single['f'],single['Y']),
+    ]
+
+    for output in outputs:
+        assert (output.dtypes == 'float32').all()
+
+
+def test_mixed_precision_solver(IOT_table):
+    solver = MixedPrecisionSolver(IOT_table['z'],tol=1e-13)
+
+    pdt.assert_frame_equal(
+        IOT_table['X'],calc_X_from_z(IOT_table['z'],IOT_table['Y'],solver=solver)
+    )
+    assert solver.info['converged']
+    assert solver.info['residuals'][-1] <= 1e-13
+    assert solver.info['residuals'][-1] < solver.info['residuals'][0]
+
+    pdt.assert_frame_equal(
+        IOT_table['f'],calc_f(IOT_table['e'],solver=solver)
+    )
+    pdt.assert_frame_equal(
+        IOT_table['w'],calc_w(IOT_table['z'],solver=solver)
+    )
+
+    solver = MixedPrecisionSolver(IOT_table['z'],tol=0,max_iter=2)
+    solver.solve(IOT_table['Y'])
+    assert not solver.info['converged']
+    assert solver.info['iterations'] == 2
+
+
+@pytest.mark.parametrize(
+    "algorithm,preconditioner",
+    [("gmres","jacobi"),("gmres","ilu"),("bicgstab",None),("neumann",None)]
+)
+def test_iterative_solver(IOT_table,algorithm,preconditioner):
+    solver = IterativeSolver(
+        IOT_table['z'],algorithm=algorithm,preconditioner=preconditioner,tol=1e-12
+    )
+
+    npt.assert_allclose(
+        calc_X_from_z(IOT_table['z'],IOT_table['Y'],solver=solver).values,
+        IOT_table['X'].values,
+        rtol=1e-9,
+    )
+    assert solver.info['converged']
+    assert max(solver.info['residuals']) <= 1e-12
+
+    npt.assert_allclose(
+        calc_f(IOT_table['e'],solver=solver).values,
+        IOT_table['f'].values,
+        rtol=1e-9,
+        atol=1e-12,
+    )
+    npt.assert_allclose(
+        calc_p(IOT_table['v'],solver=solver).values,
+        IOT_table['p'].values,
+        rtol=1e-9,
+    )
+
+    with pytest.raises(WrongInput):
+        IterativeSolver(IOT_table['z'],algorithm='dummy')
+
+    with pytest.raises(WrongInput):
+        IterativeSolver(IOT_table['z'],algorithm=algorithm,max_iter=0)
+
+
+def test_calc_w_out_of_core(IOT_table,tmp_path):
+    path = f"{tmp_path}/w.dat"
+    w = calc_w(IOT_table['z'],path=path,memory=0.0005)
+
+    pdt.assert_frame_equal(IOT_table['w'],w)
+    npt.assert_allclose(
+        np.memmap(path,dtype='float64',shape=w.shape), IOT_table['w'].values
+    )
+
+
+def test_region_block_solver(IOT_table):
+    solver = RegionBlockSolver(IOT_table['z'])
+
+    pdt.assert_frame_equal(
+        IOT_table['X'],calc_X_from_z(IOT_table['z'],IOT_table['Y'],solver=solver)
+    )
+    assert solver.info['converged']
+
+    pdt.assert_frame_equal(
+        IOT_table['f'],calc_f(IOT_table['e'],solver=solver)
+    )
+
+    for region in solver.regions:
+        pdt.assert_frame_equal(
+            IOT_table['X'].loc[region:region],
+            calc_X_region(IOT_table['z'],IOT_table['Y'],region,solver=solver),
+        )
+        pdt.assert_frame_equal(
+            IOT_table['f'].loc[:,region:region],
+            calc_f_region(IOT_table['e'],region,solver),
+        )
+
+        rows = IOT_table['z'].index.get_level_values(0) == region
+        npt.assert_allclose(
+            solver.solve_local(region,IOT_table['Y'].values[rows]),
+            np.linalg.solve(
+                np.eye(rows.sum())-IOT_table['z'].values[rows][:,rows],IOT_table['Y'].values[rows]
+            ),
+        )
+
+    with pytest.raises(WrongInput):
+        solver.solve_region('dummy',IOT_table['Y'])
+
+    with pytest.raises(WrongInput):
+        solver.solve_local('dummy',IOT_table['Y'])
+
+    with pytest.raises(WrongInput):
+        RegionBlockSolver(IOT_table['z'],max_iter=0)
+
+
+def test_low_rank_update(IOT_table):
+    z = IOT_table['z']
+    solver = LeontiefSolver(z)
+
+    assert low_rank_update(solver,z,z.copy()) is solver
+
+    z_new = z.copy()
+    z_new.iloc[:,[1,3]] *= 1.2
+    updated = low_rank_update(solver,z,z_new)
+
+    assert isinstance(updated,WoodburySolver)
+    assert updated.rank == 2
+    assert low_rank_update(solver,z,z_new,max_rank=1) is None
+
+    for trans in [False,True]:
+        npt.assert_allclose(
+            updated.solve(IOT_table['Y'].values,trans=trans),
+            LeontiefSolver(z_new).solve(IOT_table['Y'].values,trans=trans),
+            rtol=1e-10,
+        )
+
+    z_new = z.copy()
+    z_new.iloc[2] *= 0.5
+    assert low_rank_update(solver,z,z_new).rank == 1
+
+
+def test_calc_f_blocks(IOT_table):
+    solver = LeontiefSolver(IOT_table['z'])
+
+    for e in [IOT_table['e'],to_sparse(IOT_table['e'])]:
+        pdt.assert_frame_equal(
+            IOT_table['f'],calc_f(e,solver=solver,memory=1e-5)
+        )
+
+    pdt.assert_frame_equal(
+        IOT_table['m'],calc_m(IOT_table['v'],solver=solver,memory=1e-5)
+    )
+
+
+def test_calc_tiers(IOT_table):
+    tiers = calc_tiers(IOT_table['z'],IOT_table['Y'],tol=1e-12,max_tiers=500)
+
+    assert tiers.columns[-1] == "remainder"
+    pdt.assert_series_equal(tiers[0],IOT_table['Y'].sum(1),check_names=False)
+    npt.assert_allclose(tiers.sum(1).values,IOT_table['X'].iloc[:,0].values)
+
+    # stopped early, the remainder extrapolates the missing tiers
+    tiers = calc_tiers(to_sparse(IOT_table['z']),IOT_table['Y'],max_tiers=3)
+    assert list(tiers.columns) == [0,1,2,3,"remainder"]
+    npt.assert_allclose(tiers.sum(1).values,IOT_table['X'].iloc[:,0].values,rtol=1e-2)
+
+    tiers = calc_tiers(IOT_table['z']*10,IOT_table['Y'],max_tiers=20)
+    assert tiers["remainder"].isnull().all()
+
+
+def test_bordered_solver(IOT_table):
+    z = IOT_table['z']
+    households = pd.Index(["Households"])
+    C = pd.DataFrame(0.1,index=z.index,columns=households)
+    R = pd.DataFrame(0.2,index=households,columns=z.columns)
+
+    closed = np.block([[z.values,C.values],[R.values,np.zeros((1,1))]])
+    closed = np.eye(closed.shape[0]) - closed
+
+    solver = BorderedSolver(LeontiefSolver(z),C,R)
+    B = np.arange(2*closed.shape[0]).reshape(-1,2)
+
+    assert solver.shape == closed.shape
+    npt.assert_allclose(solver.solve(B),np.linalg.solve(closed,B))
+    npt.assert_allclose(solver.solve(B,trans=True),np.linalg.solve(closed.T,B))
+
+    with pytest.raises(WrongInput):
+        BorderedSolver(LeontiefSolver(z),C.T,R)
+
+
+def test_calc_X_mixed(IOT_table):
+    z = IOT_table['z']
+    fixed = z.index[[0,2]]
+
+    # fixing the output to its value does not change the system
+    X,Y = calc_X_mixed(z,IOT_table['Y'],IOT_table['X'].loc[fixed])
+    npt.assert_allclose(X.values,IOT_table['X'].values)
+    npt.assert_allclose(Y.values,IOT_table['Y'].values,atol=1e-8)
+
+    for values in [z,to_sparse(z)]:
+        X,Y = calc_X_mixed(values,IOT_table['Y']*2,IOT_table['X'].loc[fixed])
+
+        npt.assert_allclose(X.loc[fixed].values,IOT_table['X'].loc[fixed].values)
+        npt.assert_allclose(calc_X_from_z(z,Y).values,X.values)
+
+    with pytest.raises(WrongInput):
+        calc_X_mixed(z,IOT_table['Y'],pd.Series(1,index=["dummy"]))
+
+
+def test_calc_X_dynamic(IOT_table):
+    z = IOT_table['z']
+    B = z*0.1
+    Y = {year:IOT_table['Y']*1.05**step for step,year in enumerate([2021,2022,2023],1)}
+
+    X,investment = calc_X_dynamic(z,B,Y,IOT_table['X'])
+    assert list(X.columns) == [2021,2022,2023]
+
+    previous = IOT_table['X'].values[:,0]
+    for year,demand in Y.items():
+        npt.assert_allclose(
+            X[year].values,
+            z.values@X[year].values + investment[year].values + demand.sum(1).values,
+        )
+        npt.assert_allclose(investment[year].values,B.values@(X[year].values-previous))
+        previous = X[year].values
+
+    # a constant demand keeps the economy stationary
+    X,investment = calc_X_dynamic(z,B,pd.DataFrame({1:IOT_table['Y'].sum(1)}),IOT_table['X'])
+    npt.assert_allclose(X[1].values,IOT_table['X'].values[:,0])
+
+    with pytest.raises(WrongInput):
+        calc_X_dynamic(z,B.iloc[1:],Y,IOT_table['X'])
+
+
+def test_calc_p_batch(IOT_table):
+    shocks = pd.DataFrame(0.0,index=IOT_table['v'].columns,columns=["none","tax"])
+    shocks["tax"] = 0.1
+
+    for options in [dict(w=IOT_table['w']),dict(solver=LeontiefSolver(IOT_table['z']))]:
+        prices = calc_p_batch(IOT_table['v'],shocks,**options)
+
+        npt.assert_allclose(prices["none"].values,IOT_table['p'].values[:,0])
+        npt.assert_allclose(
+            prices["tax"].values,
+            (IOT_table['v'].sum().values + 0.1) @ IOT_table['w'].values,
+        )
+
+    with pytest.raises(WrongInput):
+        calc_p_batch(IOT_table['v'],shocks.iloc[1:],w=IOT_table['w'])
+
+
+def test_productivity_estimators(IOT_table,monkeypatch):
+    z = IOT_table['z']
+    rho = max(abs(np.linalg.eigvals(z.values)))
+
+    for values in [z,to_sparse(z)]:
+        npt.assert_allclose(spectral_radius(values),rho)
+        npt.assert_allclose(
+            condition_number(LeontiefSolver(values),values),
+            np.linalg.cond(np.eye(len(z))-z.values,1),
+        )
+        npt.assert_allclose(productivity_slacks(values),0,atol=1e-9)
+
+    assert (productivity_slacks(z*10) > 0).any()
+
+    # power iteration if ARPACK does not converge
+    def no_convergence(*args,**kwargs):
+        raise ArpackNoConvergence("",None,None)
+
+    monkeypatch.setattr("mario.tools.solvers.eigs",no_convergence)
+    npt.assert_allclose(spectral_radius(z),rho,rtol=1e-6)
+
+
+def test_calc_spa(IOT_table):
+    z = IOT_table['z']
+    e = IOT_table['e'].iloc[0]
+    sector = z.columns[1]
+
+    # without pruning, the paths sum up to the power series of the footprint
+    paths = calc_spa(z,e,sector,threshold=0,depth=5,max_paths=10**6)
+    series = sum(e.values@np.linalg.matrix_power(z.values,k) for k in range(6))
+
+    npt.assert_allclose(paths["Value"].sum(),series[1])
+    assert paths["Value"].is_monotonic_decreasing
+    assert paths["Depth"].max() == 5
+    assert (paths["Stage 0"] == sector).all()
+
+    # the pruned search finds the same most important paths
+    best = calc_spa(to_sparse(z),e,sector,demand=2,threshold=1e-2,max_paths=5)
+    npt.assert_allclose(best["Value"].values,2*paths["Value"].values[:5])
+    npt.assert_allclose(best["Share"].values,paths["Value"].values[:5]/IOT_table['f'].iloc[0,1])
+
+    with pytest.raises(WrongInput):
+        calc_spa(z,e,("dummy",))
+
+
+def test_calc_extraction(IOT_table):
+    z = IOT_table['z']
+    y = IOT_table['Y'].sum(1).values
+    groups = {label:[label] for label in z.index}
+    groups["reg1"] = z.index[:2]
+
+    loss = calc_extraction(z,IOT_table['Y'],groups)
+    # columns of w of a few groups at once
+    pdt.assert_frame_equal(
+        loss,calc_extraction(to_sparse(z),IOT_table['Y'],groups,memory=1e-4)
+    )
+
+    for name,labels in groups.items():
+        kept = ~z.index.isin(labels)
+        extracted = np.linalg.solve(np.eye(kept.sum())-z.values[kept][:,kept],y[kept])
+
+        npt.assert_allclose(
+            loss.loc[[name],"Output loss"].values,IOT_table['X'].values.sum()-extracted.sum()
+        )
+
+    with pytest.raises(WrongInput):
+        calc_extraction(z,IOT_table['Y'],{"dummy":["dummy"]})
+
+
+@pytest.mark.parametrize("method",["shapley","polar"])
+def test_calc_sda(IOT_table,method):
+    z,Y,e = IOT_table['z'],IOT_table['Y'],IOT_table['e']
+    z_new,Y_new,e_new = z*1.2,Y*np.linspace(1.5,0.8,Y.shape[1]),e*0.9
+
+    def footprint(e,z,Y):
+        return e.values@np.linalg.solve(np.eye(len(z))-z.values,Y.values.sum(1))
+
+    effects = calc_sda(z,Y,z_new,Y_new,e,e_new,method=method)
+    assert list(effects.columns) == ["Intensity","Technology","Product mix","Demand mix","Level"]
+    npt.assert_allclose(
+        effects.sum(1).values,footprint(e_new,z_new,Y_new)-footprint(e,z,Y)
+    )
+
+    # a change of intensity only
+    effects = calc_sda(z,Y,z,Y,e,e_new,method=method)
+    npt.assert_allclose(effects["Intensity"].values,footprint(e_new,z,Y)-footprint(e,z,Y))
+    npt.assert_allclose(effects.drop(columns="Intensity").values,0,atol=1e-12)
+
+    # average over all the orderings of the factors
+    if method == "shapley":
+        factors = [
+            [np.array([[Y.values.sum()]]),np.array([[Y_new.values.sum()]])],
+            [Y.values.sum(0)[:,None]/Y.values.sum(),Y_new.values.sum(0)[:,None]/Y_new.values.sum()],
+            [Y.values/Y.values.sum(0),Y_new.values/Y_new.values.sum(0)],
+            [np.linalg.inv(np.eye(len(z))-z.values),np.linalg.inv(np.eye(len(z))-z_new.values)],
+        ]
+
+        def production(selection):
+            x = np.ones((1,1))
+            for factor,new in zip(factors,selection):
+                x = factor[new]@x
+            return x.ravel()
+
+        expected = np.zeros((len(z),4))
+        for order in itertools.permutations(range(4)):
+            selection = [0]*4
+            for k in order:
+                before = production(selection)
+                selection[k] = 1
+                expected[:,k] += production(selection)-before
+
+        effects = calc_sda(z,Y,z_new,Y_new,method=method)
+        npt.assert_allclose(effects.values,expected[:,::-1]/24,atol=1e-9)
+
+    with pytest.raises(WrongInput):
+        calc_sda(z,Y,z_new,Y_new,method="dummy")
+
+
+def test_calc_gvc(IOT_table):
+    z,Y,X,v = IOT_table['z'],IOT_table['Y'],IOT_table['X'],IOT_table['v']
+
+    gvc = calc_gvc(z,Y,X,v)
+    assert list(gvc.columns) == ["Gross exports","DVA","DDC","FVA"]
+    assert len(gvc) == len(z)
+    # the table is balanced, so the value added adds up to the exports
+    npt.assert_allclose(gvc[["DVA","DDC","FVA"]].sum(1).values,gvc["Gross exports"].values)
+
+    # local inverses from the region blocks of the solver
+    pdt.assert_frame_equal(gvc,calc_gvc(to_sparse(z),Y,X,v,solver=RegionBlockSolver(z)))
+
+    regions = z.index.get_level_values(0)
+    L = np.linalg.inv(np.eye(len(z))-z.values)
+    g = v.values.sum(0)
+    for exporter in regions.unique():
+        s = regions == exporter
+        local = np.linalg.inv(np.eye(s.sum())-z.values[s][:,s])
+        exports = (
+            (z.values*X.values.ravel())[:,~s].sum(1)
+            + Y.values[:,Y.columns.get_level_values(0) != exporter].sum(1)
+        )[s]
+
+        rows = gvc.loc[exporter]
+        npt.assert_allclose(rows["Gross exports"].values,exports)
+        npt.assert_allclose(rows["DVA"].values,g[s]@local*exports)
+        npt.assert_allclose(rows["DDC"].values,(g[s]@L[s][:,s]-g[s]@local)*exports,atol=1e-12)
+        npt.assert_allclose(rows["FVA"].values,g[~s]@L[~s][:,s]*exports)
+
+    with pytest.raises(WrongInput):
+        calc_gvc(z.loc[['reg1'],['reg1']],Y.loc[['reg1']],X.loc[['reg1']],v[['reg1']])
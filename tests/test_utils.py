@@ -382,6 +382,18 @@ def test_all_file_reader():
         exceptions=['x'] 
         )  
 
+    # matrices cast while reading
+    output = ut.all_file_reader(
+        path = f'{MOCK_PATH}/file_reader',
+        guide = {"matrices":simple_file_no_subfolder["set2"],**simple_file_no_subfolder},
+        sep = ',',
+        dtype = "float32",
+    )
+    assert (output["matrices"]["csv"].dtypes == "float32").all()
+    pdt.assert_frame_equal(
+        output["matrices"]["csv"],output["set2"]["csv"].astype("float32")
+    )
+
     # testing zip file 
 
 